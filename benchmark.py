@@ -0,0 +1,4 @@
+import dota2patch.benchmark.handler as handler
+
+if __name__ == "__main__":
+    handler.run_benchmark()
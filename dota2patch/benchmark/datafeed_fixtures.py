@@ -0,0 +1,174 @@
+import json
+import os
+import random
+
+SYNTHETIC_PATCH_VERSIONS = (
+    '7.35', '7.35b', '7.36', '7.36a', '7.37', '7.37b', '7.38', '7.38c')
+
+
+class DatafeedFixtures:
+    # Datafeed responses stored as one file per endpoint, either recorded
+    # from the live datafeed or synthesized with the same schema. They are
+    # served by installing them into an offline ResponseCache.
+    def __init__(self, path=None):
+        self.path = path or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+    def file_path(self, name):
+        return os.path.join(self.path, f"{name}.json")
+
+    def exists(self):
+        return os.path.exists(self.file_path('patchnoteslist'))
+
+    def read(self, name):
+        with open(self.file_path(name), 'rb') as fixture:
+            return fixture.read()
+
+    def write(self, name, body):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.file_path(name), 'wb') as fixture:
+            fixture.write(body)
+
+    def patch_versions(self):
+        patch_list = json.loads(self.read('patchnoteslist'))
+        return [patch['patch_number'] for patch in patch_list['patches']]
+
+    def urls(self, patch_fetcher):
+        item_url, hero_url, ability_url = patch_fetcher.lookup_urls()
+        urls = {
+            'patchnoteslist': patch_fetcher.patch_list_url(),
+            'itemlist': item_url,
+            'herolist': hero_url,
+            'abilitylist': ability_url,
+        }
+        for patch_version in self.patch_versions():
+            urls[f"patchnotes_{patch_version}"] = \
+                patch_fetcher.patch_notes_url(patch_version)
+        return urls
+
+    def install(self, response_cache, patch_fetcher):
+        for name, url in self.urls(patch_fetcher).items():
+            response_cache.store(url, self.read(name), {})
+        return self.patch_versions()
+
+    def record(self, patch_fetcher, patch_versions):
+        # Needs the network: every body is stored exactly as served.
+        self.write('patchnoteslist', self.fetch(
+            patch_fetcher, patch_fetcher.patch_list_url()))
+        patch_list = json.loads(self.read('patchnoteslist'))
+        patch_list['patches'] = [
+            patch for patch in patch_list.get('patches', [])
+            if patch.get('patch_number') in patch_versions]
+        self.write('patchnoteslist', json.dumps(patch_list).encode('utf-8'))
+
+        for name, url in self.urls(patch_fetcher).items():
+            if name != 'patchnoteslist':
+                self.write(name, self.fetch(patch_fetcher, url))
+                print(f"Recorded {name}")
+
+    @staticmethod
+    def fetch(patch_fetcher, url):
+        body = patch_fetcher.fetch_body(url, ttl=0)
+        if body is None:
+            raise RuntimeError(f"Cannot record {url}")
+        return body
+
+    def synthesize(self, patch_versions=SYNTHETIC_PATCH_VERSIONS, seed=7,
+                   hero_count=124, item_count=180):
+        rng = random.Random(seed)
+        syllables = ['ar', 'bel', 'cor', 'dra', 'el', 'fen', 'gor', 'hal',
+                     'ith', 'jor', 'kal', 'lun', 'mor', 'nyx', 'or', 'pha',
+                     'quel', 'ras', 'sil', 'tor', 'ul', 'vex', 'wyr', 'zen']
+
+        def unique_names(count, words):
+            names = set()
+            while len(names) < count:
+                names.add(' '.join(
+                    ''.join(rng.choice(syllables) for _ in range(
+                        rng.randint(2, 3))).capitalize()
+                    for _ in range(words)))
+            return sorted(names)
+
+        heroes = [{'id': index + 1, 'name_loc': name,
+                   'name': f"npc_dota_hero_{name.lower().replace(' ', '_')}"}
+                  for index, name in enumerate(unique_names(hero_count, 1))]
+        items = [{'id': 1000 + index, 'name_loc': name,
+                  'name': f"item_{name.lower().replace(' ', '_')}"}
+                 for index, name in enumerate(unique_names(item_count, 2))]
+        abilities = []
+        hero_abilities = {}
+        for hero in heroes:
+            hero_abilities[hero['id']] = []
+            for name in unique_names(4, 2):
+                ability = {
+                    'id': 5000 + len(abilities), 'name_loc': name,
+                    'name': f"{hero['name'].removeprefix('npc_dota_hero_')}_\
+{name.lower().replace(' ', '_')}"}
+                abilities.append(ability)
+                hero_abilities[hero['id']].append(ability['id'])
+
+        def data(key, entries):
+            return json.dumps({'result': {'data': {key: entries}}}).encode(
+                'utf-8')
+
+        self.write('herolist', data('heroes', heroes))
+        self.write('itemlist', data('itemabilities', items))
+        self.write('abilitylist', data('itemabilities', abilities))
+
+        stats = ['Damage', 'Cooldown', 'Mana cost', 'Cast range', 'Duration',
+                 'Radius', 'Movement speed', 'Armor', 'Attack speed']
+
+        def notes(count):
+            generated = []
+            for _ in range(count):
+                before = rng.randint(2, 60) * 5
+                after = before + rng.choice([-3, -2, -1, 1, 2, 3]) * 5
+                note = {'note': f"{rng.choice(stats)} \
+{'increased' if after > before else 'reduced'} from {before} to {after}"}
+                if rng.random() < 0.2:
+                    note['info'] = rng.choice(
+                        ['Aghanim\'s Scepter upgrade', 'Talent', 'Level 25'])
+                generated.append(note)
+            return generated
+
+        patches = []
+        for timestamp, patch_version in enumerate(patch_versions):
+            patch_heroes = []
+            for hero in rng.sample(heroes, rng.randint(40, 100)):
+                patch_hero = {'hero_id': hero['id'], 'abilities': [
+                    {'ability_id': ability_id,
+                     'ability_notes': notes(rng.randint(1, 3))}
+                    for ability_id in rng.sample(
+                        hero_abilities[hero['id']], rng.randint(1, 3))
+                ]}
+                if rng.random() < 0.3:
+                    patch_hero['subsections'] = [{
+                        'facet': f"{hero['name']}_facet",
+                        'title': f"{hero['name_loc']} Facet",
+                        'general_notes': notes(rng.randint(1, 2)),
+                    }]
+                patch_heroes.append(patch_hero)
+
+            self.write(f"patchnotes_{patch_version}", json.dumps({
+                'patch_number': patch_version,
+                'patch_name': patch_version,
+                'patch_timestamp': 1_700_000_000 + timestamp,
+                'general_notes': [
+                    {'title': title, 'generic': notes(rng.randint(3, 10))}
+                    for title in ('General Updates', 'Map Changes',
+                                  'Neutral Creeps')],
+                'items': [{'ability_id': item['id'],
+                           'ability_notes': notes(rng.randint(1, 4))}
+                          for item in rng.sample(items, rng.randint(20, 40))],
+                'neutral_items': [
+                    {'ability_id': item['id'],
+                     'ability_notes': notes(rng.randint(1, 2))}
+                    for item in rng.sample(items, rng.randint(5, 15))],
+                'heroes': patch_heroes,
+            }).encode('utf-8'))
+            patches.append({'patch_number': patch_version,
+                            'patch_name': patch_version,
+                            'patch_timestamp': 1_700_000_000 + timestamp})
+
+        self.write('patchnoteslist', json.dumps(
+            {'patches': patches, 'success': True}).encode('utf-8'))
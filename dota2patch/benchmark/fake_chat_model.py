@@ -0,0 +1,47 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import (
+    ChatGeneration, ChatGenerationChunk, ChatResult)
+
+SELF_QUERY_PROMPT_MARKER = "<< Structured Request Schema >>"
+
+
+class FakeChatModel(BaseChatModel):
+    # Deterministic stand-in for gpt-4.1-mini: the self-query constructor
+    # gets a query without a filter and the answer prompt a short answer
+    # derived from the context size.
+    streaming: bool = False
+
+    @property
+    def _llm_type(self):
+        return "benchmark-fake-chat"
+
+    def respond(self, messages):
+        prompt = messages[-1].content
+        if SELF_QUERY_PROMPT_MARKER in prompt:
+            return '```json\n{"query": "patch changes", "filter": \
+"NO_FILTER"}\n```'
+
+        context_lines = prompt.count('\n- ')
+        return f"Based on {context_lines} retrieved patch notes, the \
+changes are listed above."
+
+    def usage(self, messages, text):
+        input_tokens = sum(len(message.content) for message in messages) // 4
+        output_tokens = len(text) // 4
+        return {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                'total_tokens': input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(
+            content=text, usage_metadata=self.usage(messages, text)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages)
+        for token in text.split(' '):
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=f"{token} "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,89 @@
+import click
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from .datafeed_fixtures import DatafeedFixtures
+from .pipeline_benchmark import PipelineBenchmark
+
+DEFAULT_BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+@click.command()
+@click.option('--fixtures-dir', default=None,
+              help='Directory of recorded datafeed fixtures. Defaults to \
+dota2patch/benchmark/fixtures, or synthesized fixtures when it is empty')
+@click.option('--record', is_flag=True, show_default=True, default=False,
+              help='Record the live datafeed into --fixtures-dir and exit. \
+Needs network access')
+@click.option('--patch-version', default='7.36..7.38c', show_default=True,
+              help='Patch version(s) to record, e.g. 7.38 or 7.33..7.38c')
+@click.option('--seed', default=7, show_default=True,
+              help='Seed of the synthesized fixtures')
+@click.option('--repeat', default=5, show_default=True,
+              help='Runs of each stage; throughputs use the fastest run')
+@click.option('--baseline', default=DEFAULT_BASELINE_PATH, show_default=True,
+              help='Baseline file to compare against')
+@click.option('--update-baseline', is_flag=True, show_default=True,
+              default=False, help='Write the results to --baseline')
+@click.option('--tolerance', default=0.25, show_default=True,
+              help='Relative change against the baseline reported as a \
+regression')
+@click.option('--verbose', is_flag=True, show_default=True, default=False,
+              help='Show pipeline output and a per-query latency breakdown')
+def run_benchmark(fixtures_dir, record, patch_version, seed, repeat,
+                  baseline, update_baseline, tolerance, verbose):
+    fixtures = DatafeedFixtures(fixtures_dir)
+    if record:
+        from ..fetcher.patch_fetcher import PatchFetcher
+        from ..fetcher.patch_versions import (
+            expand_patch_versions, needs_patch_list)
+
+        patch_fetcher = PatchFetcher()
+        fixtures.record(patch_fetcher, expand_patch_versions(
+            patch_version,
+            patch_fetcher.fetch_patch_versions()
+            if needs_patch_list(patch_version) else None))
+        print(f"Fixtures recorded in {fixtures.path}")
+        return
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        if not fixtures.exists():
+            if fixtures_dir:
+                raise RuntimeError(f"No fixtures found in {fixtures_dir}.")
+            print(f"No recorded fixtures in {fixtures.path}, using \
+synthesized fixtures (seed {seed}).")
+            fixtures = DatafeedFixtures(synthetic_dir)
+            fixtures.synthesize(seed=seed)
+
+        metrics = PipelineBenchmark(
+            fixtures, repeat=repeat, verbose=verbose).run()
+
+    baseline_metrics = {}
+    if os.path.exists(baseline):
+        with open(baseline, 'r', encoding='utf-8') as baseline_file:
+            baseline_metrics = json.load(baseline_file)['metrics']
+
+    comparison = PipelineBenchmark.compare(
+        metrics, baseline_metrics, tolerance)
+    PipelineBenchmark.report(metrics, baseline_metrics, comparison)
+
+    if update_baseline:
+        with open(baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump({
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                             time.gmtime()),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'metrics': {name: round(value, 3)
+                            for name, value in metrics.items()},
+            }, baseline_file, indent=2)
+            baseline_file.write('\n')
+        print(f"Baseline written to {baseline}")
+    elif any(regressed for _, regressed in comparison.values()):
+        print(f"Regressions beyond {tolerance:.0%} of the baseline.")
+        sys.exit(1)
@@ -0,0 +1,289 @@
+from contextlib import contextmanager, redirect_stdout
+import io
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+# name -> (unit, higher is better)
+METRICS = {
+    'cached_fetch_ms': ('ms', False),
+    'parse_notes_per_second': ('notes/s', True),
+    'documents_per_second': ('docs/s', True),
+    'insert_batches_per_second': ('batches/s', True),
+    'insert_documents_per_second': ('docs/s', True),
+    'query_p50_ms': ('ms', False),
+    'query_p95_ms': ('ms', False),
+    'query_max_ms': ('ms', False),
+    'peak_rss_mb': ('MB', False),
+}
+MIN_STAGE_SECONDS = 0.2
+
+
+class PipelineBenchmark:
+    # Runs fetch, parse, document building, insert and query against
+    # datafeed fixtures with a fake LLM, deterministic fake embeddings and
+    # the local vector backend in a temporary directory. Sockets are
+    # disabled for the whole run, so nothing can reach the network.
+    def __init__(self, fixtures, repeat=5, embedding_size=256,
+                 question_count=40, verbose=False):
+        self.fixtures = fixtures
+        self.repeat = repeat
+        self.embedding_size = embedding_size
+        self.question_count = question_count
+        self.verbose = verbose
+
+    @staticmethod
+    @contextmanager
+    def network_disabled():
+        def refuse(*args, **kwargs):
+            raise OSError("Network access is disabled during the benchmark.")
+
+        connect = socket.socket.connect
+        getaddrinfo = socket.getaddrinfo
+        socket.socket.connect = refuse
+        socket.getaddrinfo = refuse
+        try:
+            yield
+        finally:
+            socket.socket.connect = connect
+            socket.getaddrinfo = getaddrinfo
+
+    @staticmethod
+    @contextmanager
+    def isolated_paths(work_dir):
+        # Every index, store and cache lives in the work directory.
+        paths = {
+            'DOTA2_LEXICAL_INDEX_DIR': 'lexical_index',
+            'DOTA2_ROLLUP_STORE_DIR': 'rollups',
+            'DOTA2_EMBEDDING_CACHE_DIR': 'embeddings',
+            'DOTA2_ANSWER_CACHE_PATH': 'answer_cache.json',
+        }
+        previous = {name: os.environ.get(name) for name in paths}
+        os.environ.update({
+            name: os.path.join(work_dir, path)
+            for name, path in paths.items()})
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    @contextmanager
+    def quiet(self):
+        if self.verbose:
+            yield
+            return
+        with redirect_stdout(io.StringIO()):
+            yield
+
+    @staticmethod
+    def count_notes(patch_data):
+        notes = sum(len(section.get('generic', []))
+                    for section in patch_data.get('general_notes', []))
+        for key in ('items', 'neutral_items'):
+            notes += sum(len(item.get('ability_notes', []))
+                         for item in patch_data.get(key, []))
+        for hero in patch_data.get('heroes', []):
+            abilities = list(hero.get('abilities', []))
+            for subsection in hero.get('subsections', []):
+                notes += len(subsection.get('general_notes', []))
+                abilities += subsection.get('abilities', [])
+            notes += sum(len(ability.get('ability_notes', []))
+                         for ability in abilities)
+        return notes
+
+    @staticmethod
+    def peak_rss_mb():
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        if sys.platform == 'darwin':
+            return peak_rss / (1024 * 1024)
+        return peak_rss / 1024
+
+    def timed(self, run, min_seconds=0.0):
+        # Seconds per call of the fastest repeat, the one least disturbed
+        # by other processes. Stages shorter than min_seconds are called in
+        # a loop, after a warm-up call, until a repeat lasts that long, as
+        # timeit does.
+        result = run() if min_seconds else None
+        durations = []
+        for _ in range(self.repeat):
+            loops = 1
+            while True:
+                start = time.perf_counter()
+                for _ in range(loops):
+                    result = run()
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_seconds:
+                    break
+                loops *= 2
+            durations.append(elapsed / loops)
+        return result, min(durations)
+
+    def questions(self, documents):
+        titles = []
+        for document in documents:
+            metadata = document.metadata
+            if metadata['type'] in ('heroes', 'items') \
+                    and (metadata['title'], metadata['patch_number']) \
+                    not in titles:
+                titles.append((metadata['title'], metadata['patch_number']))
+
+        step = max(len(titles) // max(self.question_count - 2, 1), 1)
+        questions = [
+            f"What changed for {title.split(' (')[0]} in patch {patch}?"
+            for title, patch in titles[::step][:self.question_count - 2]]
+        # Questions without entities take the LLM query constructor path.
+        return questions + ["What are the general map changes?",
+                            "Which heroes got stronger recently?"]
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as work_dir, \
+                self.isolated_paths(work_dir), self.network_disabled():
+            metrics = self.run_stages(work_dir)
+        metrics['peak_rss_mb'] = self.peak_rss_mb()
+        return metrics
+
+    def run_stages(self, work_dir):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        from ..database.ingest_manifest import IngestManifest
+        from ..database.pinecone_client import PineconeClient
+        from ..database.process_data import ProcessData
+        from ..fetcher.patch_fetcher import PatchFetcher
+        from ..fetcher.response_cache import ResponseCache
+        from ..parser.patch_notes_parser import PatchNotesParser
+        from ..query.chat_query import ChatQuery
+        from ..query.fast_query_parser import FastQueryParser
+        from ..ragchain.retrieval_chain import RetrievalChain
+        from ..telemetry.latency_recorder import LatencyRecorder
+        from .fake_chat_model import FakeChatModel
+
+        metrics = {}
+        patch_fetcher = PatchFetcher(
+            response_cache=ResponseCache(
+                cache_dir=os.path.join(work_dir, 'datafeed'), offline=True),
+            lookup_tables_path=os.path.join(work_dir, 'lookup_tables.bin'))
+        patch_versions = self.fixtures.install(
+            patch_fetcher.response_cache, patch_fetcher)
+
+        print(f"Fetching {len(patch_versions)} patches from the fixtures")
+        with self.quiet():
+            (lookup_tables, patches), fetch_seconds = self.timed(
+                lambda: patch_fetcher.fetch_lookup_tables_and_patches(
+                    patch_versions), MIN_STAGE_SECONDS)
+        metrics['cached_fetch_ms'] = fetch_seconds * 1000
+
+        notes = sum(self.count_notes(patch_data)
+                    for patch_data in patches.values())
+        print(f"Parsing {notes} notes")
+
+        def parse():
+            patch_notes_parser = PatchNotesParser(lookup_tables)
+            return [
+                entry for patch_version in patch_versions
+                for entry in patch_notes_parser.parse(
+                    patches[patch_version])]
+
+        with self.quiet():
+            entries, parse_seconds = self.timed(parse, MIN_STAGE_SECONDS)
+        metrics['parse_notes_per_second'] = notes / parse_seconds
+
+        with self.quiet():
+            documents, documents_seconds = self.timed(
+                lambda: list(ProcessData().iter_documents(entries)),
+                MIN_STAGE_SECONDS)
+        metrics['documents_per_second'] = len(documents) / documents_seconds
+        print(f"Inserting {len(documents)} documents")
+
+        embeddings = DeterministicFakeEmbedding(size=self.embedding_size)
+        llm = FakeChatModel()
+        inserts = []
+
+        def insert():
+            # A fresh index per run, so every document is embedded again.
+            run_dir = os.path.join(work_dir, f"insert_{len(inserts)}")
+            pinecone_instance = PineconeClient(
+                None, embeddings, llm,
+                ingest_manifest=IngestManifest(
+                    os.path.join(run_dir, 'manifest.json')),
+                backend='local',
+                local_index_path=os.path.join(run_dir, 'local_index'))
+            stats = pinecone_instance.upsert_changed_documents(
+                pinecone_instance.get_vector_store(), iter(documents))
+            inserts.append(pinecone_instance)
+            return stats
+
+        with self.quiet():
+            stats, insert_seconds = self.timed(insert)
+        metrics['insert_batches_per_second'] = \
+            stats['batches'] / insert_seconds
+        metrics['insert_documents_per_second'] = \
+            stats['upserted'] / insert_seconds
+
+        pinecone_instance = inserts[-1]
+        questions = self.questions(documents)
+        print(f"Asking {len(questions)} questions {self.repeat} times")
+        latency_recorder = LatencyRecorder()
+        with self.quiet():
+            query_parser = FastQueryParser(
+                lookup_tables.heroes(),
+                lookup_tables.items(),
+                lookup_tables.abilities(),
+                pinecone_instance.indexed_patch_versions(),
+            )
+            retriever = pinecone_instance \
+                .get_retriever_from_self_query_retriever(
+                    pinecone_instance.get_vector_store(), query_parser)
+            chat_query = ChatQuery(
+                RetrievalChain(llm).get_qa_chain(retriever),
+                latency_recorder=latency_recorder)
+            for _ in range(self.repeat):
+                for question in questions:
+                    chat_query.ask_question(question, False)
+
+        durations = latency_recorder.stage_durations()[('query', 'total')]
+        metrics['query_p50_ms'] = latency_recorder.percentile(durations, 0.5)
+        metrics['query_p95_ms'] = latency_recorder.percentile(
+            durations, 0.95)
+        metrics['query_max_ms'] = max(durations)
+        if self.verbose:
+            latency_recorder.report()
+        return metrics
+
+    @staticmethod
+    def compare(metrics, baseline, tolerance):
+        # metric -> relative change against the baseline, with a flag for
+        # changes in the wrong direction beyond the tolerance.
+        comparison = {}
+        for name, value in metrics.items():
+            baseline_value = baseline.get(name)
+            if not baseline_value:
+                comparison[name] = (None, False)
+                continue
+            change = (value - baseline_value) / baseline_value
+            higher_is_better = METRICS[name][1]
+            regressed = -change > tolerance if higher_is_better \
+                else change > tolerance
+            comparison[name] = (change, regressed)
+        return comparison
+
+    @staticmethod
+    def report(metrics, baseline, comparison):
+        print("\n  metric                            value    baseline  \
+change")
+        for name, value in metrics.items():
+            unit = METRICS[name][0]
+            change, regressed = comparison.get(name, (None, False))
+            baseline_value = baseline.get(name)
+            baseline_text = f"{baseline_value:>10.1f}" \
+                if baseline_value is not None else f"{'-':>10}"
+            change_text = f"{change:+7.1%}" if change is not None \
+                else f"{'-':>7}"
+            print(f"  {name:<28} {value:>10.1f} {baseline_text} \
+{change_text} {unit}{'  REGRESSION' if regressed else ''}")
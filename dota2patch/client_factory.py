@@ -0,0 +1,321 @@
+from concurrent.futures import Future
+from contextlib import nullcontext
+import os
+import threading
+
+# Clients holding on-disk state that is only read when they are built
+# (the manifest, lexical index, rollups, local vectors, patch registry and
+# caches), and the clients built from them.
+INGEST_STATE = ('vector store client', 'vector store', 'patch registry',
+                'embeddings client', 'answer cache', 'fast query parser',
+                'exact query', 'chat query')
+
+
+class ClientFactory:
+    # Heavy modules (langchain, openai, pinecone, numpy) are imported inside
+    # the builders, so nothing is loaded until a client is first needed and
+    # the query clients can be warmed up in a background thread.
+    def __init__(self, settings, profiler):
+        self.settings = settings
+        self.profiler = profiler
+        self.lock = threading.RLock()
+        self.instances = {}
+        self.latency_recorder = None
+        if settings['profile']:
+            from .telemetry.latency_recorder import LatencyRecorder
+            self.latency_recorder = LatencyRecorder()
+
+    def get(self, name, builder):
+        with self.lock:
+            if name not in self.instances:
+                with self.profiler.stage(name):
+                    self.instances[name] = builder()
+            return self.instances[name]
+
+    def warm_up(self, builder):
+        # A daemon thread rather than an executor, so exiting at the prompt
+        # does not wait for clients that are still loading.
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(builder())
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+        return future
+
+    def patch_fetcher(self):
+        def build():
+            from .fetcher.patch_fetcher import PatchFetcher
+            from .fetcher.response_cache import ResponseCache
+
+            return PatchFetcher(
+                max_concurrency=self.settings['max_concurrency'],
+                response_cache=None if self.settings['no_cache'] else
+                ResponseCache(ttl=self.settings['cache_ttl'],
+                              offline=self.settings['offline']),
+            )
+        return self.get('patch fetcher', build)
+
+    def llm_client(self):
+        def build():
+            from langchain_openai import ChatOpenAI
+
+            return ChatOpenAI(
+                openai_api_key=os.environ.get("OPENAI_API_KEY"),
+                model_name="gpt-4.1-mini",
+                temperature=0)
+        return self.get('llm client', build)
+
+    def embeddings_client(self):
+        def build():
+            from langchain_openai import OpenAIEmbeddings
+
+            embeddings_client = OpenAIEmbeddings(
+                openai_api_key=os.environ.get("OPENAI_API_KEY"),
+                model="text-embedding-3-small")
+            if self.settings['embedding_cache_size'] > 0:
+                from .database.embedding_cache import (
+                    EmbeddingCache, CachedEmbeddings)
+                embeddings_client = CachedEmbeddings(
+                    embeddings_client,
+                    EmbeddingCache(
+                        max_entries=self.settings['embedding_cache_size']))
+            if self.latency_recorder is None:
+                return embeddings_client
+
+            from .telemetry.timed_embeddings import TimedEmbeddings
+            return TimedEmbeddings(embeddings_client)
+        return self.get('embeddings client', build)
+
+    def pinecone_instance(self):
+        def build():
+            from .database.pinecone_client import PineconeClient
+
+            pinecone_client = None
+            if self.settings['backend'] == 'pinecone':
+                from pinecone import Pinecone
+                pinecone_client = Pinecone(
+                    api_key=os.environ.get("PINECONE_API_KEY"))
+
+            return PineconeClient(
+                pinecone_client,
+                self.embeddings_client(),
+                self.llm_client(),
+                backend=self.settings['backend'],
+                hybrid=self.settings['hybrid'],
+                rollups=self.settings['rollups'],
+                rerank=self.settings['rerank'],
+                rerank_candidates=self.settings['rerank_candidates'],
+                rerank_top_n=self.settings['rerank_top_n'],
+            )
+        return self.get('vector store client', build)
+
+    def answer_cache(self):
+        def build():
+            if self.settings['answer_cache_size'] <= 0:
+                return None
+
+            from .query.answer_cache import AnswerCache
+            return AnswerCache(
+                self.embeddings_client(),
+                max_entries=self.settings['answer_cache_size'],
+                ttl=self.settings['answer_cache_ttl'],
+                similarity_threshold=self.settings[
+                    'answer_similarity_threshold'],
+            )
+        return self.get('answer cache', build)
+
+    def fast_query_parser(self):
+        def build():
+            if not self.settings['fast_query']:
+                return None
+
+            from .query.fast_query_parser import FastQueryParser
+
+            try:
+                lookup_tables = self.patch_fetcher().fetch_lookup_tables()
+            except RuntimeError as e:
+                print(f"Fast query parsing disabled: {e}")
+                return None
+
+            # The registry also knows patches inserted before the manifest
+            # recorded patch numbers.
+            return FastQueryParser(
+                lookup_tables.heroes(),
+                lookup_tables.items(),
+                lookup_tables.abilities(),
+                sorted(set(self.patch_registry().versions()) | set(
+                    self.pinecone_instance().indexed_patch_versions())),
+            )
+        return self.get('fast query parser', build)
+
+    def patch_registry(self):
+        def build():
+            from .fetcher.patch_registry import PatchRegistry
+            return PatchRegistry()
+        return self.get('patch registry', build)
+
+    def patch_diff_store(self):
+        def build():
+            if not self.settings['exact_query']:
+                return None
+
+            from .database.patch_diff_store import PatchDiffStore
+            return PatchDiffStore()
+        return self.get('patch diff store', build)
+
+    def exact_query(self):
+        def build():
+            patch_diff_store = self.patch_diff_store()
+            if patch_diff_store is None:
+                return None
+            if not len(patch_diff_store):
+                print("The patch diff store is empty, run --insert to build \
+it. Exact queries disabled.")
+                return None
+
+            # Entities are resolved by the fast query parser.
+            query_parser = self.fast_query_parser()
+            if query_parser is None:
+                return None
+
+            from .query.exact_query import ExactQuery
+            return ExactQuery(patch_diff_store, query_parser,
+                              verbose=self.settings['verbose'])
+        return self.get('exact query', build)
+
+    def vector_store(self):
+        return self.get(
+            'vector store',
+            lambda: self.pinecone_instance().get_vector_store())
+
+    def insert_trace(self, patch_version):
+        if self.latency_recorder is None:
+            return nullcontext()
+        return self.latency_recorder.trace('insert', patch_version)
+
+    def flush(self):
+        # Writes what the caches hold back for a later save; called before
+        # they are dropped and when exiting.
+        with self.lock:
+            caches = [self.instances.get(name)
+                      for name in ('embeddings client', 'answer cache')]
+        for cache in caches:
+            if hasattr(cache, 'flush'):
+                cache.flush()
+
+    def reload_ingest_state(self):
+        # The next request for these clients builds them again from what
+        # is on disk now.
+        with self.lock:
+            self.flush()
+            for name in INGEST_STATE:
+                self.instances.pop(name, None)
+
+    def set_vector_store(self, vector_store):
+        with self.lock:
+            self.instances['vector store'] = vector_store
+
+    def locked_ingest(self, ingest, blocking=True):
+        # False when another process holds the ingest lock and blocking is
+        # off.
+        from .database.ingest_lock import IngestLock
+
+        ingest_lock = IngestLock()
+        if not ingest_lock.acquire(blocking=False):
+            if not blocking:
+                return False
+            print(f"Waiting for another insert (pid \
+{ingest_lock.holder() or 'unknown'}) to finish.")
+            ingest_lock.acquire()
+        try:
+            # Another process may have written the stores since they were
+            # loaded; saving this process's copies would undo its writes.
+            self.reload_ingest_state()
+            ingest()
+        finally:
+            self.flush()
+            ingest_lock.release()
+        return True
+
+    def insert(self, patch_version, blocking=True):
+        return self.locked_ingest(
+            lambda: self.insert_patches(patch_version), blocking)
+
+    def invalidate_answers(self, pinecone_instance):
+        answer_cache = self.answer_cache()
+        if answer_cache:
+            invalidated = answer_cache.invalidate_patches(
+                pinecone_instance.updated_patch_numbers)
+            print(f"Invalidated {invalidated} cached answers.")
+
+    def import_snapshot(self, path):
+        def ingest():
+            pinecone_instance = self.pinecone_instance()
+            with self.profiler.stage('import snapshot'):
+                self.set_vector_store(pinecone_instance.import_snapshot(
+                    path, self.patch_registry()))
+            self.invalidate_answers(pinecone_instance)
+        return self.locked_ingest(ingest)
+
+    def export_snapshot(self, path, dtype):
+        with self.profiler.stage('export snapshot'):
+            return self.pinecone_instance().export_snapshot(path, dtype)
+
+    def insert_patches(self, patch_version):
+        from .fetcher.patch_versions import (
+            expand_patch_versions, needs_patch_list)
+
+        with self.insert_trace(patch_version):
+            patch_fetcher = self.patch_fetcher()
+            patch_versions = expand_patch_versions(
+                patch_version,
+                patch_fetcher.fetch_patch_versions()
+                if needs_patch_list(patch_version) else None)
+            print(f"Inserting patches: {', '.join(patch_versions)}")
+
+            pinecone_instance = self.pinecone_instance()
+            with self.profiler.stage('insert'):
+                self.set_vector_store(pinecone_instance.insert(
+                    patch_fetcher.iter_all_patch_documents(
+                        patch_versions, self.patch_diff_store(),
+                        self.patch_registry())))
+
+        stats_line = self.embedding_stats_line()
+        if stats_line:
+            print(stats_line)
+        self.invalidate_answers(pinecone_instance)
+
+    def chat_query(self):
+        def build():
+            from .ragchain.retrieval_chain import RetrievalChain
+            from .query.chat_query import ChatQuery
+
+            # retriever = pinecone_instance.retrieve(vector_store)
+            retriever = self.pinecone_instance() \
+                .get_retriever_from_self_query_retriever(
+                    self.vector_store(), self.fast_query_parser(),
+                    self.settings['verbose'])
+
+            retrieval_chain = RetrievalChain(
+                self.llm_client(), streaming=self.settings['stream'],
+                context_tokens=self.settings['context_tokens'],
+                verbose=self.settings['verbose'])
+            qa_chain = retrieval_chain.get_qa_chain(retriever)
+
+            return ChatQuery(qa_chain, self.answer_cache(),
+                             streaming=self.settings['stream'],
+                             latency_recorder=self.latency_recorder,
+                             exact_query=self.exact_query())
+        return self.get('chat query', build)
+
+    def embedding_stats_line(self):
+        with self.lock:
+            embeddings_client = self.instances.get('embeddings client')
+        if embeddings_client is None or not hasattr(
+                embeddings_client, 'stats_line'):
+            return None
+        return embeddings_client.stats_line()
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=None, max_entries=20_000):
+        self.cache_dir = cache_dir or os.environ.get(
+            "DOTA2_EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+        self.max_entries = max_entries
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        # Exists while the matrix has rows the index does not know about
+        # yet; the index is only written by flush().
+        self.dirty_path = os.path.join(self.cache_dir, "dirty")
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dimensions = None
+        self.vectors = None
+        # key -> row in the memory-mapped matrix, least recently used first
+        self.slots = OrderedDict()
+        self.free_slots = []
+        self.load()
+
+    @staticmethod
+    def key(model, text):
+        return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as index_file:
+                index = json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        if (index.get('max_entries') != self.max_entries
+                or not os.path.exists(self.vectors_path)):
+            print("Embedding cache size changed, starting a new cache.")
+            return
+        if os.path.exists(self.dirty_path):
+            # Rows of evicted entries may have been overwritten since the
+            # index was written.
+            print("Embedding cache was not saved, starting a new cache.")
+            return
+
+        try:
+            self.open_vectors(index['dimensions'], mode='r+')
+        except ValueError as e:
+            print(f"Ignoring unreadable embedding cache: {e}")
+            self.vectors = None
+            return
+        self.slots = OrderedDict(index['entries'])
+        self.free_slots = sorted(
+            set(range(self.max_entries)) - set(self.slots.values()),
+            reverse=True)
+
+    def open_vectors(self, dimensions, mode='w+'):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.dimensions = dimensions
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode=mode,
+            shape=(self.max_entries, dimensions))
+        if mode == 'w+':
+            self.slots = OrderedDict()
+            self.free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def get_many(self, keys):
+        with self.lock:
+            results = []
+            for key in keys:
+                slot = self.slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+
+                self.hits += 1
+                self.slots.move_to_end(key)
+                results.append(np.array(self.vectors[slot]))
+            return results
+
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+
+        with self.lock:
+            if self.vectors is None or self.dimensions != len(vectors[0]):
+                self.open_vectors(len(vectors[0]))
+            if not self.dirty:
+                open(self.dirty_path, 'w').close()
+                self.dirty = True
+
+            for key, vector in zip(keys, vectors):
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = self.allocate_slot()
+                self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+                self.slots[key] = slot
+                self.slots.move_to_end(key)
+
+    def allocate_slot(self):
+        if self.free_slots:
+            return self.free_slots.pop()
+
+        _, slot = self.slots.popitem(last=False)
+        self.evictions += 1
+        return slot
+
+    def flush(self):
+        # Called once an insert, a batch or the session is done rather
+        # than after every put_many.
+        with self.lock:
+            if not self.dirty:
+                return
+
+            self.vectors.flush()
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as index_file:
+                json.dump({
+                    'dimensions': self.dimensions,
+                    'max_entries': self.max_entries,
+                    'entries': list(self.slots.items()),
+                }, index_file)
+            os.replace(tmp_path, self.index_path)
+            os.remove(self.dirty_path)
+            self.dirty = False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.slots),
+            'evictions': self.evictions,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings_client, embedding_cache, model=None):
+        self.embeddings_client = embeddings_client
+        self.embedding_cache = embedding_cache
+        self.model = model or getattr(
+            embeddings_client, 'model', type(embeddings_client).__name__)
+
+    def lookup(self, texts):
+        keys = [EmbeddingCache.key(self.model, text) for text in texts]
+        vectors = self.embedding_cache.get_many(keys)
+        # Identical texts in one batch are only embedded once.
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing[key] = text
+        return keys, vectors, missing
+
+    def merge(self, keys, vectors, missing, embedded):
+        self.embedding_cache.put_many(list(missing), embedded)
+        embedded_by_key = dict(zip(missing, embedded))
+        return [
+            vector.tolist() if vector is not None else list(
+                embedded_by_key[key])
+            for key, vector in zip(keys, vectors)
+        ]
+
+    def embed_documents(self, texts):
+        keys, vectors, missing = self.lookup(texts)
+        embedded = self.embeddings_client.embed_documents(
+            list(missing.values())) if missing else []
+        return self.merge(keys, vectors, missing, embedded)
+
+    def embed_query(self, text):
+        keys, vectors, missing = self.lookup([text])
+        embedded = [self.embeddings_client.embed_query(text)] \
+            if missing else []
+        return self.merge(keys, vectors, missing, embedded)[0]
+
+    async def aembed_documents(self, texts):
+        keys, vectors, missing = self.lookup(texts)
+        embedded = await self.embeddings_client.aembed_documents(
+            list(missing.values())) if missing else []
+        return self.merge(keys, vectors, missing, embedded)
+
+    async def aembed_query(self, text):
+        keys, vectors, missing = self.lookup([text])
+        embedded = [await self.embeddings_client.aembed_query(text)] \
+            if missing else []
+        return self.merge(keys, vectors, missing, embedded)[0]
+
+    def flush(self):
+        self.embedding_cache.flush()
+
+    def stats_line(self):
+        stats = self.embedding_cache.stats()
+        return (f"Embedding cache: {stats['hits']} hits, "
+                f"{stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate), "
+                f"{stats['entries']} entries, "
+                f"{stats['evictions']} evictions")
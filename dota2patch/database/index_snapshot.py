@@ -0,0 +1,156 @@
+import mmap
+import os
+import struct
+import sys
+import time
+import numpy as np
+import orjson
+import zstandard
+
+SNAPSHOT_MAGIC = b'D2SN'
+SNAPSHOT_FORMAT_VERSION = 1
+# magic, format version, header offset, header length
+SNAPSHOT_PREAMBLE = struct.Struct('<4sIQQ')
+SNAPSHOT_DTYPES = ('float16', 'float32')
+# Vector blocks start on a 64 byte boundary so they can be used in place.
+SNAPSHOT_ALIGNMENT = 64
+
+
+class IndexSnapshot:
+    # One file holding a vector index: per chunk of rows a raw float16 or
+    # float32 vector block, memory-mapped on load, followed by the chunk's
+    # ids, texts and metadata as zstandard-compressed JSON; then the ingest
+    # manifest entries and a JSON header locating every section. The
+    # header is written last, so chunks are streamed to disk as they are
+    # exported.
+    def __init__(self, path, header, buffer):
+        self.path = path
+        self.header = header
+        self.buffer = buffer
+
+    def __len__(self):
+        return self.header['count']
+
+    @staticmethod
+    def compress(value):
+        return zstandard.ZstdCompressor(level=10).compress(
+            orjson.dumps(value))
+
+    @staticmethod
+    def pad(snapshot_file):
+        snapshot_file.write(b'\0' * (-snapshot_file.tell()
+                                     % SNAPSHOT_ALIGNMENT))
+
+    @classmethod
+    def write(cls, path, chunks, manifest_entries, source, dtype='float32'):
+        # chunks: (ids, texts, metadatas, vectors) tuples.
+        if dtype not in SNAPSHOT_DTYPES:
+            raise RuntimeError(f"Unsupported snapshot dtype {dtype}, \
+expected one of {', '.join(SNAPSHOT_DTYPES)}.")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        header = {
+            'byteorder': sys.byteorder,
+            'created_at': time.time(),
+            'source': source,
+            'dtype': dtype,
+            'dimensions': None,
+            'count': 0,
+            'chunks': [],
+        }
+        exported_ids = set()
+        with open(tmp_path, 'wb') as snapshot_file:
+            snapshot_file.write(b'\0' * SNAPSHOT_PREAMBLE.size)
+            for ids, texts, metadatas, vectors in chunks:
+                if not ids:
+                    continue
+                vectors = np.ascontiguousarray(vectors, dtype=dtype)
+                if header['dimensions'] is None:
+                    header['dimensions'] = vectors.shape[1]
+                elif vectors.shape[1] != header['dimensions']:
+                    raise RuntimeError(f"Cannot export vectors of \
+{vectors.shape[1]} and {header['dimensions']} dimensions together.")
+
+                cls.pad(snapshot_file)
+                vectors_offset = snapshot_file.tell()
+                snapshot_file.write(vectors.tobytes())
+                records = cls.compress(
+                    {'ids': ids, 'texts': texts, 'metadatas': metadatas})
+                records_offset = snapshot_file.tell()
+                snapshot_file.write(records)
+                header['chunks'].append({
+                    'count': len(ids),
+                    'vectors': [vectors_offset, vectors.nbytes],
+                    'records': [records_offset, len(records)],
+                })
+                header['count'] += len(ids)
+                exported_ids.update(ids)
+
+            manifest = cls.compress({
+                document_id: entry
+                for document_id, entry in manifest_entries.items()
+                if document_id in exported_ids})
+            header['manifest'] = [snapshot_file.tell(), len(manifest)]
+            snapshot_file.write(manifest)
+
+            header_bytes = orjson.dumps(header)
+            header_offset = snapshot_file.tell()
+            snapshot_file.write(header_bytes)
+            snapshot_file.seek(0)
+            snapshot_file.write(SNAPSHOT_PREAMBLE.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, header_offset,
+                len(header_bytes)))
+        os.replace(tmp_path, path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        # Unlike the caches, a snapshot is given explicitly, so a file that
+        # cannot be read is an error rather than a miss.
+        try:
+            with open(path, 'rb') as snapshot_file:
+                buffer = mmap.mmap(
+                    snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, format_version, header_offset, header_length = \
+                SNAPSHOT_PREAMBLE.unpack_from(buffer)
+        except (OSError, ValueError, struct.error) as e:
+            raise RuntimeError(f"Cannot read index snapshot {path}: {e}")
+        if magic != SNAPSHOT_MAGIC \
+                or format_version != SNAPSHOT_FORMAT_VERSION:
+            raise RuntimeError(f"{path} is not an index snapshot of format \
+version {SNAPSHOT_FORMAT_VERSION}.")
+
+        try:
+            header = orjson.loads(
+                buffer[header_offset:header_offset + header_length])
+        except orjson.JSONDecodeError as e:
+            raise RuntimeError(f"Index snapshot {path} is truncated: {e}")
+        if header['byteorder'] != sys.byteorder:
+            raise RuntimeError(f"Index snapshot {path} was written on a \
+{header['byteorder']} endian machine.")
+        return cls(path, header, buffer)
+
+    def section(self, offset, length):
+        return memoryview(self.buffer)[offset:offset + length]
+
+    def decompress(self, offset, length):
+        return orjson.loads(zstandard.ZstdDecompressor().decompress(
+            self.section(offset, length)))
+
+    def iter_chunks(self):
+        # Yields (ids, texts, metadatas, vectors); vectors is a read-only
+        # view of the mapped file in the snapshot's dtype.
+        for chunk in self.header['chunks']:
+            records = self.decompress(*chunk['records'])
+            vectors = np.frombuffer(
+                self.section(*chunk['vectors']),
+                dtype=self.header['dtype']).reshape(
+                    chunk['count'], self.header['dimensions'])
+            yield records['ids'], records['texts'], records['metadatas'], \
+                vectors
+
+    def manifest_entries(self):
+        return self.decompress(*self.header['manifest'])
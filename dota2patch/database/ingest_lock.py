@@ -0,0 +1,46 @@
+import fcntl
+import os
+
+
+class IngestLock:
+    # An advisory file lock held while patches are inserted, so a watcher
+    # and a manual --insert never write to the indexes and stores at the
+    # same time. The holder's pid is written into the file for messages.
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(
+            "DOTA2_INGEST_LOCK_PATH", os.path.join(".cache", "ingest.lock"))
+        self.lock_file = None
+
+    def holder(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as lock_file:
+                return lock_file.read().strip() or None
+        except OSError:
+            return None
+
+    def acquire(self, blocking=True):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        lock_file = open(self.path, 'a+', encoding='utf-8')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX
+                        | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        lock_file.truncate(0)
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self.lock_file = lock_file
+        return True
+
+    def release(self):
+        if self.lock_file is None:
+            return
+        self.lock_file.truncate(0)
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+
+
+class IngestManifest:
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(
+            "DOTA2_MANIFEST_PATH",
+            os.path.join(".cache", "ingest_manifest.json"))
+        self.namespaces = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            print(f"Ignoring unreadable ingest manifest {self.path}: {e}")
+            return {}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(self.namespaces, manifest_file)
+        os.replace(tmp_path, self.path)
+
+    def entries(self, namespace):
+        return self.namespaces.setdefault(namespace, {})
+
+    def entries_for_patches(self, namespace, patch_numbers):
+        return {
+            document_id: entry
+            for document_id, entry in self.entries(namespace).items()
+            if entry.get('patch_number') in patch_numbers
+        }
+
+    def record(self, namespace, documents):
+        entries = self.entries(namespace)
+        for document in documents:
+            entries[document.id] = {
+                'hash': self.content_hash(document),
+                'patch_number': document.metadata.get('patch_number'),
+            }
+
+    def remove(self, namespace, document_ids):
+        entries = self.entries(namespace)
+        for document_id in document_ids:
+            entries.pop(document_id, None)
+
+    @staticmethod
+    def content_hash(document):
+        # Metadata is part of the hash, so documents are upserted again when
+        # fields used for filtering are added or changed.
+        return hashlib.sha256('\0'.join((
+            document.page_content,
+            json.dumps(document.metadata, sort_keys=True),
+        )).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def document_id(metadata):
+        key = '|'.join(str(metadata.get(field, '')) for field in (
+            'patch_number', 'type', 'subtype', 'title', 'skill_name'))
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+        return f"{metadata.get('patch_number', 'N/A')}#{digest}"
+
+    @staticmethod
+    def assign_document_ids(documents):
+        # A few entries (e.g. general notes sharing a section title) map to
+        # the same key, so later duplicates get a stable ordinal suffix.
+        seen = {}
+        for document in documents:
+            document_id = IngestManifest.document_id(document.metadata)
+            seen[document_id] = seen.get(document_id, 0) + 1
+            if seen[document_id] > 1:
+                document_id = f"{document_id}-{seen[document_id]}"
+            document.id = document_id
+            yield document
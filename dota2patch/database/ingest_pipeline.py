@@ -0,0 +1,194 @@
+from .ingest_manifest import IngestManifest
+from .process_data import ProcessData
+from ..ragchain.token_counter import TokenCounter
+from ..telemetry.latency_recorder import LatencyRecorder
+import contextvars
+import queue
+import threading
+
+
+class IngestPipeline:
+    # documents (lazily parsed) -> manifest diff -> token-sized batches ->
+    # bounded queue -> worker threads that embed and upsert a batch each.
+    def __init__(self, vector_store, ingest_manifest, namespace,
+                 max_batch_tokens=20_000, max_batch_size=100,
+                 max_in_flight=4, encoding_name="cl100k_base",
+                 lexical_index=None, rollup_store=None):
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.rollup_store = rollup_store
+        self.ingest_manifest = ingest_manifest
+        self.namespace = namespace
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.encoding_name = encoding_name
+        self.manifest_lock = threading.Lock()
+        # The local store keeps its writes in memory until flushed; the
+        # manifest is then only saved after it, so it never lists
+        # documents that are not stored.
+        self.deferred_writes = hasattr(vector_store, 'flush')
+        self.error = None
+        self.stats = {
+            'documents': 0,
+            'unchanged': 0,
+            'upserted': 0,
+            'batches': 0,
+            'removed': 0,
+        }
+        self.updated_patch_numbers = set()
+
+    def update_rollups(self, patch_number, patch_documents):
+        if self.rollup_store is not None and patch_documents:
+            self.rollup_store.replace_patch(
+                patch_number,
+                ProcessData().construct_rollup_documents(patch_documents))
+
+    def iter_changed_documents(self, documents, seen_ids, previous_entries):
+        entries = self.ingest_manifest.entries(self.namespace)
+        # Documents arrive patch by patch, so each patch's rollups are
+        # rebuilt from all of its documents, changed or not, once the
+        # next patch starts.
+        rollup_patch = None
+        rollup_documents = []
+        for document in IngestManifest.assign_document_ids(documents):
+            self.stats['documents'] += 1
+            patch_number = document.metadata.get('patch_number')
+            seen_ids.setdefault(patch_number, set()).add(document.id)
+            if self.rollup_store is not None:
+                if patch_number != rollup_patch:
+                    self.update_rollups(rollup_patch, rollup_documents)
+                    rollup_patch = patch_number
+                    rollup_documents = []
+                rollup_documents.append(document)
+            if patch_number not in previous_entries:
+                with self.manifest_lock:
+                    previous_entries[patch_number] = \
+                        self.ingest_manifest.entries_for_patches(
+                            self.namespace, {patch_number})
+
+            if entries.get(document.id, {}).get('hash') \
+                    == IngestManifest.content_hash(document):
+                self.stats['unchanged'] += 1
+                # Documents embedded before the lexical index existed are
+                # only added to it, without another embedding call.
+                if self.lexical_index is not None \
+                        and document.id not in self.lexical_index:
+                    self.lexical_index.add_documents([document])
+                continue
+            yield document
+        self.update_rollups(rollup_patch, rollup_documents)
+
+    def iter_batches(self, documents):
+        token_counter = TokenCounter(self.encoding_name)
+        batch = []
+        batch_tokens = 0
+        for document in documents:
+            tokens = token_counter.count(document.page_content)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens
+                          or len(batch) >= self.max_batch_size):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(document)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def worker(self, batches):
+        while True:
+            batch = batches.get()
+            try:
+                if batch is None:
+                    return
+                if self.error is not None:
+                    continue
+
+                with LatencyRecorder.stage(
+                        'embed and upsert', documents=len(batch)):
+                    self.vector_store.add_documents(
+                        documents=batch,
+                        ids=[document.id for document in batch])
+                if self.lexical_index is not None:
+                    self.lexical_index.add_documents(batch)
+                with self.manifest_lock:
+                    self.ingest_manifest.record(self.namespace, batch)
+                    if not self.deferred_writes:
+                        self.ingest_manifest.save()
+                    self.stats['upserted'] += len(batch)
+                    self.stats['batches'] += 1
+                    self.updated_patch_numbers |= {
+                        document.metadata.get('patch_number')
+                        for document in batch}
+            except Exception as e:
+                self.error = self.error or e
+            finally:
+                batches.task_done()
+
+    def flush(self):
+        if self.deferred_writes:
+            with LatencyRecorder.stage('flush'):
+                self.vector_store.flush()
+        self.ingest_manifest.save()
+
+    def run(self, documents):
+        # The queue only holds a couple of batches per worker, so parsing
+        # never runs far ahead of embedding and memory stays flat.
+        batches = queue.Queue(maxsize=self.max_in_flight * 2)
+        # Workers run in a copy of the caller's context so their stages
+        # land on the caller's latency trace.
+        workers = [
+            threading.Thread(target=contextvars.copy_context().run,
+                             args=(self.worker, batches),
+                             name=f"ingest-{index}", daemon=True)
+            for index in range(self.max_in_flight)
+        ]
+        for worker in workers:
+            worker.start()
+
+        seen_ids = {}
+        previous_entries = {}
+        try:
+            for batch in self.iter_batches(self.iter_changed_documents(
+                    documents, seen_ids, previous_entries)):
+                if self.error is not None:
+                    break
+                with LatencyRecorder.stage('queue wait'):
+                    batches.put(batch)
+        finally:
+            for _ in workers:
+                batches.put(None)
+            for worker in workers:
+                worker.join()
+            # Also after a failed batch, so the stored batches are kept.
+            self.flush()
+
+        if self.error is not None:
+            raise RuntimeError(f"Ingest failed: {self.error}") from self.error
+
+        # Only the patches present in this run are diffed, so a patch that
+        # failed to fetch never has its documents deleted.
+        removed_ids = []
+        for patch_number, entries in previous_entries.items():
+            patch_removed_ids = [document_id for document_id in entries
+                                 if document_id not in seen_ids[patch_number]]
+            if patch_removed_ids:
+                removed_ids.extend(patch_removed_ids)
+                self.updated_patch_numbers.add(patch_number)
+
+        if removed_ids:
+            with LatencyRecorder.stage('delete', documents=len(removed_ids)):
+                self.vector_store.delete(ids=removed_ids)
+            self.ingest_manifest.remove(self.namespace, removed_ids)
+            self.flush()
+        self.stats['removed'] = len(removed_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(removed_ids)
+            self.lexical_index.save()
+        if self.rollup_store is not None:
+            self.rollup_store.save()
+
+        print(f"{self.stats['upserted']} new or changed documents upserted in \
+{self.stats['batches']} batches, {self.stats['unchanged']} unchanged and \
+{self.stats['removed']} removed.")
+        return self.stats
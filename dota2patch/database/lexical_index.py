@@ -0,0 +1,226 @@
+from collections import Counter
+from langchain_core.documents import Document
+from .metadata_filter import MetadataColumns
+import numpy as np
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+
+# Keeps code names (pudge_meat_hook), decimals (3.5) and patch numbers
+# (7.38c) as single tokens.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._'][a-z0-9]+)*")
+STOP_WORDS = frozenset({
+    'a', 'about', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by',
+    'can', 'change', 'changed', 'changes', 'did', 'do', 'does', 'for',
+    'from', 'get', 'got', 'has', 'have', 'how', 'in', 'is', 'it', 'its',
+    'me', 'of', 'on', 'or', 'so', 'tell', 'that', 'the', 'their', 'there',
+    'this', 'to', 'was', 'were', 'what', 'when', 'which', 'who', 'why',
+    'with',
+})
+
+
+class LexicalIndex:
+    # BM25 over the same page_content that is embedded. Postings are kept
+    # in CSR form: per term a slice of sorted uint32 document rows and
+    # uint16 term counts, memory-mapped from .npy files.
+    def __init__(self, path=None, namespace=None, k1=1.2, b=0.75):
+        self.path = path or os.environ.get(
+            "DOTA2_LEXICAL_INDEX_DIR", os.path.join(".cache", "lexical_index"))
+        if namespace is not None:
+            # One index per vector store, keyed like the ingest manifest.
+            self.path = os.path.join(self.path, hashlib.sha1(
+                namespace.encode('utf-8')).hexdigest()[:16])
+        self.documents_path = os.path.join(self.path, "documents.json")
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.id_to_row = {}
+        self.terms = {}
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.posting_rows = np.zeros(0, dtype=np.uint32)
+        self.posting_counts = np.zeros(0, dtype=np.uint16)
+        self.document_lengths = np.zeros(0, dtype=np.uint32)
+        self.columns = MetadataColumns([])
+        self.dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, document_id):
+        return document_id in self.id_to_row
+
+    def array_path(self, name):
+        return os.path.join(self.path, f"{name}.npy")
+
+    @staticmethod
+    def tokenize(text):
+        tokens = []
+        for token in TOKEN_PATTERN.findall(
+                text.lower().replace('’', "'")):
+            if token in STOP_WORDS:
+                continue
+            tokens.append(token)
+            if '_' in token:
+                tokens.extend(part for part in token.split('_') if part)
+        return tokens
+
+    def load(self):
+        if not os.path.exists(self.documents_path):
+            return
+
+        with open(self.documents_path, 'r', encoding='utf-8') as documents:
+            stored = json.load(documents)
+        self.ids = stored['ids']
+        self.texts = stored['texts']
+        self.metadatas = stored['metadatas']
+        self.terms = {
+            term: index for index, term in enumerate(stored['terms'])}
+        self.id_to_row = {
+            document_id: row for row, document_id in enumerate(self.ids)}
+        self.term_offsets = np.load(
+            self.array_path('term_offsets'), mmap_mode='r')
+        self.posting_rows = np.load(
+            self.array_path('posting_rows'), mmap_mode='r')
+        self.posting_counts = np.load(
+            self.array_path('posting_counts'), mmap_mode='r')
+        self.document_lengths = np.load(
+            self.array_path('document_lengths'), mmap_mode='r')
+        self.columns = MetadataColumns(self.metadatas)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.compile()
+
+            os.makedirs(self.path, exist_ok=True)
+            replacements = []
+            for name in ('term_offsets', 'posting_rows', 'posting_counts',
+                         'document_lengths'):
+                tmp_path = f"{self.array_path(name)}.tmp.npy"
+                np.save(tmp_path, getattr(self, name))
+                replacements.append((tmp_path, self.array_path(name)))
+
+            tmp_documents_path = f"{self.documents_path}.tmp"
+            with open(tmp_documents_path, 'w', encoding='utf-8') as documents:
+                json.dump({
+                    'ids': self.ids,
+                    'texts': self.texts,
+                    'metadatas': self.metadatas,
+                    'terms': list(self.terms),
+                }, documents)
+            replacements.append((tmp_documents_path, self.documents_path))
+            for tmp_path, path in replacements:
+                os.replace(tmp_path, path)
+
+    def compile(self):
+        postings = {}
+        document_lengths = np.zeros(len(self.texts), dtype=np.uint32)
+        for row, text in enumerate(self.texts):
+            counts = Counter(self.tokenize(text))
+            document_lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((row, count))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        posting_rows = np.empty(term_offsets[-1], dtype=np.uint32)
+        posting_counts = np.empty(term_offsets[-1], dtype=np.uint16)
+        for index, term in enumerate(terms):
+            start, end = term_offsets[index], term_offsets[index + 1]
+            rows, counts = zip(*postings[term])
+            posting_rows[start:end] = rows
+            posting_counts[start:end] = np.minimum(counts, 65535)
+
+        self.terms = {term: index for index, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.posting_rows = posting_rows
+        self.posting_counts = posting_counts
+        self.document_lengths = document_lengths
+        self.columns = MetadataColumns(self.metadatas)
+        self.dirty = False
+
+    def add_documents(self, documents):
+        with self.lock:
+            for document in documents:
+                row = self.id_to_row.get(document.id)
+                if row is None:
+                    self.id_to_row[document.id] = len(self.ids)
+                    self.ids.append(document.id)
+                    self.texts.append(document.page_content)
+                    self.metadatas.append(document.metadata)
+                else:
+                    self.texts[row] = document.page_content
+                    self.metadatas[row] = document.metadata
+            self.dirty = True
+
+    def delete(self, ids):
+        with self.lock:
+            removed = set(ids) & set(self.id_to_row)
+            if not removed:
+                return
+            kept_rows = [row for row, document_id in enumerate(self.ids)
+                         if document_id not in removed]
+            self.ids = [self.ids[row] for row in kept_rows]
+            self.texts = [self.texts[row] for row in kept_rows]
+            self.metadatas = [self.metadatas[row] for row in kept_rows]
+            self.id_to_row = {
+                document_id: row for row, document_id in enumerate(self.ids)}
+            self.dirty = True
+
+    def document(self, row):
+        return Document(
+            id=self.ids[row],
+            page_content=self.texts[row],
+            metadata=self.metadatas[row])
+
+    def search(self, query, k=20, filter=None):
+        # Returns (document, bm25 score, share of the query terms matched).
+        query_terms = list(dict.fromkeys(self.tokenize(query)))
+        with self.lock:
+            if self.dirty:
+                self.compile()
+            if not query_terms or not self.ids:
+                return []
+
+            size = len(self.ids)
+            scores = np.zeros(size, dtype=np.float32)
+            matched_terms = np.zeros(size, dtype=np.int32)
+            lengths = self.document_lengths.astype(np.float32)
+            length_norm = self.k1 * (
+                1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+            for term in query_terms:
+                index = self.terms.get(term)
+                if index is None:
+                    continue
+                start, end = self.term_offsets[index], \
+                    self.term_offsets[index + 1]
+                rows = self.posting_rows[start:end]
+                counts = self.posting_counts[start:end].astype(np.float32)
+                document_frequency = end - start
+                idf = math.log(1 + (size - document_frequency + 0.5)
+                               / (document_frequency + 0.5))
+                scores[rows] += idf * counts * (self.k1 + 1) / (
+                    counts + length_norm[rows])
+                matched_terms[rows] += 1
+
+            candidates = np.flatnonzero(
+                (scores > 0) & self.columns.mask(filter))
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(
+                    -scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(
+                -scores[candidates], kind='stable')]
+            return [
+                (self.document(row), float(scores[row]),
+                 matched_terms[row] / len(query_terms))
+                for row in candidates
+            ]
@@ -0,0 +1,225 @@
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from .metadata_filter import MetadataColumns
+import numpy as np
+import json
+import os
+import threading
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, embedding, path=None):
+        self.embedding = embedding
+        self.path = path or os.environ.get(
+            "DOTA2_LOCAL_INDEX_DIR", os.path.join(".cache", "local_index"))
+        self.vectors_path = os.path.join(self.path, "vectors.npy")
+        self.documents_path = os.path.join(self.path, "documents.json")
+        self.lock = threading.RLock()
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.id_to_row = {}
+        # Rows are L2-normalized so cosine similarity is a single matmul.
+        # matrix is the used rows of vectors, which has room to grow and
+        # is the read-only memory map of the saved index until written.
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.matrix = self.vectors
+        self.columns = MetadataColumns()
+        # Writes stay in memory until flush(), so an insert saves the
+        # index once instead of after every batch.
+        self.dirty = False
+        self.load()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def load(self):
+        if not (os.path.exists(self.vectors_path)
+                and os.path.exists(self.documents_path)):
+            return
+
+        with open(self.documents_path, 'r', encoding='utf-8') as documents:
+            stored = json.load(documents)
+        self.ids = stored['ids']
+        self.texts = stored['texts']
+        self.metadatas = stored['metadatas']
+        self.id_to_row = {
+            document_id: row for row, document_id in enumerate(self.ids)}
+        self.vectors = np.load(self.vectors_path, mmap_mode='r')
+        self.matrix = self.vectors
+        self.columns = MetadataColumns(self.metadatas)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_vectors_path = f"{self.vectors_path}.tmp.npy"
+        np.save(tmp_vectors_path, np.ascontiguousarray(self.matrix))
+        tmp_documents_path = f"{self.documents_path}.tmp"
+        with open(tmp_documents_path, 'w', encoding='utf-8') as documents:
+            json.dump({
+                'ids': self.ids,
+                'texts': self.texts,
+                'metadatas': self.metadatas,
+            }, documents)
+        os.replace(tmp_vectors_path, self.vectors_path)
+        os.replace(tmp_documents_path, self.documents_path)
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self.save()
+                self.dirty = False
+
+    def reserve(self, rows, dimensions):
+        # Capacity doubles, so appending batches copies the vectors a
+        # logarithmic number of times.
+        if isinstance(self.vectors, np.memmap) \
+                or rows > self.vectors.shape[0] \
+                or self.vectors.shape[1] != dimensions:
+            if self.matrix.size and self.matrix.shape[1] != dimensions:
+                raise ValueError(f"Cannot add vectors of {dimensions} \
+dimensions to a local index of {self.matrix.shape[1]}.")
+            vectors = np.zeros(
+                (max(rows, 2 * self.vectors.shape[0]), dimensions),
+                dtype=np.float32)
+            if self.matrix.size:
+                vectors[:len(self.matrix)] = self.matrix
+            self.vectors = vectors
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(
+            texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    def add_documents(self, documents, **kwargs):
+        ids = kwargs.pop('ids', None) or [
+            document.id for document in documents]
+        return self.add_texts(
+            [document.page_content for document in documents],
+            [document.metadata for document in documents],
+            ids=ids, **kwargs)
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [None] * len(texts)
+        vectors = self.normalize(embeddings)
+
+        with self.lock:
+            self.reserve(len(self.ids) + len(texts), vectors.shape[1])
+            added_ids = []
+            for text, vector, metadata, document_id in zip(
+                    texts, vectors, metadatas, ids):
+                document_id = document_id or f"local-{len(self.ids)}"
+                row = self.id_to_row.get(document_id)
+                if row is None:
+                    row = len(self.ids)
+                    self.id_to_row[document_id] = row
+                    self.ids.append(document_id)
+                    self.texts.append(text)
+                    self.metadatas.append(dict(metadata))
+                    self.columns.append([metadata])
+                else:
+                    self.texts[row] = text
+                    self.metadatas[row] = dict(metadata)
+                    self.columns.set_row(row, metadata)
+                self.vectors[row] = vector
+                added_ids.append(document_id)
+
+            self.matrix = self.vectors[:len(self.ids)]
+            self.dirty = True
+
+        return added_ids
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+
+        with self.lock:
+            removed = {self.id_to_row[document_id] for document_id in ids
+                       if document_id in self.id_to_row}
+            if not removed:
+                return False
+
+            keep = [row for row in range(len(self.ids)) if row not in removed]
+            self.ids = [self.ids[row] for row in keep]
+            self.texts = [self.texts[row] for row in keep]
+            self.metadatas = [self.metadatas[row] for row in keep]
+            self.vectors = np.array(self.matrix[keep])
+            self.matrix = self.vectors
+            self.id_to_row = {
+                document_id: row for row, document_id in enumerate(self.ids)}
+            self.columns.keep(keep)
+            self.dirty = True
+        return True
+
+    def document(self, row):
+        return Document(
+            id=self.ids[row],
+            page_content=self.texts[row],
+            metadata=self.metadatas[row])
+
+    def get_by_ids(self, ids):
+        return [self.document(self.id_to_row[document_id])
+                for document_id in ids if document_id in self.id_to_row]
+
+    def similarity_search_with_score_by_vector(
+            self, embedding, k=4, filter=None, **kwargs):
+        with self.lock:
+            if not self.ids:
+                return []
+
+            query = self.normalize([embedding])[0]
+            scores = self.matrix @ query
+            candidates = np.flatnonzero(self.columns.mask(filter))
+            if candidates.size == 0:
+                return []
+
+            candidate_scores = scores[candidates]
+            k = min(k, candidates.size)
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+            top = top[np.argsort(-candidate_scores[top])]
+            return [(self.document(candidates[index]),
+                     float(candidate_scores[index])) for index in top]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None,
+                                    **kwargs):
+        return [document for document, _ in
+                self.similarity_search_with_score_by_vector(
+                    embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [document for document, _ in
+                self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None,
+                                            **kwargs):
+        return self.similarity_search_with_score_by_vector(
+            await self.embedding.aembed_query(query), k, filter)
+
+    async def asimilarity_search(self, query, k=4, filter=None, **kwargs):
+        return [document for document, _ in
+                await self.asimilarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None,
+                   path=None, **kwargs):
+        vector_store = cls(embedding, path=path)
+        vector_store.add_texts(texts, metadatas, ids=ids)
+        vector_store.flush()
+        return vector_store
@@ -0,0 +1,174 @@
+import numbers
+import numpy as np
+
+
+class MetadataColumns:
+    # Pinecone style metadata filters ({"type": "heroes"},
+    # {"patch_number": {"$in": [...]}}, {"$and": [...]}) evaluated against
+    # columnar arrays: numeric fields are float64 columns and every other
+    # field is an int32 column of codes into a small vocabulary. Columns
+    # grow by doubling, so rows are appended and updated in place.
+    def __init__(self, metadatas=()):
+        self.size = 0
+        self.capacity = 0
+        self.numeric_columns = {}
+        self.code_columns = {}
+        self.vocabularies = {}
+        self.append(metadatas)
+
+    def reserve(self, size):
+        if size <= self.capacity:
+            return
+        self.capacity = max(size, 2 * self.capacity)
+        for columns, empty in ((self.numeric_columns, np.nan),
+                               (self.code_columns, -1)):
+            for field, column in columns.items():
+                grown = np.full(self.capacity, empty, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                columns[field] = grown
+
+    def append(self, metadatas):
+        metadatas = list(metadatas)
+        start = self.size
+        self.reserve(start + len(metadatas))
+        self.size += len(metadatas)
+        for offset, metadata in enumerate(metadatas):
+            self.set_row(start + offset, metadata)
+
+    def set_row(self, row, metadata):
+        for column in self.numeric_columns.values():
+            column[row] = np.nan
+        for column in self.code_columns.values():
+            column[row] = -1
+
+        for field, value in metadata.items():
+            if value is None:
+                continue
+            if field in self.numeric_columns:
+                if self.is_number(value):
+                    self.numeric_columns[field][row] = float(value)
+                    continue
+                self.numeric_to_codes(field)
+            elif field not in self.code_columns and self.is_number(value):
+                self.numeric_columns[field] = np.full(
+                    self.capacity, np.nan, dtype=np.float64)
+                self.numeric_columns[field][row] = float(value)
+                continue
+
+            if field not in self.code_columns:
+                self.code_columns[field] = np.full(
+                    self.capacity, -1, dtype=np.int32)
+                self.vocabularies[field] = {}
+            self.code_columns[field][row] = self.vocabularies[
+                field].setdefault(str(value), len(self.vocabularies[field]))
+
+    def numeric_to_codes(self, field):
+        # A field with both numbers and strings is compared as strings.
+        column = self.numeric_columns.pop(field)
+        vocabulary = {}
+        codes = np.full(self.capacity, -1, dtype=np.int32)
+        for row in np.flatnonzero(~np.isnan(column[:self.size])):
+            value = column[row]
+            codes[row] = vocabulary.setdefault(
+                str(int(value)) if value.is_integer() else str(value),
+                len(vocabulary))
+        self.code_columns[field] = codes
+        self.vocabularies[field] = vocabulary
+
+    def keep(self, rows):
+        for columns in (self.numeric_columns, self.code_columns):
+            for field, column in columns.items():
+                columns[field] = column[rows]
+        self.size = self.capacity = len(rows)
+
+    @staticmethod
+    def is_number(value):
+        return isinstance(value, numbers.Number) and not isinstance(
+            value, bool)
+
+    def mask(self, metadata_filter):
+        if not metadata_filter:
+            return np.ones(self.size, dtype=bool)
+
+        mask = np.ones(self.size, dtype=bool)
+        for key, condition in metadata_filter.items():
+            if key == '$and':
+                for sub_filter in condition:
+                    mask &= self.mask(sub_filter)
+            elif key == '$or':
+                any_mask = np.zeros(self.size, dtype=bool)
+                for sub_filter in condition:
+                    any_mask |= self.mask(sub_filter)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for operator, value in condition.items():
+                    mask &= self.field_mask(key, operator, value)
+            else:
+                mask &= self.field_mask(key, '$eq', condition)
+        return mask
+
+    def field_mask(self, field, operator, value):
+        if field in self.numeric_columns:
+            return self.numeric_mask(
+                self.numeric_columns[field][:self.size], operator, value)
+        if field in self.code_columns:
+            return self.code_mask(field, operator, value)
+
+        # Unknown fields only match negative conditions.
+        matches = operator in ('$ne', '$nin') or (
+            operator == '$exists' and not value)
+        return np.full(self.size, matches, dtype=bool)
+
+    def numeric_mask(self, column, operator, value):
+        present = ~np.isnan(column)
+        if operator == '$exists':
+            return present if value else ~present
+        if operator in ('$in', '$nin'):
+            matches = np.isin(column, [float(item) for item in value])
+            return matches if operator == '$in' else ~matches
+
+        value = float(value)
+        if operator == '$eq':
+            return column == value
+        if operator == '$ne':
+            return column != value
+        if operator == '$gt':
+            return column > value
+        if operator == '$gte':
+            return column >= value
+        if operator == '$lt':
+            return column < value
+        if operator == '$lte':
+            return column <= value
+        raise ValueError(f"Unsupported filter operator: {operator}")
+
+    def code_mask(self, field, operator, value):
+        codes = self.code_columns[field][:self.size]
+        vocabulary = self.vocabularies[field]
+        present = codes >= 0
+        if operator == '$exists':
+            return present if value else ~present
+        if operator in ('$eq', '$ne'):
+            matches = codes == vocabulary.get(str(value), -2)
+            return matches if operator == '$eq' else ~matches
+        if operator in ('$in', '$nin'):
+            wanted = [vocabulary[str(item)] for item in value
+                      if str(item) in vocabulary]
+            matches = np.isin(codes, wanted)
+            return matches if operator == '$in' else ~matches
+
+        # Range comparisons are decided once per vocabulary entry and then
+        # broadcast to the rows through their codes.
+        comparisons = {
+            '$gt': lambda term: term > str(value),
+            '$gte': lambda term: term >= str(value),
+            '$lt': lambda term: term < str(value),
+            '$lte': lambda term: term <= str(value),
+        }
+        if operator not in comparisons:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+
+        by_code = np.array(
+            [comparisons[operator](term) for term in vocabulary] + [False],
+            dtype=bool)
+        return by_code[codes]
@@ -0,0 +1,124 @@
+from sqlalchemy import (Column, ForeignKey, Index, Integer, MetaData, String,
+                        Table, Text, create_engine, delete, event, func,
+                        or_, select)
+from sqlalchemy.dialects.sqlite import insert
+from ..fetcher.patch_versions import patch_sort_key
+import os
+
+metadata = MetaData()
+
+patches_table = Table(
+    'patches', metadata,
+    Column('patch_number', String, primary_key=True),
+    Column('patch_name', String),
+    Column('patch_timestamp', Integer),
+    Column('sort_key', Integer, nullable=False, index=True),
+)
+
+notes_table = Table(
+    'notes', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('patch_number', String, ForeignKey('patches.patch_number'),
+           nullable=False),
+    Column('sort_key', Integer, nullable=False),
+    Column('entity_type', String, nullable=False),
+    Column('entity_subtype', String, nullable=False),
+    Column('entity_id', Integer),
+    Column('entity_name', String, nullable=False),
+    Column('entity_key', String, nullable=False),
+    Column('ability_id', Integer),
+    Column('ability_name', String),
+    Column('ability_key', String),
+    Column('facet', String),
+    Column('position', Integer, nullable=False),
+    Column('note', Text, nullable=False),
+    Column('info', Text),
+    Index('ix_notes_entity', 'entity_key', 'sort_key'),
+    Index('ix_notes_ability', 'ability_key', 'sort_key'),
+    Index('ix_notes_patch', 'patch_number'),
+)
+
+
+class PatchDiffStore:
+    # Every note of every inserted patch as a row of (patch, entity,
+    # ability or facet, note, info), indexed by entity and patch order, so
+    # exact questions are answered by SQL instead of the vector store.
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(
+            "DOTA2_PATCH_DIFF_DB_PATH",
+            os.path.join(".cache", "patch_notes.sqlite3"))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        event.listen(self.engine, 'connect', self.configure_connection)
+        metadata.create_all(self.engine)
+
+    @staticmethod
+    def configure_connection(connection, connection_record):
+        # Readers (e.g. the query server) are not blocked by an insert.
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    @staticmethod
+    def normalize(name):
+        return ' '.join(name.lower().replace('’', "'").split()) \
+            if name else None
+
+    def __len__(self):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(notes_table)).scalar()
+
+    def replace_patch(self, patch_data, rows):
+        patch_number = patch_data['patch_number']
+        sort_key = patch_sort_key(patch_number)
+        note_rows = [{
+            **row,
+            'patch_number': patch_number,
+            'sort_key': sort_key,
+            'entity_key': self.normalize(row['entity_name']),
+            'ability_key': self.normalize(row['ability_name']),
+        } for row in rows]
+
+        with self.engine.begin() as connection:
+            connection.execute(delete(notes_table).where(
+                notes_table.c.patch_number == patch_number))
+            patch_row = {
+                'patch_number': patch_number,
+                'patch_name': patch_data.get('patch_name'),
+                'patch_timestamp': patch_data.get('patch_timestamp'),
+                'sort_key': sort_key,
+            }
+            connection.execute(
+                insert(patches_table).values(patch_row).on_conflict_do_update(
+                    index_elements=['patch_number'], set_=patch_row))
+            if note_rows:
+                connection.execute(insert(notes_table), note_rows)
+        return len(note_rows)
+
+    def patch_numbers(self):
+        with self.engine.connect() as connection:
+            return list(connection.execute(
+                select(patches_table.c.patch_number)
+                .order_by(patches_table.c.sort_key)).scalars())
+
+    def changes(self, name, min_sort_key=None, max_sort_key=None):
+        # Notes of a hero, item, general section or ability, latest patch
+        # first, in the order they appear in the patch notes.
+        key = self.normalize(name)
+        query = select(notes_table).where(or_(
+            notes_table.c.entity_key == key,
+            notes_table.c.ability_key == key))
+        if min_sort_key is not None:
+            query = query.where(notes_table.c.sort_key >= min_sort_key)
+        if max_sort_key is not None:
+            query = query.where(notes_table.c.sort_key <= max_sort_key)
+        query = query.order_by(
+            notes_table.c.sort_key.desc(), notes_table.c.id)
+
+        with self.engine.connect() as connection:
+            return [dict(row._mapping)
+                    for row in connection.execute(query)]
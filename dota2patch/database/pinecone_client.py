@@ -1,23 +1,74 @@
-from langchain_pinecone import Pinecone as LangchainPinecone
-from pinecone import ServerlessSpec
-from langchain.chains.query_constructor.schema import AttributeInfo
-from langchain.retrievers.self_query.base import SelfQueryRetriever
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .ingest_manifest import IngestManifest
+from .ingest_pipeline import IngestPipeline
 import time
 import os
+import warnings
+
+# langchain's Pinecone vector store keeps the page content under this
+# metadata key.
+SNAPSHOT_TEXT_KEY = 'text'
+# langchain-pinecone releases whose private async index attribute
+# apool_connections replaces; requirements.txt allows only these.
+POOLED_LANGCHAIN_PINECONE_VERSION = '0.2.'
 
 
 class PineconeClient:
-    def __init__(self, pinecone_client, embeddings_client, llm_client):
+    def __init__(self, pinecone_client, embeddings_client, llm_client,
+                 ingest_manifest=None, backend="pinecone",
+                 local_index_path=None, hybrid=True, rollups=True,
+                 rerank=True, rerank_candidates=50, rerank_top_n=3):
         self.pinecone_client = pinecone_client
+        self.hybrid = hybrid
+        self.rerank = rerank
+        self.rerank_candidates = rerank_candidates
+        self.rerank_top_n = rerank_top_n
+        self.lexical_index = None
+        self.rollups = rollups
+        self.rollup_store = None
+        self.backend = backend
+        self.local_index_path = local_index_path
+        self.local_vector_store = None
+        self.updated_patch_numbers = set()
         self.embeddings_client = embeddings_client
         self.llm_client = llm_client
+        self.ingest_manifest = ingest_manifest or IngestManifest()
         self.pinecone_index_name = os.environ.get(
             "PINECONE_INDEX_NAME", "dota2-patches-rag")
+        self.pinecone_namespace = os.environ.get(
+            "PINECONE_INDEX_NAMESPACE", "dota2-patches-v1")
+        self.upsert_batch_size = 100
+        self.max_batches_in_flight = 4
+        self.snapshot_chunk_size = 1000
         self.embedding_dimensions = 1536
         self.pinecone_cloud = "aws"
         self.pinecone_region = "us-east-1"
 
     def insert(self, all_patch_documents):
+        if self.backend == "local":
+            vector_store = self.get_vector_store()
+        else:
+            vector_store = self.get_or_create_pinecone_vector_store()
+
+        self.upsert_changed_documents(
+            vector_store, self.iter_documents(all_patch_documents))
+
+        print(f"Documents embedded and loaded into the {self.backend} index.")
+
+        return vector_store
+
+    def iter_documents(self, all_patch_documents):
+        # Accepts a flat stream of documents or lists of documents.
+        for documents in all_patch_documents:
+            if isinstance(documents, list):
+                yield from documents
+            else:
+                yield documents
+
+    def get_or_create_pinecone_vector_store(self):
+        from langchain_pinecone import Pinecone as LangchainPinecone
+        from pinecone import ServerlessSpec
+
         indexes = self.pinecone_client.list_indexes().names()
         if self.pinecone_index_name not in indexes:
             print(f"Creating Pinecone index: {self.pinecone_index_name}")
@@ -46,23 +97,236 @@ class PineconeClient:
             vector_store = LangchainPinecone.from_existing_index(
                 index_name=self.pinecone_index_name,
                 embedding=self.embeddings_client,
-                namespace=os.environ.get(
-                    "PINECONE_INDEX_NAMESPACE", "dota2-patches-v1"),
+                namespace=self.pinecone_namespace,
             )
         except Exception as e:
             raise RuntimeError(f"Cannot connect to langchain index: {e}")
 
-        for document in all_patch_documents:
-            vector_store.add_documents(documents=document)
+        return vector_store
+
+    def manifest_namespace(self):
+        if self.backend == "local":
+            return f"local:{os.path.abspath(self.get_vector_store().path)}"
+        return f"{self.pinecone_index_name}/{self.pinecone_namespace}"
+
+    def upsert_changed_documents(self, vector_store, documents):
+        ingest_pipeline = IngestPipeline(
+            vector_store,
+            self.ingest_manifest,
+            self.manifest_namespace(),
+            max_batch_size=self.upsert_batch_size,
+            max_in_flight=self.max_batches_in_flight,
+            lexical_index=self.get_lexical_index(),
+            rollup_store=self.get_rollup_store(),
+        )
+        stats = ingest_pipeline.run(documents)
+        self.updated_patch_numbers |= ingest_pipeline.updated_patch_numbers
+        return stats
+
+    def fetch_snapshot_chunk(self, index, ids, executor):
+        import numpy as np
 
-        print("Documents embedded and loaded into Pinecone.")
+        batches = [ids[start:start + self.upsert_batch_size]
+                   for start in range(0, len(ids), self.upsert_batch_size)]
+        vectors = {}
+        for response in executor.map(
+                lambda batch: index.fetch(
+                    ids=batch, namespace=self.pinecone_namespace),
+                batches):
+            vectors.update(response.vectors)
+
+        ids = [document_id for document_id in ids if document_id in vectors]
+        texts = []
+        metadatas = []
+        for document_id in ids:
+            metadata = dict(vectors[document_id].metadata or {})
+            texts.append(metadata.pop(SNAPSHOT_TEXT_KEY, ''))
+            # Pinecone returns every number as a float.
+            metadatas.append({
+                key: int(value) if isinstance(value, float)
+                and value.is_integer() else value
+                for key, value in metadata.items()})
+        return ids, texts, metadatas, np.array(
+            [vectors[document_id].values for document_id in ids],
+            dtype=np.float32)
+
+    def iter_snapshot_chunks(self):
+        if self.backend == "local":
+            vector_store = self.get_vector_store()
+            for start in range(0, len(vector_store.ids),
+                               self.snapshot_chunk_size):
+                end = start + self.snapshot_chunk_size
+                yield (vector_store.ids[start:end],
+                       vector_store.texts[start:end],
+                       vector_store.metadatas[start:end],
+                       vector_store.matrix[start:end])
+            return
+
+        index = self.get_vector_store().index
+        ids = []
+        with ThreadPoolExecutor(
+                max_workers=self.max_batches_in_flight) as executor:
+            for page in index.list(namespace=self.pinecone_namespace):
+                ids.extend(page)
+                if len(ids) >= self.snapshot_chunk_size:
+                    yield self.fetch_snapshot_chunk(index, ids, executor)
+                    ids = []
+            if ids:
+                yield self.fetch_snapshot_chunk(index, ids, executor)
+
+    def export_snapshot(self, path, dtype='float32'):
+        from .index_snapshot import IndexSnapshot
+
+        namespace = self.manifest_namespace()
+        snapshot = IndexSnapshot.write(
+            path, self.iter_snapshot_chunks(),
+            self.ingest_manifest.entries(namespace), namespace, dtype)
+        print(f"Exported {len(snapshot)} documents from the {self.backend} \
+index to {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB).")
+        return snapshot
+
+    def upsert_snapshot_vectors(self, index, chunks):
+        # Batches are upserted by a few threads with a bounded number in
+        # flight, like the ingest pipeline, but nothing is embedded.
+        import numpy as np
+
+        with ThreadPoolExecutor(
+                max_workers=self.max_batches_in_flight) as executor:
+            pending = set()
+            for documents, vectors in chunks:
+                vectors = np.asarray(vectors, dtype=np.float32)
+                for start in range(0, len(documents),
+                                   self.upsert_batch_size):
+                    if len(pending) >= self.max_batches_in_flight * 2:
+                        done, pending = wait(
+                            pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    batch = [
+                        (document.id, vector.tolist(),
+                         {**document.metadata,
+                          SNAPSHOT_TEXT_KEY: document.page_content})
+                        for document, vector in zip(
+                            documents[start:start + self.upsert_batch_size],
+                            vectors[start:start + self.upsert_batch_size])]
+                    pending.add(executor.submit(
+                        index.upsert, vectors=batch,
+                        namespace=self.pinecone_namespace,
+                        show_progress=False))
+            for future in pending:
+                future.result()
+
+    def import_snapshot(self, path, patch_registry=None):
+        # Loads a snapshot into the current backend and namespace along
+        # with the manifest entries, lexical index, rollups and patch
+        # registry, so the imported documents count as already inserted.
+        from langchain_core.documents import Document
+        from .index_snapshot import IndexSnapshot
+        from .process_data import ProcessData
+
+        snapshot = IndexSnapshot.load(path)
+        if self.backend == "local":
+            vector_store = self.get_vector_store()
+            dimensions = vector_store.matrix.shape[1] \
+                if vector_store.matrix.size else snapshot.header['dimensions']
+        else:
+            vector_store = self.get_or_create_pinecone_vector_store()
+            dimensions = self.embedding_dimensions
+        if len(snapshot) and snapshot.header['dimensions'] != dimensions:
+            raise RuntimeError(f"Snapshot {path} has vectors of \
+{snapshot.header['dimensions']} dimensions, the {self.backend} index has \
+{dimensions}.")
+
+        namespace = self.manifest_namespace()
+        lexical_index = self.get_lexical_index()
+        rollup_store = self.get_rollup_store()
+        snapshot_entries = snapshot.manifest_entries()
+        imported_entries = {}
+        patch_documents = {}
+
+        def iter_chunks():
+            for ids, texts, metadatas, vectors in snapshot.iter_chunks():
+                documents = [
+                    Document(id=document_id, page_content=text,
+                             metadata=metadata)
+                    for document_id, text, metadata in zip(
+                        ids, texts, metadatas)]
+                for document in documents:
+                    patch_number = document.metadata.get('patch_number')
+                    if patch_number not in patch_documents:
+                        patch_documents[patch_number] = []
+                        if patch_registry is not None \
+                                and patch_number is not None:
+                            patch_registry.register(document.metadata)
+                    patch_documents[patch_number].append(document)
+                    # Snapshots exported without a manifest get their
+                    # entries from the documents themselves.
+                    imported_entries[document.id] = snapshot_entries.get(
+                        document.id) or {
+                        'hash': IngestManifest.content_hash(document),
+                        'patch_number': patch_number,
+                    }
+                if lexical_index is not None:
+                    lexical_index.add_documents(documents)
+                yield documents, vectors
+
+        if self.backend == "local":
+            # Each chunk goes into the store's growing buffer as it is
+            # read, so only one chunk is decoded at a time, and the index
+            # is written once at the end.
+            for documents, vectors in iter_chunks():
+                vector_store.add_embeddings(
+                    [document.page_content for document in documents],
+                    vectors,
+                    [document.metadata for document in documents],
+                    [document.id for document in documents])
+            vector_store.flush()
+        else:
+            self.upsert_snapshot_vectors(vector_store.index, iter_chunks())
 
+        # Only recorded once every vector is stored.
+        self.ingest_manifest.entries(namespace).update(imported_entries)
+        self.ingest_manifest.save()
+        if lexical_index is not None:
+            lexical_index.save()
+        if rollup_store is not None:
+            for patch_number, documents in patch_documents.items():
+                rollup_store.replace_patch(
+                    patch_number,
+                    ProcessData().construct_rollup_documents(documents))
+            rollup_store.save()
+        self.updated_patch_numbers |= set(patch_documents) - {None}
+
+        print(f"Imported {len(snapshot)} documents from {path} into the \
+{self.backend} index.")
         return vector_store
 
+    def get_lexical_index(self):
+        if not self.hybrid:
+            return None
+
+        if self.lexical_index is None:
+            from .lexical_index import LexicalIndex
+
+            self.lexical_index = LexicalIndex(
+                namespace=self.manifest_namespace())
+        return self.lexical_index
+
+    def get_rollup_store(self):
+        if not self.rollups:
+            return None
+
+        if self.rollup_store is None:
+            from .rollup_store import RollupStore
+
+            self.rollup_store = RollupStore(
+                namespace=self.manifest_namespace())
+        return self.rollup_store
+
     def retrieve(self, vector_store):
         retriever = vector_store.as_retriever(
             search_kwargs={
-                'k': 3,  # Number of documents to retrieve
+                'k': self.rerank_top_n,  # Number of documents to retrieve
                 # Example filter:
                 # 'filter': {'type': 'heroes', 'patch_number': '7.38c'}
             }
@@ -71,12 +335,24 @@ class PineconeClient:
         return retriever
 
     def get_vector_store(self):
+        if self.backend == "local":
+            if self.local_vector_store is None:
+                from .local_vector_store import LocalVectorStore
+
+                self.local_vector_store = LocalVectorStore(
+                    self.embeddings_client, path=self.local_index_path)
+                print(f"Loaded {len(self.local_vector_store.ids)} documents \
+from the local index at {self.local_vector_store.path}")
+            return self.local_vector_store
+
+        from langchain_pinecone import Pinecone as LangchainPinecone
+
         print(f"Connecting to existing Pinecone index: {
               self.pinecone_index_name}")
         vector_store = LangchainPinecone(
             index_name=self.pinecone_index_name,
             embedding=self.embeddings_client,
-            namespace="dota2-patches-v1",
+            namespace=self.pinecone_namespace,
         )
 
         print("Successfully connected to existing Pinecone index \
@@ -84,7 +360,59 @@ class PineconeClient:
 
         return vector_store
 
-    def get_retriever_from_self_query_retriever(self, vector_store):
+    async def apool_connections(self, vector_store):
+        # Has to run on the event loop that serves the queries, since the
+        # aiohttp session is bound to it.
+        if self.backend == "local":
+            return None
+
+        # langchain_pinecone has no public way to give a vector store an
+        # open async index; the pinned 0.2 releases read it from the
+        # _async_index attribute. Other versions keep opening a client per
+        # query.
+        from importlib.metadata import version
+        langchain_pinecone_version = version('langchain-pinecone')
+        if not langchain_pinecone_version.startswith(
+                POOLED_LANGCHAIN_PINECONE_VERSION):
+            reason = "only 0.2 releases are supported"
+        elif not hasattr(vector_store, '_async_index'):
+            reason = "its vector store has no _async_index"
+        else:
+            reason = None
+        if reason is not None:
+            warnings.warn(
+                f"Not pooling Pinecone connections with langchain-pinecone "
+                f"{langchain_pinecone_version} ({reason}), opening one per "
+                f"query.", RuntimeWarning)
+            return None
+
+        from pinecone import PineconeAsyncio
+        from .pooled_async_index import PooledAsyncIndex
+
+        client = PineconeAsyncio(api_key=os.environ.get("PINECONE_API_KEY"))
+        pooled_index = PooledAsyncIndex(
+            client, client.IndexAsyncio(host=vector_store.index.config.host))
+        vector_store._async_index = pooled_index
+        return pooled_index
+
+    def indexed_patch_versions(self):
+        return sorted({
+            entry.get('patch_number') for entry in
+            self.ingest_manifest.entries(self.manifest_namespace()).values()
+        } - {None})
+
+    def get_retriever_from_self_query_retriever(
+            self, vector_store, query_parser=None, verbose=False):
+        from langchain.chains.query_constructor.schema import AttributeInfo
+        from langchain.retrievers.self_query.base import SelfQueryRetriever
+        from langchain_community.query_constructors.pinecone import (
+            PineconeTranslator)
+        from ..query.fast_self_query_retriever import FastSelfQueryRetriever
+        from ..query.hybrid_retriever import HybridRetriever
+        from ..query.entity_rollup_retriever import EntityRollupRetriever
+        from ..query.feature_reranker import FeatureReranker
+        from ..query.reranking_retriever import RerankingRetriever
+
         metadata_field_info = [
             AttributeInfo(
                 name="patch_name",
@@ -100,6 +428,15 @@ class PineconeClient:
                 patch encompasses those with and without patch version",
                 type="string",
             ),
+            AttributeInfo(
+                name="patch_sort_key",
+                description="The patch as a number that orders patches: \
+                major * 1000000 + minor * 1000 + patch version letter index \
+                (a = 1), e.g. 7.38 is 7038000 and 7.38c is 7038003. Use \
+                range comparisons on it for questions like since, after or \
+                before a patch",
+                type="integer",
+            ),
             AttributeInfo(
                 name="skill_name",
                 description="(Optional) The name of the skill that is being \
@@ -126,9 +463,77 @@ class PineconeClient:
 
         document_content_description = "Patch notes from the game, Dota 2"
 
-        return SelfQueryRetriever.from_llm(
+        lexical_index = self.get_lexical_index()
+        if lexical_index is not None and not len(lexical_index):
+            print("The lexical index is empty, run --insert to build it. \
+Using vector search only.")
+            lexical_index = None
+
+        # With reranking the retrievers return the whole candidate list,
+        # and the reranker keeps the final k.
+        k = self.rerank_candidates if self.rerank else self.rerank_top_n
+        fetch_k = max(k, HybridRetriever.model_fields['fetch_k'].default)
+        # The reranker scores the rank and recency of the candidates
+        # itself, so they come in fused relevance order without the
+        # recency bonus.
+        rerank_kwargs = {'recency_weight': 0.0, 'newest_first': False} \
+            if self.rerank else {}
+
+        # The local backend evaluates the same filter dialect as Pinecone.
+        self_query_retriever = SelfQueryRetriever.from_llm(
             self.llm_client,
             vector_store,
             document_content_description,
             metadata_field_info,
+            structured_query_translator=PineconeTranslator()
+            if self.backend == "local" else None,
+            # Fused and recency ranked results need a deeper vector ranking
+            # than the final k.
+            search_kwargs={'k': fetch_k}
+            if lexical_index is not None or query_parser is not None
+            else {'k': k},
+        )
+        if lexical_index is not None:
+            retriever = HybridRetriever(
+                vectorstore=vector_store,
+                lexical_index=lexical_index,
+                fallback_retriever=self_query_retriever,
+                query_parser=query_parser,
+                search_kwargs={'k': k},
+                fetch_k=fetch_k,
+                lexical_only_k=self.rerank_top_n,
+                **rerank_kwargs,
+                verbose=verbose,
+            )
+        elif query_parser is None:
+            retriever = self_query_retriever
+        else:
+            retriever = FastSelfQueryRetriever(
+                vectorstore=vector_store,
+                query_parser=query_parser,
+                fallback_retriever=self_query_retriever,
+                search_kwargs={'k': k},
+                fetch_k=fetch_k,
+                **rerank_kwargs,
+                verbose=verbose,
+            )
+        if self.rerank:
+            retriever = RerankingRetriever(
+                base_retriever=retriever,
+                reranker=FeatureReranker(top_n=self.rerank_top_n),
+                query_parser=query_parser,
+                verbose=verbose,
+            )
+
+        # Resolving entities needs the fast query parser.
+        rollup_store = self.get_rollup_store()
+        if query_parser is None or rollup_store is None \
+                or not len(rollup_store):
+            return retriever
+
+        return EntityRollupRetriever(
+            rollup_store=rollup_store,
+            query_parser=query_parser,
+            base_retriever=retriever,
+            verbose=verbose,
         )
@@ -0,0 +1,21 @@
+class PooledAsyncIndex:
+    # LangchainPinecone opens a new asyncio client, and its aiohttp
+    # session, for every async query and closes it afterwards. This keeps
+    # one index and its connection pool open across queries: the
+    # `async with` blocks of the vector store no longer close it.
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    async def __aenter__(self):
+        return self.index
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return None
+
+    async def close(self):
+        await self.index.close()
+        await self.client.close()
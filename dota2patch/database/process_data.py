@@ -1,71 +1,92 @@
 from langchain.docstore.document import Document
+from ..fetcher.patch_versions import patch_sort_key
 
 
 class ProcessData:
-    def load_and_process_data(self, json_data):
-        documents = []
-
-        for entry in json_data.get('items', []):
+    def iter_documents(self, entries):
+        # Consecutive entries share their PatchInfo, so the patch fields of
+        # the metadata are computed once per patch.
+        patch = None
+        for entry in entries:
+            if entry.patch is not patch:
+                patch = entry.patch
+                patch_metadata = {
+                    "patch_number": patch.patch_number,
+                    "patch_name": patch.patch_name,
+                    **self.patch_order_metadata(patch),
+                }
             page_content = self.construct_page_content(entry)
-            metadata = self.process_metadata(entry, page_content)
-            if metadata is None:
-                continue
-
-            documents.append(
-                Document(
-                    page_content=page_content,
-                    metadata=metadata))
+            yield Document(page_content=page_content, metadata=self
+                           .process_metadata(entry, page_content,
+                                             patch_metadata))
 
-        print(f"Loaded changes for {json_data.get('type', '')}")
-        return documents
-
-    def load_and_process_hero_data(self, json_data):
-        documents = []
+    def construct_rollup_documents(self, documents):
+        # One document per hero or item of a patch, listing every ability,
+        # facet or item change of that entity.
+        groups = {}
+        for document in documents:
+            metadata = document.metadata
+            if metadata.get('type') not in ('heroes', 'items'):
+                continue
+            groups.setdefault(
+                (metadata['type'], metadata['title']), []).append(document)
 
-        for hero_entries in json_data.get('items', []):
-            for entry in hero_entries:
-                page_content = self.construct_page_content(entry)
-                metadata = self.process_metadata(entry, page_content)
-                if metadata is None:
-                    continue
+        for (type_string, title), members in groups.items():
+            metadata = members[0].metadata
+            changes = []
+            for member in members:
+                prefix = f'Patch "{member.metadata["patch_name"]}" for {
+                    type_string}({member.metadata["subtype"]}): {title} - '
+                change = member.page_content.removeprefix(
+                    prefix).removeprefix(' - ')
+                if member.metadata['subtype'] == 'facets':
+                    change = f"Facet {change}"
+                changes.append(f"- {change}")
 
-                documents.append(
-                    Document(
-                        page_content=page_content,
-                        metadata=metadata))
+            page_content = f'Patch "{metadata["patch_name"]}" for {
+                type_string}: {title}\n' + '\n'.join(changes)
+            yield Document(page_content=page_content, metadata={
+                "patch_number": metadata["patch_number"],
+                "patch_name": metadata["patch_name"],
+                "type": type_string,
+                "subtype": "rollup",
+                "title": title,
+                "document_ids": [member.id for member in members],
+                "original_change_text": page_content,
+                **{field: metadata[field]
+                   for field in ("patch_sort_key", "patch_timestamp")
+                   if field in metadata},
+            })
 
-        print(f"Loaded changes for {json_data.get('type', '')}")
-        return documents
+    @staticmethod
+    def patch_order_metadata(patch):
+        # Numeric fields, so the vector store can filter patch ranges and
+        # retrieval can rank by recency.
+        order_metadata = {}
+        try:
+            order_metadata["patch_sort_key"] = patch_sort_key(
+                patch.patch_number)
+        except ValueError:
+            pass
+        if patch.patch_timestamp is not None:
+            order_metadata["patch_timestamp"] = patch.patch_timestamp
+        return order_metadata
 
     def construct_page_content(self, entry):
-        patch = entry.get("patch_metadata", {}).get("patch_name", "")
-        type_string = entry.get("type", "")
-        subtype = f"({entry.get('subtype')})" if 'subtype' in entry else ""
-        title = entry.get("title", "")
-        skill = f" - {entry.get('skill_name', '')}"
-        changes = entry.get("changes", "")
-        return f'Patch "{patch}" for {type_string}{subtype}: {
-            title}{skill} - {changes}'
-
-    def process_metadata(self, entry, page_content):
-        if not page_content:
-            print(
-                f"Skipping entry due to missing 'changes' field: {
-                    entry.get('title')}")
-            return None
+        subtype = f"({entry.subtype})" if entry.subtype is not None else ""
+        return f'Patch "{entry.patch.patch_name}" for {entry.type}{subtype}: \
+{entry.title} - {entry.skill_name or ''} - {entry.changes}'
 
+    def process_metadata(self, entry, page_content, patch_metadata):
         metadata = {
-            "patch_number": entry.get("patch_metadata", {})
-            .get("patch_number", "N/A"),
-            "patch_name": entry.get("patch_metadata", {})
-            .get("patch_name", "N/A"),
-            "type": entry.get("type", "N/A"),
-            "subtype": entry.get("subtype", "N/A"),
-            "title": entry.get("title", "N/A"),
+            **patch_metadata,
+            "type": entry.type,
+            "subtype": entry.subtype or "N/A",
+            "title": entry.title,
             # Storing the original text is good practice
             "original_change_text": page_content
         }
-        if "skill_name" in entry:
-            metadata["skill_name"] = entry["skill_name"]
+        if entry.skill_name is not None:
+            metadata["skill_name"] = entry.skill_name
 
         return metadata
@@ -0,0 +1,89 @@
+from langchain_core.documents import Document
+import hashlib
+import json
+import os
+import threading
+
+
+class RollupStore:
+    # Per (hero or item, patch) rollup documents built during ingest and
+    # fetched by their deterministic ID, without any similarity search.
+    def __init__(self, path=None, namespace=None):
+        self.path = path or os.environ.get(
+            "DOTA2_ROLLUP_STORE_DIR", os.path.join(".cache", "rollups"))
+        if namespace is not None:
+            # One store per vector store, keyed like the ingest manifest.
+            self.path = os.path.join(self.path, hashlib.sha1(
+                namespace.encode('utf-8')).hexdigest()[:16])
+        self.documents_path = os.path.join(self.path, "rollups.json")
+        self.lock = threading.RLock()
+        # rollup id -> {'page_content': ..., 'metadata': ...}
+        self.documents = {}
+        self.dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self.documents)
+
+    @staticmethod
+    def rollup_id(patch_number, type_string, title):
+        digest = hashlib.sha1(
+            f"{type_string}|{title}".encode('utf-8')).hexdigest()[:16]
+        return f"{patch_number}#rollup-{digest}"
+
+    def load(self):
+        try:
+            with open(self.documents_path, 'r', encoding='utf-8') as rollups:
+                self.documents = json.load(rollups)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            print(f"Ignoring unreadable rollup store {self.documents_path}: \
+{e}")
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = f"{self.documents_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as rollups:
+                json.dump(self.documents, rollups)
+            os.replace(tmp_path, self.documents_path)
+            self.dirty = False
+
+    def replace_patch(self, patch_number, rollup_documents):
+        with self.lock:
+            self.documents = {
+                rollup_id: stored
+                for rollup_id, stored in self.documents.items()
+                if stored['metadata'].get('patch_number') != patch_number
+            }
+            for document in rollup_documents:
+                metadata = document.metadata
+                self.documents[self.rollup_id(
+                    metadata['patch_number'], metadata['type'],
+                    metadata['title'])] = {
+                    'page_content': document.page_content,
+                    'metadata': metadata,
+                }
+            self.dirty = True
+
+    def get_by_ids(self, ids):
+        with self.lock:
+            return [
+                Document(id=rollup_id,
+                         page_content=self.documents[rollup_id][
+                             'page_content'],
+                         metadata=self.documents[rollup_id]['metadata'])
+                for rollup_id in ids if rollup_id in self.documents
+            ]
+
+    def lookup(self, patch_numbers, titles):
+        return self.get_by_ids([
+            self.rollup_id(patch_number, type_string, title)
+            for patch_number in patch_numbers
+            for title in titles
+            for type_string in ('heroes', 'items')
+        ])
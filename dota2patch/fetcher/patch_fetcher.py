@@ -1,107 +1,302 @@
+import asyncio
+import aiohttp
 import requests
-import json
-from ..parser.parse_patch_general_notes import ParsePatchGeneralNotes
-from ..parser.parse_patch_items import ParsePatchItems
-from ..parser.parse_patch_heroes import ParsePatchHeroes
+import orjson
+import os
+import queue
+import threading
+from ..parser.patch_notes_parser import PatchNotesParser
+from ..parser.lookup_tables import LookupTables
 from ..database.process_data import ProcessData
+from ..telemetry.latency_recorder import LatencyRecorder
+from .patch_versions import PATCH_VERSION_PATTERN
 
 
 class PatchFetcher():
-    def fetch_and_parse_json(self, url):
+    def __init__(self, datafeed_url=None, max_concurrency=8,
+                 response_cache=None, lookup_tables_path=None):
+        self.datafeed_url = (datafeed_url or os.environ.get(
+            "DOTA2_DATAFEED_URL",
+            "https://www.dota2.com/datafeed")).rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.response_cache = response_cache
+        self.request_timeout = 30
+        # Patch notes get amended after release, so they are always
+        # revalidated while the lookup lists use the cache TTL.
+        self.patch_notes_ttl = 0
+        self.lookup_tables_path = lookup_tables_path \
+            or LookupTables.default_path()
+
+    def patch_notes_url(self, patch_version):
+        return f'{self.datafeed_url}/patchnotes?version={
+            patch_version}&language=english'
+
+    def patch_list_url(self):
+        return f'{self.datafeed_url}/patchnoteslist?language=english'
+
+    def lookup_urls(self):
+        return [
+            f'{self.datafeed_url}/itemlist?language=english',
+            f'{self.datafeed_url}/herolist?language=english',
+            f'{self.datafeed_url}/abilitylist?language=english',
+        ]
+
+    def fetch_and_parse_json(self, url, ttl=None):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            json_data = response.json()
-            return json_data
+            body = self.fetch_body(url, ttl)
         except requests.exceptions.RequestException as e:
             print(f"Error fetching URL: {e}")
             return None
-        except json.JSONDecodeError as e:
+
+        return self.parse_json(body)
+
+    def fetch_body(self, url, ttl=None):
+        cache = self.response_cache
+        entry = cache.get(url) if cache is not None else None
+        if self.can_serve_from_cache(url, entry, ttl):
+            return entry.body
+        if cache is not None and cache.offline:
+            return None
+
+        response = requests.get(
+            url,
+            headers=cache.conditional_headers(entry) if cache else {},
+            timeout=self.request_timeout)
+        if response.status_code == 304 and entry is not None:
+            cache.revalidated(url, entry, response.headers)
+            return entry.body
+
+        response.raise_for_status()
+        if cache is not None:
+            cache.store(url, response.content, response.headers)
+        return response.content
+
+    def can_serve_from_cache(self, url, entry, ttl):
+        cache = self.response_cache
+        if cache is None:
+            return False
+
+        if entry is None:
+            if cache.offline:
+                print(f"Offline mode: {url} is not cached.")
+            return False
+
+        return cache.offline or cache.is_fresh(entry, ttl)
+
+    def parse_json(self, body):
+        if body is None:
+            return None
+
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError as e:
             print(f"Error decoding JSON: {e}")
-            print(f"Response text: {response.text}")
+            print(f"Response text: {body[:500]}")
             return None
 
-    def construct_all_patch_documents(self, patch_version):
-        parse_patch_general_notes = ParsePatchGeneralNotes()
-
-        # patch metadata
-        patch_data = self.fetch_and_parse_json(
-            f'https://www.dota2.com/datafeed/patchnotes?version={
-                patch_version}&language=english')
-        patch_metadata = {
-            'patch_number': patch_data['patch_number'],
-            'patch_name': patch_data['patch_name'],
-        }
-        general_notes = {
-            'type': 'General Notes',
-            'items': list(
-                map(
-                    lambda note: parse_patch_general_notes.parse(
-                        note, patch_metadata),
-                    patch_data.get('general_notes', []),
-                )
-            )
-        }
-
-        # patch item notes
-        item_data = self.fetch_and_parse_json(
-            "https://www.dota2.com/datafeed/itemlist?language=english")
-        parse_patch_items = ParsePatchItems(item_data)
-        item_notes = {
-            'type': 'Item Changes',
-            'items': list(
-                filter(
-                    lambda x: x is not None,
-                    map(
-                        lambda item: parse_patch_items.parse(
-                            item, patch_metadata, 'hero_items'),
-                        patch_data.get('items', []),
-                    )
-                )
-            )
-        }
-
-        neutral_item_notes = {
-            'type': 'Neutral Item Changes',
-            'items': list(
-                filter(
-                    lambda x: x is not None,
-                    map(
-                        lambda item: parse_patch_items.parse(
-                            item, patch_metadata, 'neutral_items'),
-                        patch_data.get('neutral_items', []),
-                    )
-                )
-            )
-        }
-
-        # hero item notes
-        hero_data = self.fetch_and_parse_json(
-            "https://www.dota2.com/datafeed/herolist?language=english")
-        ability_data = self.fetch_and_parse_json(
-            "https://www.dota2.com/datafeed/abilitylist?language=english")
-        parse_patch_heroes = ParsePatchHeroes(hero_data, ability_data)
-        hero_notes = {
-            'type': 'Heroes Changes',
-            'items': list(
-                filter(
-                    lambda x: x is not None,
-                    map(
-                        lambda item: parse_patch_heroes.parse(
-                            item, patch_metadata),
-                        patch_data.get('heroes', []),
-                    )
-                )
+    async def async_fetch_and_parse_json(
+            self, session, semaphore, url, ttl=None):
+        try:
+            body = await self.async_fetch_body(session, semaphore, url, ttl)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching URL {url}: {e}")
+            return None
+
+        return self.parse_json(body)
+
+    async def async_fetch_body(self, session, semaphore, url, ttl=None):
+        cache = self.response_cache
+        entry = cache.get(url) if cache is not None else None
+        if self.can_serve_from_cache(url, entry, ttl):
+            return entry.body
+        if cache is not None and cache.offline:
+            return None
+
+        async with semaphore:
+            async with session.get(
+                    url, headers=cache.conditional_headers(entry)
+                    if cache else {}) as response:
+                if response.status == 304 and entry is not None:
+                    cache.revalidated(url, entry, response.headers)
+                    return entry.body
+
+                response.raise_for_status()
+                body = await response.read()
+
+        if cache is not None:
+            cache.store(url, body, response.headers)
+        return body
+
+    async def async_fetch_all(self, patch_versions, fetch_lookup_lists=True):
+        lookup_urls = self.lookup_urls() if fetch_lookup_lists else []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            # The lookup lists are shared by every patch so they are only
+            # requested once, alongside all of the patchnotes requests.
+            results = await asyncio.gather(
+                *(self.async_fetch_and_parse_json(session, semaphore, url)
+                  for url in lookup_urls),
+                *(self.async_fetch_and_parse_json(
+                    session, semaphore, self.patch_notes_url(version),
+                    self.patch_notes_ttl)
+                  for version in patch_versions),
             )
-        }
 
-        process_data = ProcessData()
-        all_patch_documents = []
-        for patch_notes in [general_notes, item_notes, neutral_item_notes]:
-            all_patch_documents.append(
-                process_data.load_and_process_data(patch_notes))
+        lookup_lists = results[:len(lookup_urls)] or [None] * 3
+        return (*lookup_lists, dict(
+            zip(patch_versions, results[len(lookup_urls):])))
+
+    @staticmethod
+    def hand_over(fetched, item, stopped):
+        # Blocks while the parser is behind, unless it has stopped reading.
+        while not stopped.is_set():
+            try:
+                fetched.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    async def async_fetch_patches(self, patch_versions, fetched, stopped):
+        # max_concurrency workers each fetch one patch at a time and wait
+        # until it is handed over before fetching the next one.
+        pending = iter(patch_versions)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        loop = asyncio.get_running_loop()
+
+        async def worker(session):
+            for patch_version in pending:
+                if stopped.is_set():
+                    return
+                patch_data = await self.async_fetch_and_parse_json(
+                    session, semaphore, self.patch_notes_url(patch_version),
+                    self.patch_notes_ttl)
+                await loop.run_in_executor(
+                    None, self.hand_over, fetched,
+                    (patch_version, patch_data), stopped)
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await asyncio.gather(*(
+                worker(session) for _ in range(
+                    min(self.max_concurrency, len(patch_versions)))))
+
+    def iter_fetched_patches(self, patch_versions, stopped):
+        # (patch version, patch JSON or None) in the order the downloads
+        # finish. The downloads start right away; setting stopped ends
+        # them. At most max_concurrency patches wait in the queue and as
+        # many more in the fetching workers.
+        fetched = queue.Queue(maxsize=self.max_concurrency)
+        done = object()
+
+        def fetch():
+            try:
+                asyncio.run(self.async_fetch_patches(
+                    patch_versions, fetched, stopped))
+            except Exception as e:
+                self.hand_over(fetched, e, stopped)
+            finally:
+                self.hand_over(fetched, done, stopped)
+
+        def drain():
+            while True:
+                with LatencyRecorder.stage('fetch'):
+                    item = fetched.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise RuntimeError(
+                        f"Cannot fetch patch notes: {item}") from item
+                yield item
+
+        # A daemon thread, so a consumer that stops early never waits for
+        # requests still in flight.
+        threading.Thread(target=fetch, name="patch-fetch",
+                         daemon=True).start()
+        return drain()
+
+    def fetch_patch_versions(self):
+        with LatencyRecorder.stage('fetch patch list'):
+            patch_list = self.fetch_and_parse_json(
+                self.patch_list_url(), self.patch_notes_ttl)
+        if patch_list is None:
+            raise RuntimeError("Cannot fetch the list of patches.")
+
+        return [
+            patch['patch_number'] for patch in patch_list.get('patches', [])
+            if PATCH_VERSION_PATTERN.match(patch.get('patch_number', ''))
+        ]
+
+    def cached_lookup_tables(self):
+        # The compiled tables follow the lookup lists' cache TTL; without a
+        # response cache they are rebuilt from freshly fetched lists.
+        cache = self.response_cache
+        if cache is None:
+            return None
+
+        lookup_tables = LookupTables.load(self.lookup_tables_path)
+        if lookup_tables is None or not (
+                cache.offline or lookup_tables.age() <= cache.ttl):
+            return None
+        return lookup_tables
+
+    def build_lookup_tables(self, item_data, hero_data, ability_data):
+        if item_data is None or hero_data is None or ability_data is None:
+            raise RuntimeError("Cannot fetch the item, hero or ability list.")
+        return LookupTables.build(
+            self.lookup_tables_path, item_data, hero_data, ability_data)
+
+    def fetch_lookup_tables(self):
+        return self.fetch_lookup_tables_and_patches([])[0]
+
+    def fetch_lookup_tables_and_patches(self, patch_versions):
+        lookup_tables = self.cached_lookup_tables()
+        if lookup_tables is not None and not patch_versions:
+            return lookup_tables, {}
+
+        with LatencyRecorder.stage('fetch', documents=len(patch_versions)):
+            item_data, hero_data, ability_data, patches = asyncio.run(
+                self.async_fetch_all(patch_versions, lookup_tables is None))
+        if lookup_tables is None:
+            with LatencyRecorder.stage('build lookup tables'):
+                lookup_tables = self.build_lookup_tables(
+                    item_data, hero_data, ability_data)
+        return lookup_tables, patches
+
+    def construct_all_patch_documents(self, patch_versions):
+        return [list(self.iter_all_patch_documents(patch_versions))]
+
+    def iter_all_patch_documents(self, patch_versions,
+                                 patch_diff_store=None, patch_registry=None):
+        if isinstance(patch_versions, str):
+            patch_versions = [patch_versions]
+
+        # Patches are downloaded in the background while the lookup tables
+        # load, and each one is parsed as soon as it arrives.
+        stopped = threading.Event()
+        fetched_patches = self.iter_fetched_patches(patch_versions, stopped)
+        try:
+            # Only the compiled lookup tables are kept, never the raw lists.
+            lookup_tables = self.fetch_lookup_tables()
+            patch_notes_parser = PatchNotesParser(lookup_tables)
+            process_data = ProcessData()
+
+            for patch_version, patch_data in fetched_patches:
+                if patch_data is None:
+                    print(f"Skipping patch {patch_version}: no patch notes.")
+                    continue
 
-        all_patch_documents.append(
-            process_data.load_and_process_hero_data(hero_notes))
+                # One walk over the JSON gives the entries and, for the
+                # patch diff store, the note rows.
+                rows = [] if patch_diff_store is not None else None
+                entries = list(patch_notes_parser.parse(patch_data, rows))
+                if patch_registry is not None:
+                    patch_registry.register(patch_data)
+                if patch_diff_store is not None:
+                    with LatencyRecorder.stage('patch diff store'):
+                        patch_diff_store.replace_patch(patch_data, rows)
 
-        return all_patch_documents
+                yield from process_data.iter_documents(entries)
+                print(f"Parsed patch {patch_version}")
+        finally:
+            stopped.set()
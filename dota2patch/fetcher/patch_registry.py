@@ -0,0 +1,62 @@
+import json
+import os
+from .patch_versions import patch_sort_key
+
+
+class PatchRegistry:
+    # Every inserted patch with its numeric sort key and release time, so
+    # queries can order patches and resolve ranges without the datafeed.
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(
+            "DOTA2_PATCH_REGISTRY_PATH",
+            os.path.join(".cache", "patch_registry.json"))
+        # patch number -> {'patch_name', 'patch_timestamp', 'sort_key'}
+        self.patches = self.load()
+
+    def __len__(self):
+        return len(self.patches)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as registry_file:
+                return json.load(registry_file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            print(f"Ignoring unreadable patch registry {self.path}: {e}")
+            return {}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as registry_file:
+            json.dump(self.patches, registry_file)
+        os.replace(tmp_path, self.path)
+
+    def register(self, patch_data):
+        patch_number = patch_data['patch_number']
+        entry = {
+            'patch_name': patch_data.get('patch_name', patch_number),
+            'patch_timestamp': patch_data.get('patch_timestamp'),
+            'sort_key': patch_sort_key(patch_number),
+        }
+        if self.patches.get(patch_number) != entry:
+            self.patches[patch_number] = entry
+            self.save()
+
+    def release_key(self, patch_number):
+        # Release time first; patches without one fall back to the version
+        # order, which matches the release order of the datafeed.
+        entry = self.patches[patch_number]
+        return entry['patch_timestamp'] or 0, entry['sort_key']
+
+    def versions(self):
+        # Oldest release first.
+        return sorted(self.patches, key=self.release_key)
+
+    def latest(self):
+        versions = self.versions()
+        return versions[-1] if versions else None
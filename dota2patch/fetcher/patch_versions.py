@@ -0,0 +1,60 @@
+import re
+
+PATCH_VERSION_PATTERN = re.compile(r'^(\d+)\.(\d+)([a-z]?)$')
+# A patch letter is one step of the sort key, so 7.38a-z follow 7.38.
+LETTER_PATCHES = 26
+
+
+def patch_sort_key(patch_version):
+    match = PATCH_VERSION_PATTERN.match(patch_version.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid patch version: '{patch_version}'")
+
+    major, minor, letter = match.groups()
+    letter_index = ord(letter) - ord('a') + 1 if letter else 0
+    return int(major) * 1_000_000 + int(minor) * 1_000 + letter_index
+
+
+def patch_family_range(patch_version):
+    # '7.38' covers 7.38 and its lettered patches, '7.38c' only itself.
+    sort_key = patch_sort_key(patch_version)
+    if patch_version.strip()[-1].isalpha():
+        return sort_key, sort_key
+    return sort_key, sort_key + LETTER_PATCHES
+
+
+def needs_patch_list(spec):
+    return '..' in spec
+
+
+def expand_patch_versions(spec, known_versions=None):
+    # Accepts "7.38", "7.37,7.38c" or ranges such as "7.33..7.38c". Ranges
+    # are inclusive and expanded against the published patch list.
+    patch_versions = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+
+        if '..' not in part:
+            patch_sort_key(part)
+            patch_versions.append(part)
+            continue
+
+        if known_versions is None:
+            raise RuntimeError(
+                f"Cannot expand '{part}' without the list of patches.")
+
+        start, end = (bound.strip() for bound in part.split('..', 1))
+        start_key = patch_sort_key(start) if start else 0
+        end_key = patch_sort_key(end) if end else float('inf')
+        if start_key > end_key:
+            raise RuntimeError(f"Invalid patch range: '{part}'")
+
+        patch_versions.extend(
+            version for version in sorted(known_versions, key=patch_sort_key)
+            if start_key <= patch_sort_key(version) <= end_key
+        )
+
+    # Keep the requested order but drop duplicates from overlapping ranges.
+    return list(dict.fromkeys(patch_versions))
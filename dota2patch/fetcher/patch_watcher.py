@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import time
+import requests
+from .patch_versions import expand_patch_versions, patch_sort_key
+
+
+class PatchWatcher:
+    # Polls the datafeed and inserts only the patches that are new or whose
+    # notes were amended since the last poll. Requests are conditional
+    # (ETag/Last-Modified through the response cache), so a quiet poll is a
+    # handful of 304s, and unchanged documents are never re-embedded. The
+    # hash of every patch's notes and the poll interval are kept in a cursor
+    # file, so a restarted watcher carries on where it stopped.
+    def __init__(self, client_factory, cursor_path=None, min_interval=300,
+                 max_interval=3600, recheck_patches=3, patch_version=''):
+        self.client_factory = client_factory
+        self.patch_fetcher = client_factory.patch_fetcher()
+        if self.patch_fetcher.response_cache is None \
+                or self.patch_fetcher.response_cache.offline:
+            raise RuntimeError("--watch needs the datafeed response cache \
+online, it cannot be used with --no-cache or --offline.")
+        self.cursor_path = cursor_path or os.environ.get(
+            "DOTA2_WATCH_CURSOR_PATH",
+            os.path.join(".cache", "watch_cursor.json"))
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        # Valve amends the notes of recent patches; older ones are only
+        # fetched when they first appear.
+        self.recheck_patches = recheck_patches
+        self.patch_version = patch_version
+        # 'patches': patch number -> sha256 of its inserted notes
+        self.cursor = self.load_cursor()
+
+    def load_cursor(self):
+        try:
+            with open(self.cursor_path, 'r', encoding='utf-8') as cursor_file:
+                cursor = json.load(cursor_file)
+        except FileNotFoundError:
+            cursor = {}
+        except json.JSONDecodeError as e:
+            print(f"Ignoring unreadable watch cursor {self.cursor_path}: {e}")
+            cursor = {}
+        cursor.setdefault('patches', {})
+        cursor.setdefault('interval', self.min_interval)
+        return cursor
+
+    def save_cursor(self):
+        directory = os.path.dirname(self.cursor_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.cursor_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as cursor_file:
+            json.dump(self.cursor, cursor_file)
+        os.replace(tmp_path, self.cursor_path)
+
+    def tracked_versions(self, published_versions):
+        # Inserted and already watched patches, everything published after
+        # the newest of them, and the patches of --patch-version. With
+        # nothing inserted yet, the latest published patch.
+        tracked = set(self.client_factory.patch_registry().versions()) \
+            | set(self.cursor['patches'])
+        if self.patch_version:
+            tracked |= set(expand_patch_versions(
+                self.patch_version, published_versions))
+        if tracked:
+            newest = max(patch_sort_key(version) for version in tracked)
+            tracked |= {version for version in published_versions
+                        if patch_sort_key(version) > newest}
+        elif published_versions:
+            tracked.add(max(published_versions, key=patch_sort_key))
+        return sorted(tracked, key=patch_sort_key)
+
+    def notes_hash(self, patch_version):
+        try:
+            body = self.patch_fetcher.fetch_body(
+                self.patch_fetcher.patch_notes_url(patch_version),
+                self.patch_fetcher.patch_notes_ttl)
+        except requests.exceptions.RequestException as e:
+            # Listed patches can be missing their notes for a while.
+            print(f"Cannot fetch patch notes {patch_version}: {e}")
+            return None
+        return hashlib.sha256(body).hexdigest() if body else None
+
+    def poll(self):
+        # {patch number: notes hash} of the new and amended patches.
+        tracked = self.tracked_versions(
+            self.patch_fetcher.fetch_patch_versions())
+        recent = tracked[-self.recheck_patches:] \
+            if self.recheck_patches > 0 else []
+        changed = {}
+        for patch_version in tracked:
+            if patch_version in self.cursor['patches'] \
+                    and patch_version not in recent:
+                continue
+            notes_hash = self.notes_hash(patch_version)
+            if notes_hash is not None \
+                    and notes_hash != self.cursor['patches'].get(
+                        patch_version):
+                changed[patch_version] = notes_hash
+        return changed
+
+    def next_interval(self, changed):
+        # Back to the shortest interval after a change, since amendments
+        # follow a release; doubled after every quiet poll.
+        if changed:
+            return self.min_interval
+        return min(self.cursor['interval'] * 2, self.max_interval)
+
+    def cycle(self):
+        # Patches inserted by other processes since the last poll are in
+        # the registry on disk.
+        self.client_factory.reload_ingest_state()
+        changed = self.poll()
+        if changed:
+            new = [version for version in changed
+                   if version not in self.cursor['patches']]
+            print(f"New patches: {', '.join(new) or 'none'}; amended: \
+{', '.join(sorted(set(changed) - set(new), key=patch_sort_key)) or 'none'}")
+            if self.client_factory.insert(','.join(changed), blocking=False):
+                self.cursor['patches'].update(changed)
+            else:
+                print("Another insert is running, retrying at the next \
+poll.")
+        self.cursor['interval'] = self.next_interval(changed)
+        self.cursor['polled_at'] = time.time()
+        self.save_cursor()
+        return changed
+
+    def run(self, once=False):
+        while True:
+            try:
+                changed = self.cycle()
+                if not changed:
+                    print(f"No new or amended patches, next poll in \
+{self.cursor['interval']} s.")
+            except Exception as e:
+                # An unreachable datafeed or a failed insert: back off like
+                # a quiet poll and retry, the cursor still has the patches
+                # as they were before.
+                print(f"Watch poll failed: {e}")
+                self.cursor['interval'] = self.next_interval({})
+            if once:
+                return
+            time.sleep(self.cursor['interval'])
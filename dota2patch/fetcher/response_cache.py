@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import time
+import zstandard
+
+
+class CachedResponse:
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=None, ttl=24 * 60 * 60, offline=False):
+        self.cache_dir = cache_dir or os.environ.get(
+            "DOTA2_CACHE_DIR", os.path.join(".cache", "datafeed"))
+        self.ttl = ttl
+        self.offline = offline
+        self.compression_level = 10
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, url):
+        key = self._key(url)
+        return (os.path.join(self.cache_dir, f"{key}.json.zst"),
+                os.path.join(self.cache_dir, f"{key}.meta.json"))
+
+    def get(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+            with open(body_path, 'rb') as body_file:
+                body = zstandard.ZstdDecompressor().decompress(
+                    body_file.read())
+        except (OSError, ValueError, zstandard.ZstdError):
+            return None
+
+        return CachedResponse(meta, body)
+
+    def is_fresh(self, entry, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() - entry.meta.get('fetched_at', 0) < ttl
+
+    def conditional_headers(self, entry):
+        if entry is None:
+            return {}
+
+        headers = {}
+        if entry.meta.get('etag'):
+            headers['If-None-Match'] = entry.meta['etag']
+        if entry.meta.get('last_modified'):
+            headers['If-Modified-Since'] = entry.meta['last_modified']
+        return headers
+
+    def store(self, url, body, headers):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        body_path, meta_path = self._paths(url)
+        compressed = zstandard.ZstdCompressor(
+            level=self.compression_level).compress(body)
+        self._write_atomic(body_path, compressed)
+        self._write_meta(meta_path, {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'size': len(body),
+            'sha256': hashlib.sha256(body).hexdigest(),
+        })
+
+    def revalidated(self, url, entry, headers):
+        # A 304 only refreshes the validators and the age of the entry.
+        _, meta_path = self._paths(url)
+        meta = dict(entry.meta)
+        meta['etag'] = headers.get('ETag') or meta.get('etag')
+        meta['last_modified'] = headers.get(
+            'Last-Modified') or meta.get('last_modified')
+        meta['fetched_at'] = time.time()
+        self._write_meta(meta_path, meta)
+        entry.meta = meta
+
+    def _write_meta(self, path, meta):
+        self._write_atomic(path, json.dumps(meta).encode('utf-8'))
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
@@ -1,82 +1,259 @@
+import asyncio
 import click
 import os
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from pinecone import Pinecone
 from dotenv import load_dotenv
 
-
-from .fetcher.patch_fetcher import PatchFetcher
-from .database.pinecone_client import PineconeClient
-from .ragchain.retrieval_chain import RetrievalChain
-from .query.chat_query import ChatQuery
+# Only light modules are imported here; langchain, openai, pinecone and
+# numpy are loaded by the ClientFactory when a client is first needed.
+from .client_factory import ClientFactory
+from .telemetry.startup_profiler import StartupProfiler
 
 load_dotenv()
 
 
-def continually_query_user(chat_query, verbose):
+def continually_query_user(chat_query_future, verbose, profiler=None):
     print("Enter your query. Press Ctrl+C to exit.")
     print("\tExample: What are the changes to Ripper's Lash in patch 7.38c.")
-    while True:
-        try:
-            user_input = input("> ")
+    if profiler:
+        profiler.mark("prompt shown")
+        print(f"Prompt ready in {profiler.elapsed_ms():.0f} ms.")
+    # One event loop for the whole session, so Ctrl+C during an answer
+    # only cancels that answer and Ctrl+C at the prompt exits.
+    with asyncio.Runner() as runner:
+        while True:
+            try:
+                user_input = input("> ")
+            except KeyboardInterrupt:
+                print("\nCancelled. Exiting program.")
+                break
 
-            if user_input.strip():  # Check if the input is not just whitespace
-                print(f"You entered: '{user_input}'")
-                chat_query.ask_question(user_input, verbose)
-            else:
+            except EOFError:
+                print("\nInput stream closed. Exiting.")
+                break
+
+            # Check if the input is not just whitespace
+            if not user_input.strip():
                 print("Please enter a query.")
-        except KeyboardInterrupt:
-            print("\nCancelled. Exiting program.")
-            break
+                continue
 
-        except EOFError:
-            print("\nInput stream closed. Exiting.")
-            break
+            try:
+                print(f"You entered: '{user_input}'")
+                # The clients are built in the background while the user
+                # types, so only the first question may have to wait.
+                if not chat_query_future.done():
+                    print("Waiting for the clients to finish loading...")
+                chat_query = chat_query_future.result()
+                runner.run(chat_query.aask_question(user_input, verbose))
+            except KeyboardInterrupt:
+                print("\nGeneration cancelled.")
 
-        except Exception as e:
-            print(f"An error occurred: {e}")
+            except Exception as e:
+                print(f"An error occurred: {e}")
 
 
 @click.command()
 @click.option('--insert', is_flag=True, show_default=True, default=False,
               help='Flag to insert vector embeddings into pinecone')
 @click.option('--patch-version', default='',
-              help='Patch version to insert. Must be with --insert')
+              help='Patch version(s) to insert, e.g. 7.38, 7.37,7.38c or \
+7.33..7.38c. Must be with --insert')
+@click.option('--import-snapshot', default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help='Load an index snapshot into the --backend index before \
+anything else, instead of embedding its patches again')
+@click.option('--export-snapshot', default=None,
+              help='Write the --backend index to this snapshot file after \
+any insert')
+@click.option('--snapshot-dtype', type=click.Choice(['float32', 'float16']),
+              default='float32', show_default=True,
+              help='Precision of the vectors in --export-snapshot. float16 \
+halves the file size')
+@click.option('--max-concurrency', default=8, show_default=True,
+              help='Maximum number of concurrent datafeed requests')
+@click.option('--cache-ttl', default=24 * 60 * 60, show_default=True,
+              help='Seconds before cached item/hero/ability lists are \
+revalidated')
+@click.option('--offline', is_flag=True, show_default=True, default=False,
+              help='Serve datafeed responses only from the local cache')
+@click.option('--no-cache', is_flag=True, show_default=True, default=False,
+              help='Disable the local datafeed response cache')
+@click.option('--embedding-cache-size', default=20_000, show_default=True,
+              help='Maximum number of embeddings kept in the local cache. \
+0 disables the cache')
+@click.option('--backend', type=click.Choice(['pinecone', 'local']),
+              default='pinecone', show_default=True,
+              help='Vector store backend. "local" keeps the index in \
+memory and on disk instead of Pinecone')
+@click.option('--fast-query/--no-fast-query', default=True, show_default=True,
+              help='Build metadata filters for questions naming a patch, \
+hero, item or ability without the LLM query constructor')
+@click.option('--hybrid/--no-hybrid', default=True, show_default=True,
+              help='Fuse BM25 hits from the local lexical index with vector \
+search results')
+@click.option('--rollups/--no-rollups', default=True, show_default=True,
+              help='Answer questions about a hero or item in a given patch \
+from its per-patch rollup document')
+@click.option('--rerank/--no-rerank', default=True, show_default=True,
+              help='Retrieve --rerank-candidates documents and keep the \
+--rerank-top-n best by a local feature reranker')
+@click.option('--rerank-candidates', default=50, show_default=True,
+              help='Documents retrieved before reranking')
+@click.option('--rerank-top-n', default=3, show_default=True,
+              help='Documents passed to the answer prompt')
+@click.option('--exact-query/--no-exact-query', default=True,
+              show_default=True,
+              help='Answer questions listing or diffing the changes to one \
+hero, item or ability from the local patch diff store, without the LLM')
+@click.option('--context-tokens', default=3000, show_default=True,
+              help='Token budget for the retrieved context in the answer \
+prompt')
+@click.option('--answer-cache-size', default=256, show_default=True,
+              help='Maximum number of cached answers. 0 disables the cache')
+@click.option('--answer-cache-ttl', default=7 * 24 * 60 * 60,
+              show_default=True, help='Seconds before a cached answer expires')
+@click.option('--answer-similarity-threshold', default=0.95,
+              show_default=True,
+              help='Minimum cosine similarity to reuse the answer of a \
+near-identical question')
+@click.option('--stream/--no-stream', default=True, show_default=True,
+              help='Print answer tokens as they are generated')
+@click.option('--questions-file', default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help='JSONL file of questions to answer instead of prompting')
+@click.option('--output-file', default=None,
+              help='JSONL file for --questions-file answers. Defaults to \
+<questions file>.answers.jsonl')
+@click.option('--concurrency', default=4, show_default=True,
+              help='Questions answered at the same time with \
+--questions-file or --serve')
+@click.option('--resume', is_flag=True, show_default=True, default=False,
+              help='Skip questions already answered in --output-file')
+@click.option('--serve', is_flag=True, show_default=True, default=False,
+              help='Answer questions over HTTP instead of prompting')
+@click.option('--host', default='127.0.0.1', show_default=True,
+              help='Address the --serve server listens on')
+@click.option('--port', default=8080, show_default=True,
+              help='Port the --serve server listens on')
+@click.option('--max-pending', default=64, show_default=True,
+              help='Questions waiting or running before --serve rejects \
+new ones with 503')
+@click.option('--watch', is_flag=True, show_default=True, default=False,
+              help='Poll the datafeed and insert new and amended patches \
+instead of prompting')
+@click.option('--watch-interval', default=300, show_default=True,
+              help='Seconds between --watch polls right after a change')
+@click.option('--watch-max-interval', default=3600, show_default=True,
+              help='Longest seconds between --watch polls while nothing \
+changes')
+@click.option('--watch-once', is_flag=True, show_default=True, default=False,
+              help='Poll once and exit, e.g. from cron')
+@click.option('--import-profile', is_flag=True, show_default=True,
+              default=False,
+              help='Report where startup time goes when exiting')
+@click.option('--profile', is_flag=True, show_default=True, default=False,
+              help='Time every query and insert stage and print a \
+per-query breakdown with p50/p95 summaries when exiting')
+@click.option('--profile-output', default=None,
+              help='Also write the recorded timings to this file')
+@click.option('--profile-format', type=click.Choice(['jsonl', 'openmetrics']),
+              default='jsonl', show_default=True,
+              help='Format of --profile-output: JSON lines, one per query \
+or insert, or an OpenMetrics text file')
 @click.option('--verbose', is_flag=True, show_default=True, default=False,
               help='Verbose flag for showing retrieved documents')
-def get_data(insert, patch_version, verbose):
+def get_data(insert, patch_version, import_snapshot, export_snapshot,
+             snapshot_dtype, max_concurrency, cache_ttl, offline,
+             no_cache, embedding_cache_size, backend, fast_query, hybrid,
+             rollups, rerank, rerank_candidates, rerank_top_n, exact_query,
+             context_tokens, answer_cache_size,
+             answer_cache_ttl, answer_similarity_threshold, stream,
+             questions_file, output_file, concurrency, resume, serve, host,
+             port, max_pending, watch, watch_interval, watch_max_interval,
+             watch_once, import_profile, profile, profile_output,
+             profile_format, verbose):
     if (insert and patch_version == ''):
         raise RuntimeError(
             "Add --patch-version if you are going to insert data.")
+    if (offline and no_cache):
+        raise RuntimeError("--offline cannot be used with --no-cache.")
+    if (serve and questions_file):
+        raise RuntimeError("--serve cannot be used with --questions-file.")
+    if (watch and (serve or questions_file)):
+        raise RuntimeError(
+            "--watch cannot be used with --serve or --questions-file.")
 
-    patch_fetcher = PatchFetcher()
+    profiler = StartupProfiler(
+        (click.get_current_context().obj or {}).get('started_at'))
+    if import_profile:
+        # Heavy modules are only imported from here on, by the clients.
+        profiler.track_imports()
+    profiler.mark("command line parsed")
+    client_factory = ClientFactory({
+        'max_concurrency': max_concurrency,
+        'cache_ttl': cache_ttl,
+        'offline': offline,
+        'no_cache': no_cache,
+        'embedding_cache_size': embedding_cache_size,
+        'backend': backend,
+        'fast_query': fast_query,
+        'hybrid': hybrid,
+        'rollups': rollups,
+        'rerank': rerank,
+        'rerank_candidates': rerank_candidates,
+        'rerank_top_n': rerank_top_n,
+        'exact_query': exact_query,
+        'context_tokens': context_tokens,
+        'answer_cache_size': answer_cache_size,
+        'answer_cache_ttl': answer_cache_ttl,
+        'answer_similarity_threshold': answer_similarity_threshold,
+        # Answers in batch and server mode are never printed, so they are
+        # not streamed.
+        'stream': stream and questions_file is None and not serve,
+        'profile': profile or profile_output is not None,
+        'verbose': verbose,
+    }, profiler)
 
-    llm_client = ChatOpenAI(
-        openai_api_key=os.environ.get("OPENAI_API_KEY"),
-        model_name="gpt-4.1-mini",
-        temperature=0)
+    if import_snapshot:
+        client_factory.import_snapshot(import_snapshot)
+    if insert:
+        client_factory.insert(patch_version)
+    if export_snapshot:
+        client_factory.export_snapshot(export_snapshot, snapshot_dtype)
 
-    pinecone_instance = PineconeClient(
-        Pinecone(api_key=os.environ.get("PINECONE_API_KEY")),
-        OpenAIEmbeddings(
-            openai_api_key=os.environ.get("OPENAI_API_KEY"),
-            model="text-embedding-3-small"),
-        llm_client,
-    )
+    if watch:
+        from .fetcher.patch_watcher import PatchWatcher
 
-    vector_store = None
-    if insert:
-        vector_store = pinecone_instance.insert(
-            patch_fetcher.construct_all_patch_documents(patch_version))
-    else:
-        vector_store = pinecone_instance.get_vector_store()
+        PatchWatcher(client_factory, min_interval=watch_interval,
+                     max_interval=watch_max_interval,
+                     patch_version=patch_version).run(once=watch_once)
+    elif serve:
+        from .server.query_server import QueryServer
 
-    # retriever = pinecone_instance.retrieve(vector_store)
-    retriever = pinecone_instance.get_retriever_from_self_query_retriever(
-        vector_store)
+        QueryServer(client_factory, max_concurrency=concurrency,
+                    max_pending=max_pending).run(host, port)
+    elif questions_file:
+        from .query.batch_query import BatchQuery
 
-    retrieval_chain = RetrievalChain(llm_client)
-    qa_chain = retrieval_chain.get_qa_chain(retriever)
+        asyncio.run(BatchQuery(
+            client_factory.chat_query(), concurrency=concurrency).run(
+            questions_file,
+            output_file or f"{os.path.splitext(questions_file)[0]}\
+.answers.jsonl",
+            resume=resume,
+        ))
+    else:
+        continually_query_user(
+            client_factory.warm_up(client_factory.chat_query), verbose,
+            profiler if import_profile else None)
+    client_factory.flush()
 
-    chat_query = ChatQuery(qa_chain)
-    continually_query_user(chat_query, verbose)
+    stats_line = client_factory.embedding_stats_line()
+    if verbose and stats_line:
+        print(stats_line)
+    if import_profile:
+        profiler.report()
+    latency_recorder = client_factory.latency_recorder
+    if profile:
+        latency_recorder.report()
+    if profile_output:
+        latency_recorder.export(profile_output, profile_format)
@@ -0,0 +1,196 @@
+from array import array
+from bisect import bisect_left
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+LOOKUP_TABLES_MAGIC = b'D2LT'
+LOOKUP_TABLES_FORMAT_VERSION = 1
+# magic, format version, header length
+LOOKUP_TABLES_PREAMBLE = struct.Struct('<4sII')
+
+
+class LookupTable:
+    # Read-only id -> name mapping over the shared mmap: a sorted int32 id
+    # array, an int32 (start, end) span per id and the interned string blob.
+    def __init__(self, ids, spans, blob):
+        self.ids = ids
+        self.spans = spans
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entity_id):
+        return self.index(entity_id) is not None
+
+    def index(self, entity_id):
+        index = bisect_left(self.ids, entity_id)
+        if index < len(self.ids) and self.ids[index] == entity_id:
+            return index
+        return None
+
+    def name(self, index):
+        return str(self.blob[self.spans[2 * index]:self.spans[2 * index + 1]],
+                   'utf-8')
+
+    def get(self, entity_id, default=None):
+        index = self.index(entity_id)
+        if index is None:
+            return default
+        return self.name(index)
+
+    def __getitem__(self, entity_id):
+        index = self.index(entity_id)
+        if index is None:
+            raise KeyError(entity_id)
+        return self.name(index)
+
+    def keys(self):
+        return iter(self.ids)
+
+    def values(self):
+        return (self.name(index) for index in range(len(self.ids)))
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+
+class LookupTables:
+    # The item, hero and ability lists compiled into one file that is
+    # memory-mapped, so parsers and the query parser share it without ever
+    # holding the raw JSON lists.
+    def __init__(self, path, header, buffer):
+        self.path = path
+        self.header = header
+        self.buffer = buffer
+        self.tables = {}
+
+    @staticmethod
+    def default_path():
+        return os.environ.get(
+            "DOTA2_LOOKUP_TABLES_PATH",
+            os.path.join(".cache", "lookup_tables.bin"))
+
+    @staticmethod
+    def raw_entries(item_data, hero_data, ability_data):
+        return {
+            'items': item_data['result']['data']['itemabilities'],
+            'heroes': hero_data['result']['data']['heroes'],
+            'abilities': ability_data['result']['data']['itemabilities'],
+        }
+
+    @classmethod
+    def build(cls, path, item_data, hero_data, ability_data):
+        blob = bytearray()
+        # Names shared between lists (items also appear in the ability
+        # list) are stored once.
+        interned = {}
+        tables = {}
+        for table_name, entries in cls.raw_entries(
+                item_data, hero_data, ability_data).items():
+            mapping = {entry['id']: entry['name_loc'] for entry in entries}
+            ids = array('i', sorted(mapping))
+            spans = array('i')
+            for entity_id in ids:
+                name = mapping[entity_id].encode('utf-8')
+                if name not in interned:
+                    interned[name] = (len(blob), len(blob) + len(name))
+                    blob += name
+                spans.extend(interned[name])
+            tables[table_name] = (ids, spans)
+
+        sections = []
+        header_tables = {}
+        offset = 0
+        for table_name, (ids, spans) in tables.items():
+            header_tables[table_name] = {'count': len(ids)}
+            for section_name, section in (('ids', ids), ('spans', spans)):
+                data = section.tobytes()
+                header_tables[table_name][section_name] = [offset, len(data)]
+                sections.append(data)
+                offset += len(data)
+        header = {
+            'byteorder': sys.byteorder,
+            'built_at': time.time(),
+            'tables': header_tables,
+            'blob': [offset, len(blob)],
+        }
+        sections.append(bytes(blob))
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        # Pad so the int32 sections start on an aligned offset.
+        header_bytes += b' ' * (-(LOOKUP_TABLES_PREAMBLE.size
+                                  + len(header_bytes)) % 8)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as tables_file:
+            tables_file.write(LOOKUP_TABLES_PREAMBLE.pack(
+                LOOKUP_TABLES_MAGIC, LOOKUP_TABLES_FORMAT_VERSION,
+                len(header_bytes)))
+            tables_file.write(header_bytes)
+            for section in sections:
+                tables_file.write(section)
+        os.replace(tmp_path, path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'rb') as tables_file:
+                buffer = mmap.mmap(
+                    tables_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        try:
+            magic, format_version, header_length = \
+                LOOKUP_TABLES_PREAMBLE.unpack_from(buffer)
+        except struct.error:
+            return None
+        if magic != LOOKUP_TABLES_MAGIC \
+                or format_version != LOOKUP_TABLES_FORMAT_VERSION:
+            return None
+
+        start = LOOKUP_TABLES_PREAMBLE.size
+        try:
+            header = json.loads(bytes(buffer[start:start + header_length]))
+        except json.JSONDecodeError:
+            return None
+        if header.get('byteorder') != sys.byteorder:
+            return None
+
+        header['data_offset'] = start + header_length
+        return cls(path, header, buffer)
+
+    def age(self):
+        return time.time() - self.header['built_at']
+
+    def section(self, offset, length):
+        start = self.header['data_offset'] + offset
+        return memoryview(self.buffer)[start:start + length]
+
+    def table(self, table_name):
+        if table_name not in self.tables:
+            table_header = self.header['tables'][table_name]
+            self.tables[table_name] = LookupTable(
+                self.section(*table_header['ids']).cast('i'),
+                self.section(*table_header['spans']).cast('i'),
+                self.section(*self.header['blob']),
+            )
+        return self.tables[table_name]
+
+    def heroes(self):
+        return self.table('heroes')
+
+    def items(self):
+        return self.table('items')
+
+    def abilities(self):
+        return self.table('abilities')
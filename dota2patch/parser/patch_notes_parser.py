@@ -0,0 +1,248 @@
+from .patch_records import PatchEntry, PatchInfo
+
+NO_ABILITY = {'ability_id': None, 'ability_name': None, 'facet': None}
+
+
+class NameCache(dict):
+    # Names decoded from a memory-mapped lookup table, kept by id; the same
+    # heroes, items and abilities come back in every patch. Unknown ids
+    # map to ''.
+    def __init__(self, lookup_table):
+        super().__init__()
+        self.lookup_table = lookup_table
+
+    def __missing__(self, entity_id):
+        name = self[entity_id] = self.lookup_table.get(entity_id, '')
+        return name
+
+
+class PatchNotesParser:
+    # Walks a patch's JSON once. Yields a PatchEntry per general section,
+    # item, hero ability and facet for the documents, and when given a
+    # list also appends one row per note for the patch diff store. Fields
+    # that do not match the datafeed schema raise a RuntimeError naming
+    # the patch and the path of the field, instead of a KeyError deep in
+    # the parser.
+    def __init__(self, lookup_tables):
+        self.heroes_mapping = NameCache(lookup_tables.heroes())
+        self.items_mapping = NameCache(lookup_tables.items())
+        self.abilities_mapping = NameCache(lookup_tables.abilities())
+
+    @staticmethod
+    def schema_error(patch_number, path, problem):
+        location = ''.join(
+            f"[{part}]" if isinstance(part, int) else f".{part}"
+            for part in path).lstrip('.')
+        return RuntimeError(f"Patch notes {patch_number} do not match the \
+datafeed schema: {location or 'patch'} {problem}.")
+
+    def type_error(self, patch_number, path, value, kind):
+        return self.schema_error(
+            patch_number, path, "is missing" if value is None else
+            f"is a {type(value).__name__}, expected {kind.__name__}")
+
+    def records(self, patch_number, container, key, path=()):
+        # A list of objects; a missing list is empty. Paths are only built
+        # once a check has failed.
+        records = container.get(key)
+        if records is None:
+            return ()
+        if type(records) is not list:
+            raise self.type_error(
+                patch_number, (*path, key), records, list)
+        for index, record in enumerate(records):
+            if type(record) is not dict:
+                raise self.type_error(
+                    patch_number, (*path, key, index), record, dict)
+        return records
+
+    def record_id(self, patch_number, record, key, path):
+        record_id = record.get(key)
+        if type(record_id) is not int:
+            raise self.type_error(
+                patch_number, (*path, key), record_id, int)
+        return record_id
+
+    def note_list(self, patch_number, container, key, path, required=False):
+        notes = container.get(key)
+        if notes is None and not required:
+            return ()
+        if type(notes) is not list:
+            raise self.type_error(patch_number, (*path, key), notes, list)
+        return notes
+
+    def note_error(self, patch_number, notes, path):
+        for position, note in enumerate(notes):
+            if type(note) is not dict or type(note.get('note')) is not str:
+                return self.schema_error(
+                    patch_number, (*path, position), "has no 'note' text")
+        return self.schema_error(patch_number, path, "is malformed")
+
+    def texts(self, patch_number, notes, path, key, info=True, prefix='',
+              suffix='.'):
+        # Malformed notes surface as a KeyError or TypeError and are only
+        # then located, so valid notes pay for no checks.
+        try:
+            if not info:
+                return [f"{prefix}{note['note']}{suffix}" for note in notes]
+            return [f"{prefix}{note['note']}({note['info']}){suffix}"
+                    if 'info' in note else f"{prefix}{note['note']}{suffix}"
+                    for note in notes]
+        except (KeyError, TypeError):
+            raise self.note_error(
+                patch_number, notes, (*path, key)) from None
+
+    @staticmethod
+    def add_rows(rows, notes, fields):
+        for position, note in enumerate(notes):
+            if note['note']:
+                rows.append({**fields, 'position': position,
+                             'note': note['note'], 'info': note.get('info')})
+
+    def add_note_rows(self, patch_number, rows, notes, fields, path, key):
+        # For notes that are not part of any document: add_rows reads every
+        # note, so malformed ones are located from its error like texts.
+        try:
+            self.add_rows(rows, notes, fields)
+        except (KeyError, TypeError):
+            raise self.note_error(
+                patch_number, notes, (*path, key)) from None
+
+    def parse(self, patch_data, rows=None):
+        if type(patch_data) is not dict:
+            raise self.type_error('?', (), patch_data, dict)
+        patch_number = patch_data.get('patch_number')
+        if type(patch_number) is not str:
+            raise self.type_error(
+                '?', ('patch_number',), patch_number, str)
+        patch_name = patch_data.get('patch_name')
+        if type(patch_name) is not str:
+            raise self.type_error(
+                patch_number, ('patch_name',), patch_name, str)
+        patch = PatchInfo(
+            patch_number, patch_name, patch_data.get('patch_timestamp'))
+
+        for index, general_note in enumerate(
+                self.records(patch_number, patch_data, 'general_notes')):
+            path = ('general_notes', index)
+            notes = self.note_list(
+                patch_number, general_note, 'generic', path, required=True)
+            title = general_note.get('title', 'Generic Changes')
+            # General notes never showed their info in the documents.
+            changes = self.texts(
+                patch_number, notes, path, 'generic', info=False)
+            if rows is not None:
+                self.add_rows(rows, notes, {
+                    'entity_type': 'generic', 'entity_subtype': 'generic',
+                    'entity_id': None, 'entity_name': title, **NO_ABILITY})
+            yield PatchEntry(
+                patch, 'generic', None, title, None, ' '.join(changes))
+
+        for item_subtype, key in (('hero_items', 'items'),
+                                  ('neutral_items', 'neutral_items')):
+            for index, item in enumerate(
+                    self.records(patch_number, patch_data, key)):
+                item_id = self.record_id(
+                    patch_number, item, 'ability_id', (key, index))
+                if item_id == -1:
+                    continue
+                path = (key, index)
+                notes = self.note_list(
+                    patch_number, item, 'ability_notes', path)
+                changes = self.texts(
+                    patch_number, notes, path, 'ability_notes')
+                title = self.items_mapping[item_id]
+                if rows is not None:
+                    self.add_rows(rows, notes, {
+                        'entity_type': 'items',
+                        'entity_subtype': item_subtype,
+                        'entity_id': item_id, 'entity_name': title,
+                        **NO_ABILITY})
+                yield PatchEntry(patch, 'items', item_subtype, title, None,
+                                 ' '.join(changes))
+
+        for index, hero in enumerate(
+                self.records(patch_number, patch_data, 'heroes')):
+            hero_id = self.record_id(
+                patch_number, hero, 'hero_id', ('heroes', index))
+            if hero_id == -1:
+                continue
+            yield from self.parse_hero(
+                patch, hero, hero_id, ('heroes', index), rows)
+
+    def parse_hero(self, patch, hero, hero_id, path, rows):
+        patch_number = patch.patch_number
+        title = self.heroes_mapping[hero_id]
+        hero_fields = {
+            'entity_type': 'heroes',
+            'entity_id': hero_id,
+            'entity_name': title,
+        }
+        # Hero and talent notes only go to the patch diff store.
+        if rows is not None:
+            for key, subtype in (('hero_notes', 'hero_notes'),
+                                 ('talent_notes', 'talents')):
+                notes = self.note_list(patch_number, hero, key, path)
+                self.add_note_rows(patch_number, rows, notes, {
+                    **hero_fields, 'entity_subtype': subtype, **NO_ABILITY},
+                    path, key)
+
+        for index, ability in enumerate(
+                self.records(patch_number, hero, 'abilities', path)):
+            ability_path = (*path, 'abilities', index)
+            ability_id = self.record_id(
+                patch_number, ability, 'ability_id', ability_path)
+            notes = self.note_list(patch_number, ability, 'ability_notes',
+                                   ability_path, required=True)
+            changes = self.texts(
+                patch_number, notes, ability_path, 'ability_notes')
+            skill_name = self.abilities_mapping[ability_id]
+            if rows is not None:
+                self.add_rows(rows, notes, {
+                    **hero_fields, 'entity_subtype': 'abilities',
+                    'ability_id': ability_id, 'ability_name': skill_name,
+                    'facet': None})
+            yield PatchEntry(patch, 'heroes', 'abilities', title, skill_name,
+                             ' '.join(changes))
+
+        for index, subsection in enumerate(
+                self.records(patch_number, hero, 'subsections', path)):
+            if 'facet' in subsection:
+                yield self.parse_facet(
+                    patch, subsection, (*path, 'subsections', index),
+                    title, hero_fields, rows)
+
+    def parse_facet(self, patch, subsection, path, title, hero_fields, rows):
+        patch_number = patch.patch_number
+        facet = subsection.get('title')
+        if type(facet) is not str:
+            raise self.type_error(patch_number, (*path, 'title'), facet, str)
+        facet_fields = {**hero_fields, 'entity_subtype': 'facets',
+                        'facet': facet}
+        notes = self.note_list(patch_number, subsection, 'general_notes', path)
+        changes = self.texts(patch_number, notes, path, 'general_notes')
+        if rows is not None:
+            self.add_rows(rows, notes, {
+                **facet_fields, 'ability_id': None, 'ability_name': None})
+
+        ability_changes = []
+        for index, ability in enumerate(
+                self.records(patch_number, subsection, 'abilities', path)):
+            ability_path = (*path, 'abilities', index)
+            ability_id = self.record_id(
+                patch_number, ability, 'ability_id', ability_path)
+            notes = self.note_list(
+                patch_number, ability, 'ability_notes', ability_path)
+            ability_name = self.abilities_mapping[ability_id]
+            ability_changes.extend(self.texts(
+                patch_number, notes, ability_path, 'ability_notes',
+                prefix=f"{ability_name}:", suffix=''))
+            if rows is not None:
+                self.add_rows(rows, notes, {
+                    **facet_fields, 'ability_id': ability_id,
+                    'ability_name': ability_name})
+
+        # A facet's own notes describe it; its ability notes are only used
+        # when it has none.
+        return PatchEntry(patch, 'heroes', 'facets', title, facet,
+                          ' '.join(changes or ability_changes))
@@ -0,0 +1,24 @@
+class PatchInfo:
+    # Shared by every entry of a patch instead of a metadata dict per entry.
+    __slots__ = ('patch_number', 'patch_name', 'patch_timestamp')
+
+    def __init__(self, patch_number, patch_name, patch_timestamp=None):
+        self.patch_number = patch_number
+        self.patch_name = patch_name
+        self.patch_timestamp = patch_timestamp
+
+
+class PatchEntry:
+    # One document's worth of changes: a general section, an item, or a
+    # hero ability or facet. subtype and skill_name are None when the
+    # entry has none.
+    __slots__ = ('patch', 'type', 'subtype', 'title', 'skill_name',
+                 'changes')
+
+    def __init__(self, patch, type, subtype, title, skill_name, changes):
+        self.patch = patch
+        self.type = type
+        self.subtype = subtype
+        self.title = title
+        self.skill_name = skill_name
+        self.changes = changes
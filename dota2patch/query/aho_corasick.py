@@ -0,0 +1,50 @@
+from collections import deque
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        # patterns: {pattern string: value}. Every state is a dict of
+        # transitions; failure links and outputs are kept in parallel lists.
+        self.transitions = [{}]
+        self.failures = [0]
+        self.outputs = [[]]
+        for pattern, value in patterns.items():
+            if pattern:
+                self.add(pattern, value)
+        self.build()
+
+    def add(self, pattern, value):
+        state = 0
+        for character in pattern:
+            next_state = self.transitions[state].get(character)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][character] = next_state
+                self.transitions.append({})
+                self.failures.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                failure = self.failures[state]
+                while failure and character not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[next_state] = self.transitions[failure].get(
+                    character, 0)
+                self.outputs[next_state] = self.outputs[next_state] + \
+                    self.outputs[self.failures[next_state]]
+
+    def iter_matches(self, text):
+        state = 0
+        for end, character in enumerate(text, start=1):
+            while state and character not in self.transitions[state]:
+                state = self.failures[state]
+            state = self.transitions[state].get(character, 0)
+            for length, value in self.outputs[state]:
+                yield end - length, end, value
@@ -0,0 +1,258 @@
+from collections import OrderedDict
+from langchain_core.documents import Document
+from .fast_query_parser import PATCH_IN_QUERY_PATTERN
+import numpy as np
+import json
+import os
+import re
+import threading
+import time
+
+
+class AnswerCache:
+    def __init__(self, embeddings_client=None, path=None, max_entries=256,
+                 ttl=7 * 24 * 60 * 60, similarity_threshold=0.95,
+                 save_delay=2.0):
+        self.embeddings_client = embeddings_client
+        self.path = path or os.environ.get(
+            "DOTA2_ANSWER_CACHE_PATH", os.path.join(".cache", "answers.json"))
+        # Question embeddings are kept next to the entries as a float32
+        # matrix instead of JSON lists.
+        self.vectors_path = f"{os.path.splitext(self.path)[0]}.vectors.npy"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        # Changes are written by a timer thread save_delay seconds after
+        # the first one, so answering never waits for the disk; flush()
+        # writes them at once.
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.dirty = False
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        # normalized query -> entry, least recently used first
+        self.entries = OrderedDict()
+        self.load()
+
+    @staticmethod
+    def normalize(query):
+        query = query.lower().replace('’', "'")
+        query = re.sub(r"[^\w.' ]+", ' ', query)
+        return ' '.join(query.rstrip('.').split())
+
+    @staticmethod
+    def query_patches(query):
+        return sorted(set(PATCH_IN_QUERY_PATTERN.findall(query.lower())))
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_file:
+                self.entries = OrderedDict(json.load(cache_file))
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            print(f"Ignoring unreadable answer cache {self.path}: {e}")
+
+        try:
+            vectors = np.load(self.vectors_path)
+        except (OSError, ValueError):
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        for entry in self.entries.values():
+            row = entry.pop('vector_row', None)
+            if row is not None and row < len(vectors):
+                entry['vector'] = vectors[row]
+            elif entry.get('vector') is not None:
+                # Written before the vectors had their own file.
+                entry['vector'] = np.asarray(
+                    entry['vector'], dtype=np.float32)
+            else:
+                entry['vector'] = None
+        self.expire()
+
+    def save(self):
+        with self.lock:
+            entries = []
+            vectors = []
+            for key, entry in self.entries.items():
+                stored = {field: value for field, value in entry.items()
+                          if field != 'vector'}
+                stored['vector_row'] = None
+                if entry['vector'] is not None:
+                    stored['vector_row'] = len(vectors)
+                    vectors.append(entry['vector'])
+                entries.append((key, stored))
+            self.dirty = False
+
+        with self.save_lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_vectors_path = f"{self.vectors_path}.tmp.npy"
+            np.save(tmp_vectors_path, np.array(vectors, dtype=np.float32))
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(tmp_vectors_path, self.vectors_path)
+            os.replace(tmp_path, self.path)
+
+    def schedule_save(self):
+        with self.lock:
+            self.dirty = True
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(
+                    self.save_delay, self.flush)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def flush(self):
+        with self.lock:
+            save_timer, self.save_timer = self.save_timer, None
+            if save_timer is not None:
+                save_timer.cancel()
+            if not self.dirty:
+                return
+        self.save()
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            for key in [key for key, entry in self.entries.items()
+                        if now - entry['created_at'] > self.ttl]:
+                del self.entries[key]
+
+    def embed(self, query):
+        if self.embeddings_client is None:
+            return None
+        return self.embeddings_client.embed_query(query)
+
+    async def aembed(self, query):
+        if self.embeddings_client is None:
+            return None
+        return await self.embeddings_client.aembed_query(query)
+
+    def exact_lookup(self, query):
+        self.expire()
+        key = self.normalize(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+        return self.to_result(entry)
+
+    # Both return (result, cache status, query vector). On a miss the
+    # vector is passed on to store_with_vector, so the question is only
+    # embedded once.
+    def lookup(self, query):
+        result = self.exact_lookup(query)
+        if result is not None:
+            return result, "exact", None
+        vector = self.embed(query)
+        return (*self.semantic_lookup(query, vector), vector)
+
+    async def alookup(self, query):
+        result = self.exact_lookup(query)
+        if result is not None:
+            return result, "exact", None
+        vector = await self.aembed(query)
+        return (*self.semantic_lookup(query, vector), vector)
+
+    def semantic_lookup(self, query, vector):
+        if vector is None:
+            return None, None
+
+        # Near-identical questions about different patches embed very
+        # closely, so only entries asking about the same patches qualify.
+        patches = self.query_patches(query)
+        with self.lock:
+            candidates = [
+                (candidate_key, candidate)
+                for candidate_key, candidate in self.entries.items()
+                if candidate['vector'] is not None
+                and candidate['query_patches'] == patches
+            ]
+        if not candidates:
+            return None, None
+
+        matrix = np.stack(
+            [candidate['vector'] for _, candidate in candidates])
+        query_vector = np.asarray(vector, dtype=np.float32)
+        similarities = matrix @ query_vector / np.maximum(
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector),
+            1e-12)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None, None
+
+        candidate_key, candidate = candidates[best]
+        with self.lock:
+            if candidate_key in self.entries:
+                self.entries.move_to_end(candidate_key)
+        return self.to_result(candidate), \
+            f"semantic ({similarities[best]:.3f})"
+
+    def store_with_vector(self, query, result, vector):
+        source_documents = result.get('source_documents', [])
+        entry = {
+            'query': query,
+            'query_patches': self.query_patches(query),
+            'result': result['result'],
+            'source_documents': [{
+                'id': getattr(document, 'id', None),
+                'page_content': document.page_content,
+                'metadata': document.metadata,
+            } for document in source_documents],
+            'patch_numbers': sorted({
+                document.metadata.get('patch_number')
+                for document in source_documents
+            } - {None}),
+            'vector': np.asarray(vector, dtype=np.float32)
+            if vector is not None else None,
+            'created_at': time.time(),
+        }
+        with self.lock:
+            self.entries[self.normalize(query)] = entry
+            self.entries.move_to_end(self.normalize(query))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.schedule_save()
+
+    def invalidate_patches(self, patch_numbers):
+        if not patch_numbers:
+            return 0
+
+        # Entries that cited or asked about an updated patch are dropped,
+        # as are entries whose question names no patch, whatever they
+        # cited: "what changed for Pudge" may now have a newer answer.
+        # A question about 7.38 also covers 7.38a, 7.38b...
+        patch_numbers = set(patch_numbers)
+        patch_bases = {patch.rstrip('abcdefghijklmnopqrstuvwxyz')
+                       for patch in patch_numbers}
+        with self.lock:
+            stale_keys = [
+                key for key, entry in self.entries.items()
+                if not entry['query_patches']
+                or patch_numbers & set(entry['patch_numbers'])
+                or patch_numbers & set(entry['query_patches'])
+                or patch_bases & set(entry['query_patches'])
+            ]
+            for key in stale_keys:
+                del self.entries[key]
+        # Written at once, since an insert usually ends the process.
+        if stale_keys:
+            self.save()
+        return len(stale_keys)
+
+    def to_result(self, entry):
+        return {
+            'query': entry['query'],
+            'result': entry['result'],
+            'source_documents': [
+                Document(
+                    id=document['id'],
+                    page_content=document['page_content'],
+                    metadata=document['metadata'])
+                for document in entry['source_documents']
+            ],
+        }
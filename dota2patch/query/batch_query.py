@@ -0,0 +1,167 @@
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+from tenacity import (AsyncRetrying, retry_if_exception_type,
+                      stop_after_attempt, wait_random_exponential)
+import asyncio
+import json
+import openai
+import os
+import time
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class BatchQuery:
+    def __init__(self, chat_query, concurrency=4, max_attempts=6):
+        self.chat_query = chat_query
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = wait_random_exponential(multiplier=1, max=60)
+
+    def wait(self, retry_state):
+        # Honour the server's Retry-After on rate limits, otherwise back off
+        # exponentially with jitter.
+        error = retry_state.outcome.exception()
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') \
+            if response is not None else None
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.backoff(retry_state)
+
+    def read_questions(self, questions_file):
+        questions = []
+        with open(questions_file, 'r', encoding='utf-8') as questions_lines:
+            for line_number, line in enumerate(questions_lines, start=1):
+                if not line.strip():
+                    continue
+
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {'question': record}
+                question = record.get('question') or record.get('query')
+                if not question:
+                    raise RuntimeError(
+                        f"Line {line_number} of {questions_file} has no \
+question.")
+                questions.append({
+                    'id': str(record.get('id', line_number)),
+                    'question': question,
+                })
+        return questions
+
+    def completed_ids(self, output_file):
+        if not os.path.exists(output_file):
+            return set()
+
+        completed = set()
+        with open(output_file, 'r', encoding='utf-8') as answers:
+            for line in answers:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by an interrupted run.
+                    continue
+                if 'error' not in record:
+                    completed.add(record['id'])
+        return completed
+
+    @staticmethod
+    def truncate_partial_line(output_file, block_size=65536):
+        # Drops a record cut short by an interrupted run, so the answers
+        # appended on resume start on a line of their own.
+        if not os.path.exists(output_file):
+            return
+
+        with open(output_file, 'r+b') as output:
+            end = output.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - block_size)
+                output.seek(start)
+                newline = output.read(position - start).rfind(b'\n')
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                output.truncate(position)
+
+    async def answer(self, question):
+        start = time.perf_counter()
+        async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(RETRYABLE_ERRORS),
+                wait=self.wait,
+                stop=stop_after_attempt(self.max_attempts),
+                reraise=True):
+            with attempt:
+                # A fresh handler per attempt, so the recorded usage is
+                # the successful attempt's and not summed across retries.
+                usage = OpenAICallbackHandler()
+                result, cache_status = await self.chat_query.aanswer(
+                    question['question'], [usage])
+
+        return {
+            'id': question['id'],
+            'question': question['question'],
+            'answer': result['result'],
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+            'source_ids': [
+                getattr(document, 'id', None)
+                for document in result.get('source_documents', [])
+            ],
+            'token_usage': {
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens,
+                'total_tokens': usage.total_tokens,
+                'total_cost': usage.total_cost,
+            },
+            'answer_cache': cache_status,
+            'attempts': attempt.retry_state.attempt_number,
+        }
+
+    async def answer_with_limit(self, semaphore, question, output):
+        async with semaphore:
+            try:
+                record = await self.answer(question)
+            except Exception as e:
+                print(f"Question {question['id']} failed: {e}")
+                record = {
+                    'id': question['id'],
+                    'question': question['question'],
+                    'error': str(e),
+                }
+
+        # Every answer is written as soon as it is done, so the output file
+        # is also the checkpoint used by --resume.
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+        return record
+
+    async def run(self, questions_file, output_file, resume=False):
+        questions = self.read_questions(questions_file)
+        if resume:
+            self.truncate_partial_line(output_file)
+            completed = self.completed_ids(output_file)
+            questions = [question for question in questions
+                         if question['id'] not in completed]
+            print(f"Resuming: {len(completed)} questions already answered.")
+
+        print(f"Answering {len(questions)} questions with up to \
+{self.concurrency} at a time.")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        with open(output_file, 'a' if resume else 'w',
+                  encoding='utf-8') as output:
+            records = await asyncio.gather(*(
+                self.answer_with_limit(semaphore, question, output)
+                for question in questions))
+
+        failed = sum(1 for record in records if 'error' in record)
+        print(f"Answered {len(records) - failed} questions, {failed} failed. \
+Results written to {output_file}")
+        return records
@@ -1,28 +1,115 @@
+from contextlib import contextmanager
 import json
+from ..ragchain.streaming_handler import StreamingPrintHandler
+from ..telemetry.latency_recorder import LatencyRecorder
 
 
 class ChatQuery:
-    def __init__(self, qa_chain):
+    def __init__(self, qa_chain, answer_cache=None, streaming=False,
+                 latency_recorder=None, exact_query=None):
         self.qa_chain = qa_chain
+        self.answer_cache = answer_cache
+        self.exact_query = exact_query
+        self.streaming = streaming
+        self.latency_recorder = latency_recorder
 
-    def ask_question(self, query, verbose, metadata_filter=None):
-        current_search_kwargs = {'k': 3}
-        if metadata_filter:
-            current_search_kwargs['filter'] = metadata_filter
+    @contextmanager
+    def trace(self, query, callbacks=None):
+        # Yields the callbacks for the chain, plus a latency handler when
+        # queries are profiled.
+        callbacks = list(callbacks or [])
+        if self.latency_recorder is None:
+            yield callbacks
+            return
+
+        from ..telemetry.latency_callback_handler import (
+            LatencyCallbackHandler)
+        with self.latency_recorder.trace('query', query) as trace:
+            yield [*callbacks, LatencyCallbackHandler(trace)]
+
+    def exact_answer(self, query):
+        if self.exact_query is None:
+            return None
+        with LatencyRecorder.stage('exact query'):
+            return self.exact_query.answer(query)
 
+    def print_query(self, query, verbose, metadata_filter):
         if verbose:
             print(f"\nQuery: {query}")
             if metadata_filter:
                 print(f"With filter: {metadata_filter}")
 
-        # Langchain LCEL uses invoke
-        result = self.qa_chain.invoke({"query": query})
-        print(">" + result["result"])
+    def print_cache_status(self, verbose, cache_status):
+        if verbose and self.answer_cache:
+            print(f"Answer cache: {
+                f'hit, {cache_status}' if cache_status else 'miss'}")
 
+    def print_source_documents(self, result, verbose):
         if verbose:
             print("\nSource Documents:")
             for doc in result["source_documents"]:
                 print(f"  Content: {doc.page_content}")
                 print(f"  Metadata: {json.dumps(doc.metadata, indent=4)}")
 
+    def ask_question(self, query, verbose, metadata_filter=None):
+        self.print_query(query, verbose, metadata_filter)
+
+        with self.trace(query) as callbacks:
+            result = self.exact_answer(query)
+            if result is None:
+                with LatencyRecorder.stage('answer cache'):
+                    result, cache_status, vector = \
+                        self.answer_cache.lookup(query) \
+                        if self.answer_cache else (None, None, None)
+                self.print_cache_status(verbose, cache_status)
+
+            if result is None:
+                # Langchain LCEL uses invoke
+                result = self.qa_chain.invoke(
+                    {"query": query},
+                    config={"callbacks": callbacks} if callbacks else None)
+                if self.answer_cache:
+                    self.answer_cache.store_with_vector(query, result, vector)
+        print(">" + result["result"])
+
+        self.print_source_documents(result, verbose)
+
+        return result
+
+    async def aanswer(self, query, callbacks=None):
+        with self.trace(query, callbacks) as callbacks:
+            # Exact answers are already cheaper than the answer cache.
+            result = self.exact_answer(query)
+            if result is not None:
+                return result, None
+
+            with LatencyRecorder.stage('answer cache'):
+                result, cache_status, vector = \
+                    await self.answer_cache.alookup(query) \
+                    if self.answer_cache else (None, None, None)
+            if result is not None:
+                return result, cache_status
+
+            result = await self.qa_chain.ainvoke(
+                {"query": query},
+                config={"callbacks": callbacks} if callbacks else None)
+            if self.answer_cache:
+                self.answer_cache.store_with_vector(query, result, vector)
+            return result, None
+
+    async def aask_question(self, query, verbose, metadata_filter=None):
+        self.print_query(query, verbose, metadata_filter)
+
+        streaming_handler = StreamingPrintHandler()
+        result, cache_status = await self.aanswer(
+            query, [streaming_handler] if self.streaming else None)
+        self.print_cache_status(verbose, cache_status)
+
+        if streaming_handler.streamed:
+            print()
+        else:
+            print(">" + result["result"])
+
+        self.print_source_documents(result, verbose)
+
         return result
@@ -0,0 +1,62 @@
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+from ..fetcher.patch_versions import patch_sort_key
+
+
+class EntityRollupRetriever(BaseRetriever):
+    # Two-stage lookup for questions about a hero or item in a patch: the
+    # fast query parser resolves the entity and patches, then their rollup
+    # documents are fetched by ID. Anything else goes to the wrapped
+    # retriever.
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    rollup_store: Any
+    query_parser: Any
+    base_retriever: BaseRetriever
+    max_rollups: int = 8
+    verbose: bool = False
+
+    def latest_rollups(self, titles):
+        # Newest patch first, one ID lookup per patch until one has a
+        # rollup for the entity.
+        for patch_version in reversed(self.query_parser.patch_versions):
+            rollups = self.rollup_store.lookup([patch_version], titles)
+            if rollups:
+                return rollups
+        return []
+
+    def lookup(self, query):
+        parsed_query = self.query_parser.parse(query)
+        # Questions naming an ability are better served by its own notes.
+        if not parsed_query.titles or parsed_query.skill_names:
+            return []
+        if parsed_query.latest and not parsed_query.patch_versions \
+                and not parsed_query.has_range():
+            return self.latest_rollups(parsed_query.titles)[
+                :self.max_rollups]
+        if not parsed_query.patch_versions:
+            return []
+
+        rollups = self.rollup_store.lookup(
+            sorted(parsed_query.patch_versions, key=patch_sort_key,
+                   reverse=True),
+            parsed_query.titles)
+        if self.verbose:
+            print(f"Rollups for {', '.join(parsed_query.titles)} in \
+{', '.join(parsed_query.patch_versions)}: {len(rollups)}")
+        return rollups[:self.max_rollups]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        rollups = self.lookup(query)
+        if rollups:
+            return rollups
+        return self.base_retriever.invoke(
+            query, config={'callbacks': run_manager.get_child()})
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        rollups = self.lookup(query)
+        if rollups:
+            return rollups
+        return await self.base_retriever.ainvoke(
+            query, config={'callbacks': run_manager.get_child()})
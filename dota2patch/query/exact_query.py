@@ -0,0 +1,115 @@
+import re
+from ..fetcher.patch_versions import patch_family_range, patch_sort_key
+from .fast_query_parser import PATCH_CLAUSE
+
+# These decide when a question skips the LLM, so they only accept the
+# commands and phrases below.
+# 'list all Pudge changes', 'show me every change to Black King Bar'
+LIST_PATTERN = re.compile(
+    r'^(?:please\s+)?(?:list|show(?:\s+me)?)\s+(?:all|every)\b')
+# 'since 7.35', 'after patch 7.36c'
+SINCE_PATTERN = re.compile(
+    r'\b(since|after)\s+(?:patch\s+)?(\d+\.\d{2}[a-z]?)\b')
+# 'diff Pudge 7.37 7.38', 'compare Axe in 7.36 and 7.38'
+DIFF_PATTERN = re.compile(r'^(?:please\s+)?(?:diff|compare)\b')
+# 'from 7.36 to 7.38', 'between 7.36 and 7.38'
+RANGE_PATTERN = re.compile(
+    rf'\b(?:from\s+{PATCH_CLAUSE}\s+to|between\s+{PATCH_CLAUSE}\s+and)'
+    rf'\s+{PATCH_CLAUSE}')
+# Questions asking for a summary or a reason go to the LLM even when they
+# name the changes to list.
+EXPLAIN_PATTERN = re.compile(
+    r'\b(summar(?:y|i[sz]e)|why|explain|reasons?|how come|overview)\b')
+
+
+class ExactQuery:
+    # Answers list and diff questions about one hero, item or ability
+    # straight from the patch diff store, without retrieval or the LLM.
+    # Other questions return None and go through the RAG chain.
+    def __init__(self, patch_diff_store, query_parser, verbose=False):
+        self.patch_diff_store = patch_diff_store
+        self.query_parser = query_parser
+        self.verbose = verbose
+
+    def entity(self, query):
+        parsed_query = self.query_parser.parse(query)
+        # An ability pins down its hero, as in the metadata filters.
+        names = parsed_query.skill_names or parsed_query.titles
+        if len(names) != 1:
+            return None
+        return names[0]
+
+    def plan(self, query):
+        # (description, min sort key, max sort key) or None
+        text = self.query_parser.normalize(query).strip()
+        if EXPLAIN_PATTERN.search(text):
+            return None
+        # Other numbers in the question are not patch versions.
+        patch_versions = list(dict.fromkeys(
+            self.query_parser.patch_versions_in(text)))
+
+        since = SINCE_PATTERN.search(text)
+        if since and patch_versions == [since[2]]:
+            return f"since {since[2]}", patch_sort_key(since[2]), None
+
+        patch_range = RANGE_PATTERN.search(text)
+        range_versions = [patch_version for patch_version in (
+            patch_range.groups() if patch_range else ()) if patch_version]
+        if (len(patch_versions) == 2 and (
+                sorted(range_versions) == sorted(patch_versions)
+                or DIFF_PATTERN.match(text))):
+            start, end = sorted(patch_versions, key=patch_sort_key)
+            # Going from one patch to the other: the changes after the
+            # first, up to and including the second.
+            return f"from {start} to {end}", \
+                patch_family_range(start)[1] + 1, patch_family_range(end)[1]
+
+        if LIST_PATTERN.match(text) and len(patch_versions) <= 1:
+            if not patch_versions:
+                return "", None, None
+            return f"in {patch_versions[0]}", \
+                *patch_family_range(patch_versions[0])
+        return None
+
+    def format(self, name, description, rows):
+        description = f" {description}" if description else ''
+        if not rows:
+            return f"No changes to {name} found{description} in the \
+inserted patch notes."
+
+        lines = [f"{len(rows)} changes to {name}{description}:"]
+        patch_number = None
+        for row in rows:
+            if row['patch_number'] != patch_number:
+                patch_number = row['patch_number']
+                lines.append(f"\nPatch {patch_number}:")
+            # The hero of an ability, and the ability or facet of a hero.
+            labels = [label for label in (
+                row['entity_name'],
+                row['facet'] and f"Facet {row['facet']}",
+                row['ability_name']) if label and label != name]
+            if row['entity_subtype'] == 'talents':
+                labels.append('Talent')
+            info = f" ({row['info']})" if row['info'] else ''
+            prefix = f"{' - '.join(labels)}: " if labels else ''
+            lines.append(f"- {prefix}{row['note']}{info}")
+        return '\n'.join(lines)
+
+    def answer(self, query):
+        plan = self.plan(query)
+        if plan is None:
+            return None
+        name = self.entity(query)
+        if name is None:
+            return None
+
+        description, min_sort_key, max_sort_key = plan
+        rows = self.patch_diff_store.changes(name, min_sort_key, max_sort_key)
+        if self.verbose:
+            print(f"Exact query: {' '.join(filter(None, (name, description)))}\
+, {len(rows)} notes")
+        return {
+            'query': query,
+            'result': self.format(name, description, rows),
+            'source_documents': [],
+        }
@@ -0,0 +1,212 @@
+import re
+from ..fetcher.patch_versions import patch_family_range, patch_sort_key
+from .aho_corasick import AhoCorasick
+
+PATCH_IN_QUERY_PATTERN = re.compile(
+    r'(?<![\w.])(\d+\.\d{2}[a-z]?)(?!\w|\.\d)')
+PATCH_CLAUSE = r'(?:patch\s+)?(\d+\.\d{2}[a-z]?)(?!\w|\.\d)'
+# 'between 7.36 and 7.38', 'from 7.36 to 7.38c'
+BETWEEN_PATTERN = re.compile(
+    rf'\b(?:between|from)\s+{PATCH_CLAUSE}\s*(?:and|to|-)\s*{PATCH_CLAUSE}')
+# 'since 7.36', 'after 7.36', 'before 7.38', 'until 7.38'
+BOUND_PATTERN = re.compile(
+    rf'\b(since|after|before|until|up to|prior to)\s+{PATCH_CLAUSE}')
+# 'latest change', 'newest Axe update', 'most recent patch'. Words such as
+# 'last', 'current' or 'recently' also appear in ordinary questions ('last
+# hit', 'current cooldown'), so they do not count.
+LATEST_PATTERN = re.compile(
+    r"\b(?:latest|newest|most recent)\s+(?:[\w'-]+\s+){0,3}?"
+    r"(?:changes?|updates?|patch(?:es)?|nerfs?|buffs?)\b")
+
+
+class ParsedQuery:
+    def __init__(self, patch_versions, titles, skill_names,
+                 min_sort_key=None, max_sort_key=None, latest=False):
+        # With a patch range, patch_versions are the known patches in it.
+        self.patch_versions = patch_versions
+        self.titles = titles
+        self.skill_names = skill_names
+        self.min_sort_key = min_sort_key
+        self.max_sort_key = max_sort_key
+        self.latest = latest
+
+    def has_range(self):
+        return self.min_sort_key is not None or self.max_sort_key is not None
+
+    def is_empty(self):
+        return not (self.patch_versions or self.titles or self.skill_names
+                    or self.has_range())
+
+
+class FastQueryParser:
+    def __init__(self, heroes_mapping, items_mapping, abilities_mapping,
+                 patch_versions=None, min_ability_name_length=4,
+                 min_plain_name_length=4):
+        self.patch_versions = sorted(
+            patch_versions or [], key=patch_sort_key)
+        self.patch_majors = {patch_sort_key(patch_version) // 1_000_000
+                             for patch_version in self.patch_versions}
+        patterns = {}
+        # Heroes win over items and items over abilities when a name is
+        # shared, e.g. an item and the ability it grants.
+        for kind, names in (
+                ('skill_name', abilities_mapping.values()),
+                ('title', items_mapping.values()),
+                ('title', heroes_mapping.values())):
+            for name in names:
+                key = self.normalize(name)
+                if kind == 'skill_name' and len(key) < min_ability_name_length:
+                    continue
+                if not key:
+                    continue
+                # One-word ability names and short names are often plain
+                # words ('Rage', 'Return', 'Io'), so they only count when
+                # written capitalized, as a name.
+                capitalized_only = ' ' not in key and (
+                    kind == 'skill_name' or len(key) < min_plain_name_length)
+                patterns[key] = (kind, name, capitalized_only)
+        self.automaton = AhoCorasick(patterns)
+
+    @staticmethod
+    def normalize(text, lower=True):
+        text = text.lower() if lower else text
+        return ' '.join(text.replace('’', "'").replace('‘', "'").split())
+
+    def match_entities(self, query):
+        text = self.normalize(query)
+        cased_text = self.normalize(query, lower=False)
+        if len(cased_text) != len(text):
+            # Lowercasing changed the length, so positions differ.
+            cased_text = None
+        matches = [
+            (start, end, (kind, name))
+            for start, end, (kind, name, capitalized_only)
+            in self.automaton.iter_matches(text)
+            if (start == 0 or not text[start - 1].isalnum())
+            and (end == len(text) or not text[end].isalnum())
+            and not (capitalized_only and cased_text is not None
+                     and not cased_text[start].isupper())
+        ]
+
+        # Leftmost-longest, non-overlapping matches.
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        selected = []
+        last_end = 0
+        for start, end, value in matches:
+            if start >= last_end:
+                selected.append(value)
+                last_end = end
+        return selected
+
+    def is_patch_version(self, patch_version):
+        # Numbers such as cast points ('from 0.30 to 0.25') look like patch
+        # versions; only those of a major version with known patches count.
+        # With no patch known yet, nothing is inserted to tell them apart.
+        return not self.patch_majors \
+            or patch_sort_key(patch_version) // 1_000_000 in self.patch_majors
+
+    def patch_versions_in(self, text):
+        return [patch_version
+                for patch_version in PATCH_IN_QUERY_PATTERN.findall(text)
+                if self.is_patch_version(patch_version)]
+
+    def expand_patch_version(self, patch_version):
+        # Asking for 7.38 also covers 7.38a, 7.38b... when they are known.
+        if patch_version[-1].isalpha():
+            return [patch_version]
+
+        expanded = [
+            known for known in self.patch_versions
+            if known == patch_version or (
+                known[:-1] == patch_version and known[-1].isalpha())
+        ]
+        return expanded or [patch_version]
+
+    def patch_range(self, text):
+        # (min sort key, max sort key) of a range in the question, either
+        # bound may be None; None when there is no range.
+        between = BETWEEN_PATTERN.search(text)
+        if between and all(map(self.is_patch_version, between.groups())):
+            start, end = sorted(between.groups(), key=patch_sort_key)
+            return patch_sort_key(start), patch_family_range(end)[1]
+
+        min_sort_key = max_sort_key = None
+        for bound, patch_version in BOUND_PATTERN.findall(text):
+            if not self.is_patch_version(patch_version):
+                continue
+            first, last = patch_family_range(patch_version)
+            if bound == 'since':
+                min_sort_key = first
+            elif bound == 'after':
+                min_sort_key = first + 1
+            elif bound in ('before', 'prior to'):
+                max_sort_key = first - 1
+            else:
+                max_sort_key = last
+        if min_sort_key is None and max_sort_key is None:
+            return None
+        return min_sort_key, max_sort_key
+
+    def versions_in_range(self, min_sort_key, max_sort_key):
+        return [
+            known for known in self.patch_versions
+            if (min_sort_key is None or patch_sort_key(known) >= min_sort_key)
+            and (max_sort_key is None
+                 or patch_sort_key(known) <= max_sort_key)
+        ]
+
+    def parse(self, query):
+        text = query.lower()
+        patch_range = self.patch_range(text)
+        patch_versions = []
+        if patch_range is not None:
+            patch_versions = self.versions_in_range(*patch_range)
+        else:
+            for patch_version in self.patch_versions_in(text):
+                patch_versions.extend(
+                    self.expand_patch_version(patch_version))
+
+        titles = []
+        skill_names = []
+        for kind, name in self.match_entities(query):
+            target = titles if kind == 'title' else skill_names
+            if name not in target:
+                target.append(name)
+
+        min_sort_key, max_sort_key = patch_range or (None, None)
+        # A question naming its patches already says which ones it wants.
+        latest = not patch_versions and patch_range is None \
+            and bool(LATEST_PATTERN.search(self.normalize(text)))
+        return ParsedQuery(
+            list(dict.fromkeys(patch_versions)), titles, skill_names,
+            min_sort_key, max_sort_key, latest=latest)
+
+    def build_filter(self, parsed_query):
+        if parsed_query.is_empty():
+            return None
+
+        metadata_filter = {}
+        if parsed_query.has_range():
+            # The range also matches patches the parser does not know yet.
+            metadata_filter['patch_sort_key'] = {
+                operator: sort_key for operator, sort_key in (
+                    ('$gte', parsed_query.min_sort_key),
+                    ('$lte', parsed_query.max_sort_key))
+                if sort_key is not None}
+        elif parsed_query.patch_versions:
+            metadata_filter['patch_number'] = self.condition(
+                parsed_query.patch_versions)
+        # A skill name already pins down its hero, so the title is only
+        # used when no ability was mentioned.
+        if parsed_query.skill_names:
+            metadata_filter['skill_name'] = self.condition(
+                parsed_query.skill_names)
+        elif parsed_query.titles:
+            metadata_filter['title'] = self.condition(parsed_query.titles)
+        return metadata_filter
+
+    @staticmethod
+    def condition(values):
+        if len(values) == 1:
+            return {'$eq': values[0]}
+        return {'$in': values}
@@ -0,0 +1,59 @@
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+from .recency_ranker import RecencyRanker
+
+
+class FastSelfQueryRetriever(BaseRetriever):
+    # Builds the metadata filter deterministically when the question names
+    # a patch, hero, item or ability and only falls back to the LLM query
+    # constructor of the wrapped SelfQueryRetriever otherwise.
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    query_parser: Any
+    fallback_retriever: BaseRetriever
+    search_kwargs: dict = {'k': 3}
+    # Candidates re-ranked with recency into the final k.
+    fetch_k: int = 20
+    recency_weight: float = 0.005
+    # Off when a reranker orders the results, so it sees them by fused
+    # relevance.
+    newest_first: bool = True
+    verbose: bool = False
+
+    def build_filter(self, query):
+        # (metadata filter, whether only the latest patch is wanted)
+        parsed_query = self.query_parser.parse(query)
+        metadata_filter = self.query_parser.build_filter(parsed_query)
+        if self.verbose:
+            print(f"Fast query filter: {metadata_filter}"
+                  if metadata_filter else
+                  "Fast query parser found no entities, using the LLM.")
+        return metadata_filter, parsed_query.latest
+
+    def rank(self, documents, latest):
+        return RecencyRanker(recency_weight=self.recency_weight).rank(
+            [documents], self.search_kwargs['k'], latest, self.newest_first)
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        metadata_filter, latest = self.build_filter(query)
+        if metadata_filter is None:
+            return self.rank(self.fallback_retriever.invoke(
+                query, config={'callbacks': run_manager.get_child()}),
+                latest)
+
+        return self.rank(self.vectorstore.similarity_search(
+            query, filter=metadata_filter,
+            **{**self.search_kwargs, 'k': self.fetch_k}), latest)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        metadata_filter, latest = self.build_filter(query)
+        if metadata_filter is None:
+            return self.rank(await self.fallback_retriever.ainvoke(
+                query, config={'callbacks': run_manager.get_child()}),
+                latest)
+
+        return self.rank(await self.vectorstore.asimilarity_search(
+            query, filter=metadata_filter,
+            **{**self.search_kwargs, 'k': self.fetch_k}), latest)
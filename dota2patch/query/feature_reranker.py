@@ -0,0 +1,85 @@
+from ..database.lexical_index import LexicalIndex
+from .recency_ranker import RecencyRanker
+import numpy as np
+
+# Weights of the lexical, title, skill, patch, retrieval rank and recency
+# features.
+FEATURE_WEIGHTS = np.array([1.0, 0.5, 0.75, 0.5, 0.5, 0.05],
+                           dtype=np.float32)
+
+
+class FeatureReranker:
+    # Rescores a wide candidate list on the CPU from cheap features, one
+    # row per document in a NumPy matrix: IDF-weighted overlap with the
+    # question terms, whether the hero/item and ability match the entities
+    # the fast query parser found, whether the patch is the one asked for,
+    # the rank the retriever gave and how recent the patch is.
+    def __init__(self, top_n=3, weights=FEATURE_WEIGHTS):
+        self.top_n = top_n
+        self.weights = weights
+
+    @staticmethod
+    def lexical_feature(query, documents):
+        terms = list(dict.fromkeys(LexicalIndex.tokenize(query)))
+        if not terms:
+            return np.zeros(len(documents), dtype=np.float32)
+
+        presence = np.array([
+            [term in document_terms for term in terms]
+            for document_terms in (
+                set(LexicalIndex.tokenize(document.page_content))
+                for document in documents)
+        ], dtype=np.float32).reshape(len(documents), len(terms))
+        # Terms shared by every candidate tell them apart the least.
+        idf = np.log1p(len(documents) / (1 + presence.sum(axis=0)))
+        return presence @ idf / idf.sum()
+
+    @staticmethod
+    def patch_feature(parsed_query, sort_keys, patch_numbers):
+        if parsed_query.has_range():
+            low = parsed_query.min_sort_key
+            high = parsed_query.max_sort_key
+            return ((sort_keys >= (-1 if low is None else low))
+                    & (sort_keys <= (np.inf if high is None else high)))
+        if parsed_query.patch_versions:
+            return np.isin(patch_numbers, parsed_query.patch_versions)
+        return np.zeros(len(sort_keys), dtype=bool)
+
+    def features(self, query, documents, parsed_query=None):
+        metadatas = [document.metadata for document in documents]
+        sort_keys = np.array([RecencyRanker.sort_key(document)
+                              for document in documents], dtype=np.int64)
+        features = np.zeros((len(documents), len(self.weights)),
+                            dtype=np.float32)
+        features[:, 0] = self.lexical_feature(query, documents)
+        if parsed_query is not None:
+            features[:, 1] = np.isin(
+                np.array([metadata.get('title', '')
+                          for metadata in metadatas], dtype=object),
+                parsed_query.titles)
+            features[:, 2] = np.isin(
+                np.array([metadata.get('skill_name', '')
+                          for metadata in metadatas], dtype=object),
+                parsed_query.skill_names)
+            features[:, 3] = self.patch_feature(
+                parsed_query, sort_keys,
+                np.array([metadata.get('patch_number', '')
+                          for metadata in metadatas], dtype=object))
+        # Candidates arrive in fused relevance order, not by patch.
+        features[:, 4] = 1 / (1 + np.arange(len(documents)))
+        spread = sort_keys.max() - sort_keys.min()
+        if spread:
+            features[:, 5] = (sort_keys - sort_keys.min()) / spread
+        return features, sort_keys
+
+    def rerank(self, query, documents, parsed_query=None):
+        # The top_n best scored documents, latest patch first and by score
+        # within a patch, like the retrievers return them.
+        if len(documents) <= 1:
+            return list(documents)
+
+        features, sort_keys = self.features(query, documents, parsed_query)
+        scores = features @ self.weights
+        top = np.argsort(-scores, kind='stable')[:self.top_n]
+        top = top[np.argsort(-sort_keys[top], kind='stable')]
+        return [documents[position] for position in top]
@@ -0,0 +1,96 @@
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+from .recency_ranker import RecencyRanker
+
+
+class HybridRetriever(BaseRetriever):
+    # Fuses BM25 hits from the local lexical index with vector search hits
+    # by reciprocal rank fusion, with a bonus for recent patches. The
+    # metadata filter comes from the fast query parser when it recognises
+    # the question; otherwise the vector side is the LLM self-query
+    # retriever and the lexical side unfiltered.
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    lexical_index: Any
+    fallback_retriever: BaseRetriever
+    query_parser: Any = None
+    search_kwargs: dict = {'k': 3}
+    fetch_k: int = 20
+    rrf_k: int = 60
+    # Questions with at least this many terms, all present in each of the
+    # top lexical_only_k lexical hits, are answered without embedding the
+    # question.
+    lexical_only_min_terms: int = 2
+    lexical_only_k: int = 3
+    recency_weight: float = 0.005
+    # Off when a reranker orders the results, so it sees them by fused
+    # relevance.
+    newest_first: bool = True
+    verbose: bool = False
+
+    def build_filter(self, query):
+        # (metadata filter, whether only the latest patch is wanted)
+        if self.query_parser is None:
+            return None, False
+
+        parsed_query = self.query_parser.parse(query)
+        metadata_filter = self.query_parser.build_filter(parsed_query)
+        if self.verbose:
+            print(f"Fast query filter: {metadata_filter}"
+                  if metadata_filter else
+                  "Fast query parser found no entities, using the LLM.")
+        return metadata_filter, parsed_query.latest
+
+    def lexical_search(self, query, metadata_filter):
+        lexical_hits = self.lexical_index.search(
+            query, k=self.fetch_k, filter=metadata_filter)
+        k = min(self.lexical_only_k, self.search_kwargs['k'])
+        top_hits = lexical_hits[:k]
+        lexical_only = len(top_hits) == k \
+            and len(set(self.lexical_index.tokenize(query))) \
+            >= self.lexical_only_min_terms \
+            and all(coverage == 1 for _, _, coverage in top_hits)
+        if self.verbose:
+            print(f"Lexical hits: {len(lexical_hits)}"
+                  + (", skipping the vector search." if lexical_only else ""))
+        return [document for document, _, _ in lexical_hits], lexical_only
+
+    def fuse(self, rankings, latest=False):
+        return RecencyRanker(self.rrf_k, self.recency_weight).rank(
+            rankings, self.search_kwargs['k'], latest, self.newest_first)
+
+    def vector_search_kwargs(self, metadata_filter):
+        return {**self.search_kwargs, 'k': self.fetch_k,
+                'filter': metadata_filter}
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        metadata_filter, latest = self.build_filter(query)
+        lexical_documents, lexical_only = self.lexical_search(
+            query, metadata_filter)
+        if lexical_only:
+            return self.fuse([lexical_documents], latest)
+
+        if metadata_filter is None:
+            vector_documents = self.fallback_retriever.invoke(
+                query, config={'callbacks': run_manager.get_child()})
+        else:
+            vector_documents = self.vectorstore.similarity_search(
+                query, **self.vector_search_kwargs(metadata_filter))
+        return self.fuse([vector_documents, lexical_documents], latest)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        metadata_filter, latest = self.build_filter(query)
+        lexical_documents, lexical_only = self.lexical_search(
+            query, metadata_filter)
+        if lexical_only:
+            return self.fuse([lexical_documents], latest)
+
+        if metadata_filter is None:
+            vector_documents = await self.fallback_retriever.ainvoke(
+                query, config={'callbacks': run_manager.get_child()})
+        else:
+            vector_documents = await self.vectorstore.asimilarity_search(
+                query, **self.vector_search_kwargs(metadata_filter))
+        return self.fuse([vector_documents, lexical_documents], latest)
@@ -0,0 +1,50 @@
+from ..fetcher.patch_versions import patch_sort_key
+
+
+class RecencyRanker:
+    # Reciprocal rank fusion of one or more rankings plus a recency bonus:
+    # the newest patch among the candidates gets recency_weight, older
+    # ones linearly less. The top k are returned latest patch first, in
+    # relevance order within a patch, or in fused order when newest_first
+    # is off.
+    def __init__(self, rrf_k=60, recency_weight=0.005):
+        self.rrf_k = rrf_k
+        self.recency_weight = recency_weight
+
+    @staticmethod
+    def sort_key(document):
+        # Documents inserted before the sort key was stored fall back to
+        # their patch number.
+        if 'patch_sort_key' in document.metadata:
+            return int(document.metadata['patch_sort_key'])
+        try:
+            return patch_sort_key(document.metadata.get('patch_number', ''))
+        except ValueError:
+            return -1
+
+    def rank(self, rankings, k, latest=False, newest_first=True):
+        scores = {}
+        documents = {}
+        for ranking in rankings:
+            for rank, document in enumerate(ranking):
+                key = document.id or document.page_content
+                scores[key] = scores.get(key, 0.0) + \
+                    1 / (self.rrf_k + rank + 1)
+                documents.setdefault(key, document)
+
+        sort_keys = {key: self.sort_key(document)
+                     for key, document in documents.items()}
+        patches = sorted(set(sort_keys.values()), reverse=True)
+        if latest and patches:
+            # 'latest change to X': only the newest patch that has one.
+            scores = {key: score for key, score in scores.items()
+                      if sort_keys[key] == patches[0]}
+        recency = {sort_key: 1 - position / max(len(patches) - 1, 1)
+                   for position, sort_key in enumerate(patches)}
+        for key in scores:
+            scores[key] += self.recency_weight * recency[sort_keys[key]]
+
+        top_keys = sorted(scores, key=scores.get, reverse=True)[:k]
+        if newest_first:
+            top_keys.sort(key=lambda key: sort_keys[key], reverse=True)
+        return [documents[key] for key in top_keys]
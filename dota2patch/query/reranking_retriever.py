@@ -0,0 +1,35 @@
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+from ..telemetry.latency_recorder import LatencyRecorder
+import time
+
+
+class RerankingRetriever(BaseRetriever):
+    # Retrieves wide with the wrapped retriever (its k is the candidate
+    # count) and keeps the reranker's best few for the answer prompt.
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base_retriever: BaseRetriever
+    reranker: Any
+    query_parser: Any = None
+    verbose: bool = False
+
+    def rerank(self, query, documents):
+        start = time.perf_counter()
+        with LatencyRecorder.stage('rerank', documents=len(documents)):
+            parsed_query = self.query_parser.parse(query) \
+                if self.query_parser is not None else None
+            reranked = self.reranker.rerank(query, documents, parsed_query)
+        if self.verbose:
+            print(f"Reranked {len(documents)} candidates to \
+{len(reranked)} in {(time.perf_counter() - start) * 1000:.2f} ms")
+        return reranked
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.rerank(query, self.base_retriever.invoke(
+            query, config={'callbacks': run_manager.get_child()}))
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        return self.rerank(query, await self.base_retriever.ainvoke(
+            query, config={'callbacks': run_manager.get_child()}))
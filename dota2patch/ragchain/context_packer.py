@@ -0,0 +1,103 @@
+from ..fetcher.patch_versions import patch_sort_key
+from .token_counter import TokenCounter
+import re
+
+# 'Patch "7.38c" for heroes(abilities): Pudge - Meat Hook - ...' and the
+# rollup form 'Patch "7.38c" for heroes: Pudge\n- ...'.
+PAGE_CONTENT_PATTERN = re.compile(
+    r'^Patch "(?P<patch>[^"]*)" for (?P<section>[^:]*): (?P<body>.*)$',
+    re.DOTALL)
+
+
+class ContextPacker:
+    # Builds the "stuff" prompt context within a token budget: duplicate
+    # and overlapping documents are dropped, the rest are grouped under one
+    # heading per patch and section (latest patch first, retrieval order
+    # within a patch) and lines are added until the budget is spent.
+    def __init__(self, max_tokens=3000, encoding_name="cl100k_base",
+                 verbose=False):
+        self.max_tokens = max_tokens
+        self.token_counter = TokenCounter(encoding_name)
+        self.verbose = verbose
+
+    @staticmethod
+    def recency_key(patch):
+        try:
+            return -patch_sort_key(patch)
+        except ValueError:
+            return 0
+
+    def deduplicate(self, documents):
+        # Notes already covered by a retrieved rollup document are dropped.
+        covered_ids = {
+            document_id for document in documents
+            for document_id in document.metadata.get('document_ids', [])}
+        seen_contents = set()
+        unique_documents = []
+        for document in documents:
+            content = ' '.join(document.page_content.split())
+            if document.id in covered_ids or content in seen_contents:
+                continue
+            seen_contents.add(content)
+            unique_documents.append(document)
+        return unique_documents
+
+    def split(self, document):
+        match = PAGE_CONTENT_PATTERN.match(document.page_content)
+        if match is None:
+            return document.metadata.get('patch_name', ''), '', \
+                document.page_content.splitlines()
+
+        # Entries without a skill name read 'Title -  - change'.
+        body = match['body'].replace(' -  - ', ' - ', 1)
+        lines = body.splitlines()
+        if len(lines) > 1:
+            # Rollups keep their title on the first line and one change per
+            # following line.
+            title = lines[0]
+            lines = [f"{title} {line}" for line in lines[1:]]
+        return match['patch'], match['section'], lines
+
+    def pack(self, documents):
+        groups = {}
+        for rank, document in enumerate(self.deduplicate(documents)):
+            patch, section, lines = self.split(document)
+            group = groups.setdefault((patch, section), {
+                'rank': rank, 'lines': []})
+            group['lines'].extend(
+                line for line in lines if line not in group['lines'])
+
+        ordered_groups = sorted(groups.items(), key=lambda group: (
+            self.recency_key(group[0][0]), group[1]['rank']))
+
+        # The first line over the budget ends packing, truncating its
+        # group, so a shorter lower ranked line never takes the place of a
+        # higher ranked one.
+        parts = []
+        used_tokens = 0
+        dropped_lines = 0
+        full = False
+        for (patch, section), group in ordered_groups:
+            if full:
+                dropped_lines += len(group['lines'])
+                continue
+            heading = f'Patch "{patch}" {section}:'
+            heading_tokens = self.token_counter.count(heading) + 1
+            group_lines = []
+            for index, line in enumerate(group['lines']):
+                line = f"- {line.removeprefix('- ')}"
+                tokens = self.token_counter.count(line) + 1
+                extra_tokens = tokens + (0 if group_lines else heading_tokens)
+                if used_tokens + extra_tokens > self.max_tokens:
+                    dropped_lines += len(group['lines']) - index
+                    full = True
+                    break
+                group_lines.append(line)
+                used_tokens += extra_tokens
+            if group_lines:
+                parts.append('\n'.join([heading, *group_lines]))
+
+        if self.verbose:
+            print(f"Packed {len(documents)} documents into {used_tokens} \
+context tokens, {dropped_lines} lines over the budget dropped.")
+        return '\n\n'.join(parts)
@@ -0,0 +1,16 @@
+from typing import Any
+from langchain.chains.combine_documents.stuff import StuffDocumentsChain
+
+
+class PackedStuffDocumentsChain(StuffDocumentsChain):
+    # The "stuff" chain with its context built by a ContextPacker instead
+    # of joining every document's page_content.
+    context_packer: Any
+
+    def _get_inputs(self, docs, **kwargs):
+        inputs = {
+            key: value for key, value in kwargs.items()
+            if key in self.llm_chain.prompt.input_variables
+        }
+        inputs[self.document_variable_name] = self.context_packer.pack(docs)
+        return inputs
@@ -1,11 +1,18 @@
 from langchain.prompts import PromptTemplate
 
 from langchain.chains import RetrievalQA
+from .context_packer import ContextPacker
+from .packed_stuff_documents_chain import PackedStuffDocumentsChain
+from .streaming_handler import ANSWER_GENERATION_TAG
 
 
 class RetrievalChain:
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, streaming=False, context_tokens=3000,
+                 verbose=False):
         self.llm_client = llm_client
+        self.streaming = streaming
+        self.context_tokens = context_tokens
+        self.verbose = verbose
 
     def get_qa_chain(self, retriever):
 
@@ -22,7 +29,8 @@ notes."
 Do not make up an answer or use any external knowledge.
 
 Include the patch from the metadata to the responses. If not known, no need \
-to put the patch. Order the response based on patch from latest to earliest.
+to put the patch. The context is already ordered by patch from latest to \
+earliest; keep that order in the response.
 
 CONTEXT:
 {context}
@@ -36,8 +44,15 @@ ANSWER (based ONLY on the context):"""
                 "context", "question"]
         )
 
-        return RetrievalQA.from_chain_type(
-            llm=self.llm_client,
+        # The answer LLM gets its own tag so streamed tokens can be told
+        # apart from the self-query constructor call on the same client.
+        answer_llm = self.llm_client.model_copy(update={
+            "streaming": self.streaming,
+            "tags": [*(self.llm_client.tags or []), ANSWER_GENERATION_TAG],
+        })
+
+        qa_chain = RetrievalQA.from_chain_type(
+            llm=answer_llm,
             # "stuff" puts all retrieved docs into the prompt.
             chain_type="stuff",
             # Other types: "map_reduce", "refine", "map_rerank"
@@ -45,3 +60,12 @@ ANSWER (based ONLY on the context):"""
             return_source_documents=True,
             chain_type_kwargs={"prompt": custom_prompt},
         )
+        # The stuffed context is packed within a token budget so large
+        # retrievals keep the prompt, and time to first token, bounded.
+        qa_chain.combine_documents_chain = PackedStuffDocumentsChain(
+            llm_chain=qa_chain.combine_documents_chain.llm_chain,
+            document_variable_name="context",
+            context_packer=ContextPacker(
+                self.context_tokens, verbose=self.verbose),
+        )
+        return qa_chain
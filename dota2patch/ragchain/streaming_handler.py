@@ -0,0 +1,19 @@
+from langchain_core.callbacks import AsyncCallbackHandler
+
+ANSWER_GENERATION_TAG = "answer_generation"
+
+
+class StreamingPrintHandler(AsyncCallbackHandler):
+    # Only the answer LLM is tagged, so the tokens of the self-query
+    # constructor call are never printed.
+    def __init__(self):
+        self.streamed = False
+
+    async def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if ANSWER_GENERATION_TAG not in (tags or []):
+            return
+
+        if not self.streamed:
+            print(">", end="", flush=True)
+            self.streamed = True
+        print(token, end="", flush=True)
@@ -0,0 +1,15 @@
+class TokenCounter:
+    def __init__(self, encoding_name="cl100k_base"):
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding(encoding_name)
+            self.encode = encoding.encode_ordinary
+        except Exception:
+            # tiktoken downloads its encodings on first use, so it can be
+            # unavailable offline. Roughly four characters per token.
+            self.encode = None
+
+    def count(self, text):
+        if self.encode is None:
+            return len(text) // 4 + 1
+        return len(self.encode(text))
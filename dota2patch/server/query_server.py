@@ -0,0 +1,134 @@
+from aiohttp import web
+import asyncio
+import json
+from ..query.answer_cache import AnswerCache
+from ..query.batch_query import BatchQuery
+
+
+class QueryServer:
+    # One process answers the questions of every client: the chain, its
+    # HTTP connection pools and the in-process caches are built once at
+    # startup. Identical questions in flight share one answer, at most
+    # max_concurrency questions run at a time and new questions are
+    # rejected with 503 once max_pending are waiting or running.
+    def __init__(self, client_factory, max_concurrency=4, max_pending=64,
+                 request_timeout=120):
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.batch_query = None
+        self.pooled_index = None
+        # normalized question -> task answering it
+        self.in_flight = {}
+        self.stats = {
+            'requests': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'answered': 0,
+            'failed': 0,
+        }
+
+    async def warm_up(self, app):
+        loop = asyncio.get_running_loop()
+        chat_query = await loop.run_in_executor(
+            None, self.client_factory.chat_query)
+        self.pooled_index = await self.client_factory.pinecone_instance() \
+            .apool_connections(self.client_factory.vector_store())
+        self.batch_query = BatchQuery(chat_query)
+        print("Query clients are ready.")
+
+    async def close(self, app):
+        for task in list(self.in_flight.values()):
+            task.cancel()
+        if self.pooled_index is not None:
+            await self.pooled_index.close()
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024)
+        app.on_startup.append(self.warm_up)
+        app.on_cleanup.append(self.close)
+        app.add_routes([
+            web.post('/query', self.handle_query),
+            web.get('/health', self.handle_health),
+        ])
+        return app
+
+    def run(self, host, port):
+        web.run_app(self.app(), host=host, port=port)
+
+    async def answer(self, key, question):
+        try:
+            async with self.semaphore:
+                record = await self.batch_query.answer(
+                    {'id': None, 'question': question})
+            self.stats['answered'] += 1
+            return record
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        finally:
+            del self.in_flight[key]
+
+    @staticmethod
+    def error_response(status, message, headers=None):
+        return web.json_response(
+            {'error': message}, status=status, headers=headers)
+
+    async def handle_query(self, request):
+        self.stats['requests'] += 1
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError, LookupError):
+            # Also bodies that do not decode with their declared charset,
+            # UTF-8 by default, or declare an unknown one.
+            return self.error_response(400, "The body is not valid JSON.")
+
+        question = body.get('question') if isinstance(body, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            return self.error_response(400, "A question is required.")
+
+        key = AnswerCache.normalize(question)
+        task = self.in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.stats['coalesced'] += 1
+        elif len(self.in_flight) >= self.max_pending:
+            self.stats['rejected'] += 1
+            return self.error_response(
+                503, "Too many questions in flight, retry later.",
+                headers={'Retry-After': '1'})
+        else:
+            task = asyncio.ensure_future(self.answer(key, question))
+            # Failures are reported to every waiting request, so they are
+            # marked as retrieved even when all of them went away.
+            task.add_done_callback(
+                lambda task: task.cancelled() or task.exception())
+            self.in_flight[key] = task
+
+        try:
+            # A client that disconnects does not cancel the answer for the
+            # other requests waiting on it.
+            record = await asyncio.wait_for(
+                asyncio.shield(task), self.request_timeout)
+        except asyncio.TimeoutError:
+            return self.error_response(504, "Timed out answering.")
+        except Exception as e:
+            return self.error_response(500, str(e))
+
+        return web.json_response({
+            **record,
+            'id': body.get('id'),
+            'question': question,
+            'coalesced': coalesced,
+        })
+
+    async def handle_health(self, request):
+        return web.json_response({
+            'status': 'ok',
+            'in_flight': len(self.in_flight),
+            'max_concurrency': self.max_concurrency,
+            'max_pending': self.max_pending,
+            **self.stats,
+        })
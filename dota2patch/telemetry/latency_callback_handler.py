@@ -0,0 +1,90 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from ..ragchain.streaming_handler import ANSWER_GENERATION_TAG
+from .latency_recorder import LatencyRecorder
+import time
+
+
+class LatencyCallbackHandler(BaseCallbackHandler):
+    # Times the LLM calls and the outermost retriever run of one query and
+    # records token and document counts on the query's trace.
+    run_inline = True
+
+    def __init__(self, trace):
+        self.trace = trace
+        # run id -> (stage name, start)
+        self.runs = {}
+
+    def start_llm(self, run_id, tags):
+        self.runs[run_id] = (
+            'answer generation' if ANSWER_GENERATION_TAG in (tags or [])
+            else 'self-query llm', time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id,
+                            tags=None, **kwargs):
+        self.start_llm(run_id, tags)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None,
+                     **kwargs):
+        self.start_llm(run_id, tags)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self.runs.get(run_id)
+        if run is None or run[0] != 'answer generation':
+            return
+
+        _, start = run
+        LatencyRecorder.add_stage(
+            'time to first token', start, (time.perf_counter() - start) * 1000,
+            trace=self.trace)
+        self.runs[run_id] = ('answer generation (streamed)', start)
+
+    @staticmethod
+    def token_usage(response):
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, 'message', None)
+                    metadata = getattr(message, 'usage_metadata', None) or {}
+                    usage = {
+                        'prompt_tokens': metadata.get('input_tokens', 0),
+                        'completion_tokens': metadata.get('output_tokens', 0),
+                    }
+        return {
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+        }
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            return
+
+        stage_name, start = run
+        LatencyRecorder.add_stage(
+            stage_name.removesuffix(' (streamed)'), start,
+            (time.perf_counter() - start) * 1000, trace=self.trace,
+            **self.token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.runs.pop(run_id, None)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        # Retrievers wrapping a fallback retriever start a nested run.
+        if any(stage_name == 'retrieval'
+               for stage_name, _ in self.runs.values()):
+            return
+        self.runs[run_id] = ('retrieval', time.perf_counter())
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            return
+
+        stage_name, start = run
+        LatencyRecorder.add_stage(
+            stage_name, start, (time.perf_counter() - start) * 1000,
+            trace=self.trace, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self.runs.pop(run_id, None)
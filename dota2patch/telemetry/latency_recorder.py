@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import os
+import threading
+import time
+
+# The trace of the query or insert running in the current thread or task,
+# so instrumented code does not need a reference to the recorder.
+current_trace = ContextVar('current_trace', default=None)
+
+# Stages that contain other stages; the remaining time of a retrieval is
+# reported as the vector store (and lexical index) search.
+NESTED_STAGES = ('self-query llm', 'query embedding')
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.traces = []
+
+    @contextmanager
+    def trace(self, kind, label):
+        trace = {
+            'kind': kind,
+            'label': label,
+            'timestamp': time.time(),
+            'started_at': time.perf_counter(),
+            'stages': [],
+            'lock': threading.Lock(),
+        }
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+            trace['total_ms'] = (
+                time.perf_counter() - trace['started_at']) * 1000
+            self.derive_search_stages(trace)
+            with self.lock:
+                self.traces.append(trace)
+
+    @staticmethod
+    def add_stage(name, start, duration_ms, trace=None, **fields):
+        trace = trace or current_trace.get()
+        if trace is None:
+            return
+
+        with trace['lock']:
+            trace['stages'].append({
+                'stage': name,
+                'start_ms': round((start - trace['started_at']) * 1000, 3),
+                'ms': round(duration_ms, 3),
+                **fields,
+            })
+
+    @staticmethod
+    @contextmanager
+    def stage(name, trace=None, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            LatencyRecorder.add_stage(
+                name, start, (time.perf_counter() - start) * 1000,
+                trace=trace, **fields)
+
+    @staticmethod
+    def derive_search_stages(trace):
+        stages = trace['stages']
+        for retrieval in [stage for stage in stages
+                          if stage['stage'] == 'retrieval']:
+            end_ms = retrieval['start_ms'] + retrieval['ms']
+            nested_ms = sum(
+                stage['ms'] for stage in stages
+                if stage['stage'] in NESTED_STAGES
+                and retrieval['start_ms'] <= stage['start_ms'] < end_ms)
+            stages.append({
+                'stage': 'search',
+                'start_ms': retrieval['start_ms'],
+                'ms': round(max(retrieval['ms'] - nested_ms, 0.0), 3),
+            })
+
+    @staticmethod
+    def percentile(values, fraction):
+        values = sorted(values)
+        if not values:
+            return 0.0
+        position = (len(values) - 1) * fraction
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (
+            position - lower)
+
+    def completed_traces(self):
+        with self.lock:
+            return list(self.traces)
+
+    def stage_durations(self):
+        # (kind, stage) -> durations in ms, summed per trace
+        durations = {}
+        for trace in self.completed_traces():
+            per_trace = {'total': trace['total_ms']}
+            for stage in trace['stages']:
+                per_trace[stage['stage']] = per_trace.get(
+                    stage['stage'], 0.0) + stage['ms']
+            for stage_name, duration in per_trace.items():
+                durations.setdefault(
+                    (trace['kind'], stage_name), []).append(duration)
+        return durations
+
+    @staticmethod
+    def trace_record(trace):
+        return {
+            key: value for key, value in trace.items()
+            if key not in ('started_at', 'lock')
+        }
+
+    def export_jsonl(self, path):
+        with open(path, 'a', encoding='utf-8') as output:
+            for trace in self.completed_traces():
+                output.write(json.dumps(self.trace_record(trace)) + '\n')
+
+    def export_openmetrics(self, path):
+        lines = [
+            '# TYPE dota2patch_stage_duration_seconds summary',
+            '# UNIT dota2patch_stage_duration_seconds seconds',
+            '# HELP dota2patch_stage_duration_seconds Wall time per stage.',
+        ]
+        for (kind, stage_name), durations in sorted(
+                self.stage_durations().items()):
+            labels = f'kind="{kind}",stage="{stage_name}"'
+            for quantile in (0.5, 0.95):
+                lines.append(
+                    f'dota2patch_stage_duration_seconds{{{labels},quantile="\
+{quantile}"}} {self.percentile(durations, quantile) / 1000:.6f}')
+            lines.append(f'dota2patch_stage_duration_seconds_sum{{{labels}}} \
+{sum(durations) / 1000:.6f}')
+            lines.append(
+                f'dota2patch_stage_duration_seconds_count{{{labels}}} \
+{len(durations)}')
+
+        tokens = {}
+        documents = {}
+        for trace in self.completed_traces():
+            for stage in trace['stages']:
+                for token_type in ('prompt_tokens', 'completion_tokens'):
+                    key = (trace['kind'], stage['stage'], token_type)
+                    tokens[key] = tokens.get(key, 0) + stage.get(
+                        token_type, 0)
+                if 'documents' in stage:
+                    key = (trace['kind'], stage['stage'])
+                    documents[key] = documents.get(key, 0) + \
+                        stage['documents']
+
+        lines += [
+            '# TYPE dota2patch_llm_tokens counter',
+            '# HELP dota2patch_llm_tokens Tokens used by LLM calls.',
+        ]
+        for (kind, stage_name, token_type), count in sorted(tokens.items()):
+            if count:
+                lines.append(f'dota2patch_llm_tokens_total{{kind="{kind}",\
+stage="{stage_name}",type="{token_type.removesuffix("_tokens")}"}} {count}')
+        lines += [
+            '# TYPE dota2patch_documents counter',
+            '# HELP dota2patch_documents Documents retrieved or upserted.',
+        ]
+        for (kind, stage_name), count in sorted(documents.items()):
+            lines.append(f'dota2patch_documents_total{{kind="{kind}",\
+stage="{stage_name}"}} {count}')
+        lines.append('# EOF')
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as output:
+            output.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+    def export(self, path, output_format):
+        if output_format == 'openmetrics':
+            self.export_openmetrics(path)
+        else:
+            self.export_jsonl(path)
+        print(f"Latency profile written to {path}")
+
+    def report(self):
+        traces = self.completed_traces()
+        if not traces:
+            return
+
+        print("\nLatency profile (ms):")
+        for trace in traces:
+            stages = {}
+            for stage in trace['stages']:
+                stages[stage['stage']] = stages.get(
+                    stage['stage'], 0.0) + stage['ms']
+            breakdown = ', '.join(
+                f"{stage_name} {duration:.0f}"
+                for stage_name, duration in stages.items())
+            print(f"  [{trace['kind']}] {trace['label'][:60]!r}: \
+{trace['total_ms']:.0f} total ({breakdown})")
+
+        print("\n  stage                          n      p50      p95")
+        for (kind, stage_name), durations in sorted(
+                self.stage_durations().items()):
+            print(f"  {f'{kind}/{stage_name}':<28} {len(durations):>4} \
+{self.percentile(durations, 0.5):>8.1f} \
+{self.percentile(durations, 0.95):>8.1f}")
@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+
+
+class StartupProfiler:
+    def __init__(self, started_at=None):
+        self.started_at = started_at or time.perf_counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # (thread name, depth, label, start offset, duration) in ms
+        self.stages = []
+        self.marks = []
+        # (thread name, depth, module, start offset, duration, self time)
+        # in ms
+        self.imports = []
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def mark(self, label):
+        with self.lock:
+            self.marks.append((label, self.elapsed_ms()))
+
+    @contextmanager
+    def stage(self, label):
+        depth = getattr(self.local, 'depth', 0)
+        self.local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.local.depth = depth
+            with self.lock:
+                self.stages.append((
+                    threading.current_thread().name, depth, label,
+                    (start - self.started_at) * 1000, duration))
+
+    def track_imports(self):
+        # Times every module imported from now on, with the time spent in
+        # the modules it imports itself taken out of its self time, like
+        # python -X importtime.
+        original_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(),
+                         level=0):
+            module = name
+            if level:
+                try:
+                    module = importlib.util.resolve_name(
+                        '.' * level + name, (globals or {}).get(
+                            '__package__'))
+                except (ImportError, ValueError):
+                    pass
+            # Named after the first package that is not loaded yet, since
+            # importing a.b.c also imports a.b.
+            parts = module.split('.')
+            module = next((
+                '.'.join(parts[:end]) for end in range(1, len(parts) + 1)
+                if '.'.join(parts[:end]) not in sys.modules), None)
+            if module is None:
+                return original_import(
+                    name, globals, locals, fromlist, level)
+
+            # Time spent in nested imports, one total per open import.
+            nested = getattr(self.local, 'nested_imports', None)
+            if nested is None:
+                nested = self.local.nested_imports = []
+            nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                return original_import(
+                    name, globals, locals, fromlist, level)
+            finally:
+                duration = (time.perf_counter() - start) * 1000
+                own = duration - nested.pop()
+                if nested:
+                    nested[-1] += duration
+                with self.lock:
+                    self.imports.append((
+                        threading.current_thread().name, len(nested), module,
+                        (start - self.started_at) * 1000, duration, own))
+
+        builtins.__import__ = timed_import
+
+    def report_imports(self, slowest=15):
+        with self.lock:
+            imports = list(self.imports)
+        if not imports:
+            return
+
+        total = sum(own for *_, own in imports)
+        print(f"\nImports ({len(imports)} modules, {total:.1f} ms). Imported \
+directly by the program, cumulative:")
+        for thread_name, depth, module, start, duration, own in sorted(
+                imports, key=lambda record: record[3]):
+            if depth == 0:
+                print(f"  {start:9.1f}  {module}: {duration:.1f} ms "
+                      f"[{thread_name}]")
+        print(f"Slowest {slowest} modules by self time:")
+        for thread_name, depth, module, start, duration, own in sorted(
+                imports, key=lambda record: -record[5])[:slowest]:
+            print(f"  {own:9.1f}  {module} ({duration:.1f} ms cumulative)")
+
+    def report(self):
+        print("\nStartup profile (ms since the CLI module was imported):")
+        for label, at in self.marks:
+            print(f"  {at:9.1f}  {label}")
+
+        with self.lock:
+            stages = sorted(self.stages, key=lambda stage: stage[3])
+        for thread_name, depth, label, start, duration in stages:
+            print(f"  {start:9.1f}  {'  ' * depth}{label}: {duration:.1f} ms "
+                  f"[{thread_name}]")
+        self.report_imports()
@@ -0,0 +1,28 @@
+from langchain_core.embeddings import Embeddings
+from .latency_recorder import LatencyRecorder
+
+
+class TimedEmbeddings(Embeddings):
+    # Records embedding calls on the current trace. Wraps the cached
+    # client, so cache hits show up as (nearly) free.
+    def __init__(self, embeddings_client):
+        self.embeddings_client = embeddings_client
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings_client, name)
+
+    def embed_documents(self, texts):
+        with LatencyRecorder.stage('document embedding', documents=len(texts)):
+            return self.embeddings_client.embed_documents(texts)
+
+    def embed_query(self, text):
+        with LatencyRecorder.stage('query embedding'):
+            return self.embeddings_client.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        with LatencyRecorder.stage('document embedding', documents=len(texts)):
+            return await self.embeddings_client.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        with LatencyRecorder.stage('query embedding'):
+            return await self.embeddings_client.aembed_query(text)
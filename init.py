@@ -1,4 +1,8 @@
-import dota2patch.handler as handler
+import time
+
+started_at = time.perf_counter()
+
+import dota2patch.handler as handler  # noqa: E402
 
 if __name__ == "__main__":
-    handler.get_data()
+    handler.get_data(obj={'started_at': started_at})
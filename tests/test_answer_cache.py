@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from dota2patch.query.answer_cache import AnswerCache
+
+
+class CountingEmbeddings:
+    # Embeds every question the same way and counts the calls.
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [1.0, 0.0, 0.0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+@pytest.fixture
+def answer_cache(tmp_path):
+    return AnswerCache(CountingEmbeddings(),
+                       path=str(tmp_path / 'answers.json'))
+
+
+def make_result(answer, patch_numbers):
+    return {'result': answer, 'source_documents': [
+        Document(id=f"{patch_number}#1", page_content=answer,
+                 metadata={'patch_number': patch_number})
+        for patch_number in patch_numbers]}
+
+
+def test_a_miss_embeds_the_question_once(answer_cache):
+    query = 'What changed for Pudge in 7.38?'
+
+    result, cache_status, vector = answer_cache.lookup(query)
+    assert (result, cache_status) == (None, None)
+    answer_cache.store_with_vector(
+        query, make_result('Meat Hook was buffed.', ['7.38']), vector)
+    assert answer_cache.embeddings_client.calls == [query]
+
+    result, cache_status, vector = answer_cache.lookup(
+        'what changed for pudge in 7.38')
+    assert (result['result'], cache_status, vector) \
+        == ('Meat Hook was buffed.', 'exact', None)
+
+    result, cache_status, _ = asyncio.run(
+        answer_cache.alookup('Which Pudge changes came in 7.38?'))
+    assert result['result'] == 'Meat Hook was buffed.'
+    assert cache_status.startswith('semantic')
+    assert len(answer_cache.embeddings_client.calls) == 2
+
+
+def test_inserts_invalidate_questions_without_a_patch(answer_cache):
+    answer_cache.store_with_vector(
+        'What changed for Pudge?', make_result('Hook.', ['7.37']), None)
+    answer_cache.store_with_vector(
+        'How strong is Axe?', make_result('Strong.', []), None)
+    answer_cache.store_with_vector(
+        'What changed for Pudge in 7.37?', make_result('Hook.', ['7.37']),
+        None)
+    answer_cache.store_with_vector(
+        'What changed for Axe in 7.38?', make_result('Call.', ['7.38']),
+        None)
+
+    assert answer_cache.invalidate_patches({'7.38c'}) == 3
+    assert [entry['query'] for entry in answer_cache.entries.values()] \
+        == ['What changed for Pudge in 7.37?']
+    assert answer_cache.invalidate_patches(set()) == 0
+
+    reopened = AnswerCache(path=answer_cache.path)
+    assert list(reopened.entries) == ['what changed for pudge in 7.37']
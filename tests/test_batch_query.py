@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import httpx
+import openai
+from langchain_core.outputs import LLMResult
+
+from dota2patch.query.batch_query import BatchQuery
+
+
+class FlakyChatQuery:
+    # Each call reports 100 prompt and 20 completion tokens; the first
+    # failures calls for a question then time out.
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    async def aanswer(self, question, callbacks):
+        self.calls.append(question)
+        for callback in callbacks:
+            callback.on_llm_end(LLMResult(generations=[[]], llm_output={
+                'token_usage': {'prompt_tokens': 100,
+                                'completion_tokens': 20,
+                                'total_tokens': 120}}))
+        if self.calls.count(question) <= self.failures:
+            raise openai.APITimeoutError(
+                request=httpx.Request('POST', 'https://api.openai.com'))
+        return {'result': f"Answer to {question}",
+                'source_documents': []}, 'miss'
+
+
+def make_batch_query(chat_query):
+    batch_query = BatchQuery(chat_query, concurrency=2)
+    batch_query.backoff = lambda retry_state: 0
+    return batch_query
+
+
+def test_token_usage_is_only_the_successful_attempt():
+    chat_query = FlakyChatQuery(failures=2)
+
+    record = asyncio.run(make_batch_query(chat_query).answer(
+        {'id': '1', 'question': 'What changed for Pudge?'}))
+
+    assert len(chat_query.calls) == 3
+    assert record['attempts'] == 3
+    assert record['token_usage']['prompt_tokens'] == 100
+    assert record['token_usage']['completion_tokens'] == 20
+    assert record['token_usage']['total_tokens'] == 120
+
+
+def test_resume_drops_a_partial_line_before_appending(tmp_path):
+    questions_file = tmp_path / 'questions.jsonl'
+    questions_file.write_text(''.join(
+        json.dumps({'id': str(index), 'question': f"Question {index}"})
+        + '\n' for index in range(1, 4)), encoding='utf-8')
+    output_file = tmp_path / 'answers.jsonl'
+    output_file.write_text(
+        json.dumps({'id': '1', 'answer': 'Answer to Question 1'}) + '\n'
+        + '{"id": "2", "answ', encoding='utf-8')
+    chat_query = FlakyChatQuery()
+
+    asyncio.run(make_batch_query(chat_query).run(
+        str(questions_file), str(output_file), resume=True))
+
+    assert sorted(chat_query.calls) == ['Question 2', 'Question 3']
+    records = [json.loads(line) for line in
+               output_file.read_text(encoding='utf-8').splitlines()]
+    assert sorted(record['id'] for record in records) == ['1', '2', '3']
+
+
+def test_truncate_partial_line_reads_back_across_blocks(tmp_path):
+    output_file = tmp_path / 'answers.jsonl'
+    complete = 'a' * 50 + '\n' + 'b' * 50 + '\n'
+    for partial, expected in (('', complete), ('c' * 70, complete),
+                              ('c' * 200, complete)):
+        output_file.write_text(complete + partial, encoding='utf-8')
+        BatchQuery.truncate_partial_line(str(output_file), block_size=16)
+        assert output_file.read_text(encoding='utf-8') == expected
+
+    output_file.write_text('c' * 40, encoding='utf-8')
+    BatchQuery.truncate_partial_line(str(output_file), block_size=16)
+    assert output_file.read_text(encoding='utf-8') == ''
@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+
+from dota2patch.ragchain.context_packer import ContextPacker
+
+
+class WordCounter:
+    # One token per word, so budgets are easy to follow.
+    def count(self, text):
+        return len(text.split())
+
+
+def make_packer(max_tokens):
+    packer = ContextPacker(max_tokens=max_tokens)
+    packer.token_counter = WordCounter()
+    return packer
+
+
+def make_document(document_id, patch, section, body):
+    return Document(id=document_id,
+                    page_content=f'Patch "{patch}" for {section}: {body}',
+                    metadata={'patch_number': patch})
+
+
+DOCUMENTS = [
+    make_document('hook', '7.38', 'heroes(abilities)',
+                  'Pudge - Meat Hook - Cast point reduced'),
+    make_document('rot', '7.38', 'heroes(abilities)',
+                  'Pudge - Rot - Damage increased from 30 to 40 at '
+                  'every level'),
+    make_document('bkb', '7.37', 'items(hero_items)',
+                  'Black King Bar -  - Cost reduced'),
+]
+
+
+def test_everything_fits_within_a_large_budget():
+    assert make_packer(100).pack(DOCUMENTS) == (
+        'Patch "7.38" heroes(abilities):\n'
+        '- Pudge - Meat Hook - Cast point reduced\n'
+        '- Pudge - Rot - Damage increased from 30 to 40 at every level\n\n'
+        'Patch "7.37" items(hero_items):\n'
+        '- Black King Bar - Cost reduced')
+
+
+def test_packing_stops_at_the_first_line_over_the_budget():
+    # heading 4 + hook 10 tokens, then rot's 15 tokens do not fit. bkb's
+    # heading 4 + 8 would, but it ranks below rot.
+    assert make_packer(26).pack(DOCUMENTS) == (
+        'Patch "7.38" heroes(abilities):\n'
+        '- Pudge - Meat Hook - Cast point reduced')
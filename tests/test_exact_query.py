@@ -0,0 +1,53 @@
+import pytest
+
+from dota2patch.fetcher.patch_versions import patch_family_range
+from dota2patch.query.exact_query import ExactQuery
+from dota2patch.query.fast_query_parser import FastQueryParser
+
+HEROES = {1: 'Axe', 2: 'Pudge'}
+ITEMS = {10: 'Black King Bar'}
+ABILITIES = {100: 'Meat Hook'}
+PATCH_VERSIONS = ['7.35', '7.36', '7.37', '7.38', '7.38c']
+
+
+@pytest.fixture
+def exact_query():
+    return ExactQuery(None, FastQueryParser(
+        HEROES, ITEMS, ABILITIES, PATCH_VERSIONS))
+
+
+@pytest.mark.parametrize('query, description', [
+    ("List all Pudge changes", ""),
+    ("show me every change to Black King Bar in 7.38", "in 7.38"),
+    ("Show all Axe changes", ""),
+    ("diff Pudge 7.37 7.38", "from 7.37 to 7.38"),
+    ("Compare Axe in 7.38 and 7.36", "from 7.36 to 7.38"),
+    ("What changed for Meat Hook from 7.36 to 7.38?", "from 7.36 to 7.38"),
+    ("Axe changes between 7.35 and 7.37", "from 7.35 to 7.37"),
+    ("Pudge changes since 7.37", "since 7.37"),
+])
+def test_list_and_diff_commands_are_answered_exactly(exact_query, query,
+                                                     description):
+    assert exact_query.plan(query)[0] == description
+
+
+def test_a_diff_covers_the_changes_after_the_first_patch(exact_query):
+    _, min_sort_key, max_sort_key = exact_query.plan("diff Pudge 7.37 7.38")
+
+    assert min_sort_key == patch_family_range('7.37')[1] + 1
+    assert max_sort_key == patch_family_range('7.38')[1]
+
+
+@pytest.mark.parametrize('query', [
+    "where did the 7.37 nerf from 7.36 come from",
+    "Summarize all changes to Axe",
+    "Why were all the changes to Pudge in 7.38 made?",
+    "Explain every change to Black King Bar",
+    "Can you list all Axe changes?",
+    "What were all the changes to Axe in 7.38?",
+    "Summarize the Pudge changes from 7.36 to 7.38",
+    "How did Meat Hook change in 7.38?",
+    "Did Meat Hook cast point change from 0.30 to 0.25?",
+])
+def test_other_questions_go_through_the_llm(exact_query, query):
+    assert exact_query.plan(query) is None
@@ -0,0 +1,48 @@
+import pytest
+
+from dota2patch.query.fast_query_parser import FastQueryParser
+
+HEROES = {1: 'Axe', 2: 'Pudge', 3: 'Io'}
+ITEMS = {10: 'Blink Dagger', 11: 'Black King Bar'}
+ABILITIES = {100: 'Meat Hook', 101: 'Rot', 102: "Berserker's Call"}
+PATCH_VERSIONS = ['7.36', '7.37', '7.37b', '7.38', '7.38c']
+
+
+@pytest.fixture
+def query_parser():
+    return FastQueryParser(HEROES, ITEMS, ABILITIES, PATCH_VERSIONS)
+
+
+@pytest.mark.parametrize('query', [
+    "What is the latest change to Axe?",
+    "Show me the newest Pudge update",
+    "What was in the most recent patch?",
+    "latest Blink Dagger nerfs",
+])
+def test_explicit_latest_questions_want_the_latest_patch(query_parser,
+                                                         query):
+    assert query_parser.parse(query).latest
+
+
+@pytest.mark.parametrize('query', [
+    "What was the last hit change in 7.38?",
+    "How did current cooldown of Blink Dagger change?",
+    "What changed recently for Axe?",
+    "What changed in the last patch for Pudge?",
+    "Any recent Meat Hook buffs?",
+    "What was the latest change to Axe in 7.37?",
+    "What changed recently from 7.36 to 7.38",
+    "Latest Pudge changes since 7.36",
+])
+def test_other_questions_do_not_want_only_the_latest_patch(query_parser,
+                                                           query):
+    assert not query_parser.parse(query).latest
+
+
+def test_a_named_range_keeps_every_patch_in_it(query_parser):
+    parsed_query = query_parser.parse(
+        "what changed recently from 7.36 to 7.38")
+
+    assert parsed_query.patch_versions == ['7.36', '7.37', '7.37b', '7.38',
+                                           '7.38c']
+    assert not parsed_query.latest
@@ -0,0 +1,94 @@
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from dota2patch.database.ingest_manifest import IngestManifest
+from dota2patch.database.ingest_pipeline import IngestPipeline
+from dota2patch.database.local_vector_store import LocalVectorStore
+
+NAMESPACE = 'local:test'
+
+
+class HashEmbeddings:
+    # Deterministic embeddings; texts listed in failing raise instead.
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.embedded = []
+
+    def embed_query(self, text):
+        if text in self.failing:
+            raise ValueError(f"cannot embed {text!r}")
+        self.embedded.append(text)
+        seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).normal(size=8).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def make_documents(patch_number, skill_names, suffix=''):
+    return [Document(page_content=f"{skill_name} changed{suffix}.",
+                     metadata={'patch_number': patch_number,
+                               'type': 'heroes', 'subtype': 'abilities',
+                               'title': 'Pudge', 'skill_name': skill_name})
+            for skill_name in skill_names]
+
+
+def make_pipeline(tmp_path, embeddings):
+    return IngestPipeline(
+        LocalVectorStore(embeddings, path=str(tmp_path / 'local_index')),
+        IngestManifest(str(tmp_path / 'manifest.json')), NAMESPACE,
+        max_batch_size=2, max_in_flight=2)
+
+
+def test_reingest_deletes_exactly_the_removed_note(tmp_path):
+    embeddings = HashEmbeddings()
+    skill_names = ['Meat Hook', 'Rot', 'Flesh Heap', 'Dismember']
+    make_pipeline(tmp_path, embeddings).run(
+        make_documents('7.37', skill_names)
+        + make_documents('7.38', skill_names))
+    ids = LocalVectorStore(embeddings, path=str(tmp_path / 'local_index')).ids
+    removed_id = IngestManifest.document_id(
+        make_documents('7.38', ['Rot'])[0].metadata)
+    assert len(ids) == 8 and removed_id in ids
+
+    embeddings.embedded.clear()
+    pipeline = make_pipeline(tmp_path, embeddings)
+    stats = pipeline.run(
+        make_documents('7.38', ['Meat Hook', 'Flesh Heap'])
+        + make_documents('7.38', ['Dismember'], suffix=' again'))
+
+    assert stats['removed'] == 1
+    assert stats['unchanged'] == 2
+    assert stats['upserted'] == 1
+    assert embeddings.embedded == ['Dismember changed again.']
+    assert pipeline.updated_patch_numbers == {'7.38'}
+    vector_store = LocalVectorStore(
+        embeddings, path=str(tmp_path / 'local_index'))
+    assert sorted(vector_store.ids) == sorted(
+        document_id for document_id in ids if document_id != removed_id)
+    # 7.37 was not part of the second run, so none of its notes go.
+    assert sorted(IngestManifest(str(tmp_path / 'manifest.json')).entries(
+        NAMESPACE)) == sorted(vector_store.ids)
+
+
+def test_worker_exception_is_raised_in_the_caller(tmp_path):
+    embeddings = HashEmbeddings(failing={'Rot changed.'})
+    pipeline = make_pipeline(tmp_path, embeddings)
+
+    with pytest.raises(RuntimeError) as error:
+        pipeline.run(make_documents(
+            '7.38', ['Meat Hook', 'Rot', 'Flesh Heap', 'Dismember']))
+
+    assert str(error.value) == "Ingest failed: cannot embed 'Rot changed.'"
+    assert isinstance(error.value.__cause__, ValueError)
+    # Batches that were stored stay in the manifest; the failed one is
+    # embedded again on the next run.
+    entries = IngestManifest(str(tmp_path / 'manifest.json')).entries(
+        NAMESPACE)
+    rot_id = IngestManifest.document_id(
+        make_documents('7.38', ['Rot'])[0].metadata)
+    assert rot_id not in entries
+    assert sorted(entries) == sorted(pipeline.vector_store.ids)
@@ -0,0 +1,128 @@
+import math
+
+import pytest
+from langchain_core.documents import Document
+
+from dota2patch.database.lexical_index import LexicalIndex
+
+DOCUMENTS = [
+    # pudge meat hook damage increased: 5 tokens
+    Document(id='pudge', page_content='Pudge Meat Hook damage increased',
+             metadata={'type': 'heroes'}),
+    # meat hook cast point reduced: 5 tokens
+    Document(id='hook', page_content='Meat Hook cast point reduced',
+             metadata={'type': 'heroes'}),
+    # axe berserker's call duration increased: 5 tokens
+    Document(id='axe', page_content="Axe Berserker's Call duration increased",
+             metadata={'type': 'heroes'}),
+    # black king bar cost increased black king bar duration reduced:
+    # 10 tokens
+    Document(id='bkb', page_content='Black King Bar cost increased. '
+             'Black King Bar duration reduced.',
+             metadata={'type': 'items'}),
+]
+K1 = 1.2
+B = 0.75
+# 25 tokens over 4 documents.
+AVERAGE_LENGTH = 25 / 4
+
+
+def idf(document_count, document_frequency):
+    return math.log(1 + (document_count - document_frequency + 0.5)
+                    / (document_frequency + 0.5))
+
+
+def term_score(idf, count, length):
+    return idf * count * (K1 + 1) / (
+        count + K1 * (1 - B + B * length / AVERAGE_LENGTH))
+
+
+@pytest.fixture
+def lexical_index(tmp_path):
+    lexical_index = LexicalIndex(path=str(tmp_path / 'lexical_index'))
+    lexical_index.add_documents(DOCUMENTS)
+    return lexical_index
+
+
+def scores(results):
+    return [(document.id, score, matched)
+            for document, score, matched in results]
+
+
+def test_scores_match_a_hand_computed_bm25(lexical_index):
+    # meat and hook are each in 2 of 4 documents, damage in 1, and a
+    # 5 token document has a length norm of 1.2 * (0.25 + 0.75 * 0.8).
+    hook, damage = idf(4, 2), idf(4, 1)
+    assert hook == pytest.approx(math.log(2))
+    assert damage == pytest.approx(math.log(10 / 3))
+    assert term_score(hook, 1, 5) == pytest.approx(hook * 2.2 / 2.02)
+
+    assert scores(lexical_index.search('Meat Hook damage?')) == [
+        ('pudge', pytest.approx((2 * hook + damage) * 2.2 / 2.02), 1.0),
+        ('hook', pytest.approx(2 * hook * 2.2 / 2.02), 2 / 3),
+    ]
+
+    # increased is in 3 documents, duration in 2; bkb repeats neither
+    # but is twice as long.
+    increased, duration = idf(4, 3), idf(4, 2)
+    assert term_score(duration, 1, 10) == pytest.approx(
+        duration * 2.2 / 2.74)
+    assert scores(lexical_index.search('What has increased duration')) == [
+        ('axe', pytest.approx(
+            term_score(increased, 1, 5) + term_score(duration, 1, 5)), 1.0),
+        ('bkb', pytest.approx(
+            term_score(increased, 1, 10) + term_score(duration, 1, 10)),
+         1.0),
+        ('pudge', pytest.approx(term_score(increased, 1, 5)), 0.5),
+    ]
+
+    # black and king appear twice in bkb.
+    assert scores(lexical_index.search('black king')) == [
+        ('bkb', pytest.approx(2 * term_score(idf(4, 1), 2, 10)), 1.0)]
+
+
+def test_search_filters_and_limits_results(lexical_index):
+    # pudge and axe tie, bkb is longer.
+    results = lexical_index.search('increased', k=2)
+    assert {document.id for document, _, _ in results} == {'axe', 'pudge'}
+
+    results = lexical_index.search('increased', filter={'type': 'items'})
+    assert [document.id for document, _, _ in results] == ['bkb']
+    assert lexical_index.search('the changes') == []
+
+
+def test_search_after_an_add_sees_the_new_document(lexical_index):
+    assert lexical_index.search('rupture') == []
+    assert not lexical_index.dirty
+
+    lexical_index.add_documents([Document(
+        id='bloodseeker', page_content='Rupture damage increased',
+        metadata={'type': 'heroes'})])
+    assert lexical_index.dirty
+
+    results = lexical_index.search('rupture')
+    assert [document.id for document, _, _ in results] == ['bloodseeker']
+    assert not lexical_index.dirty
+    # damage is now in 2 of 5 documents.
+    assert scores(lexical_index.search('damage'))[0][1] == pytest.approx(
+        idf(5, 2) * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 3 / (28 / 5))))
+
+    lexical_index.add_documents([Document(
+        id='bloodseeker', page_content='Thirst removed',
+        metadata={'type': 'heroes'})])
+    lexical_index.delete(['pudge'])
+    assert lexical_index.search('rupture') == []
+    assert lexical_index.search('damage') == []
+    assert [document.id for document, _, _ in
+            lexical_index.search('thirst')] == ['bloodseeker']
+
+
+def test_index_round_trips_through_save_and_load(lexical_index):
+    lexical_index.save()
+
+    reopened = LexicalIndex(path=lexical_index.path)
+
+    assert reopened.ids == lexical_index.ids
+    for query in ('meat hook damage', 'increased duration', 'black king'):
+        assert scores(reopened.search(query)) == scores(
+            lexical_index.search(query))
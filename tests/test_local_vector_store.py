@@ -0,0 +1,201 @@
+import numpy as np
+import pytest
+
+from dota2patch.database.local_vector_store import LocalVectorStore
+from dota2patch.database.metadata_filter import MetadataColumns
+
+PATCHES = [('7.36', 7036000), ('7.37', 7037000), ('7.38', 7038000),
+           ('7.38c', 7038003)]
+TITLES = ['Pudge', 'Axe', 'Black King Bar', 'Map']
+DIMENSIONS = 8
+
+
+class QueryEmbeddings:
+    # Embeds a query as the vector stored under that text.
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+def make_metadatas(count):
+    metadatas = []
+    for row in range(count):
+        patch_number, patch_sort_key = PATCHES[row % len(PATCHES)]
+        metadata = {
+            'patch_number': patch_number,
+            'patch_sort_key': patch_sort_key,
+            'type': ('heroes', 'items', 'generic')[row % 3],
+            'title': TITLES[row % len(TITLES)],
+        }
+        if row % 5 == 0:
+            metadata['skill_name'] = 'Meat Hook'
+        metadatas.append(metadata)
+    return metadatas
+
+
+def matches(metadata, metadata_filter):
+    # Pinecone's filter semantics, one document at a time.
+    for key, condition in metadata_filter.items():
+        if key == '$and':
+            if not all(matches(metadata, sub_filter)
+                       for sub_filter in condition):
+                return False
+            continue
+        if key == '$or':
+            if not any(matches(metadata, sub_filter)
+                       for sub_filter in condition):
+                return False
+            continue
+
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        value = metadata.get(key)
+        for operator, operand in condition.items():
+            if operator == '$exists':
+                matched = (value is not None) == operand
+            elif operator == '$eq':
+                matched = value == operand
+            elif operator == '$ne':
+                matched = value != operand
+            elif operator == '$in':
+                matched = value in operand
+            elif operator == '$nin':
+                matched = value not in operand
+            elif value is None:
+                matched = False
+            elif operator == '$gt':
+                matched = value > operand
+            elif operator == '$gte':
+                matched = value >= operand
+            elif operator == '$lt':
+                matched = value < operand
+            else:
+                matched = value <= operand
+            if not matched:
+                return False
+    return True
+
+
+FILTERS = [
+    None,
+    {'type': 'heroes'},
+    {'type': {'$eq': 'items'}},
+    {'type': {'$ne': 'items'}},
+    {'patch_number': {'$in': ['7.37', '7.38c']}},
+    {'patch_number': {'$nin': ['7.37', '7.38c']}},
+    {'patch_number': {'$in': ['7.39']}},
+    {'patch_sort_key': {'$gte': 7037000}},
+    {'patch_sort_key': {'$lte': 7037000}},
+    {'patch_sort_key': {'$gt': 7037000, '$lt': 7038003}},
+    {'patch_sort_key': 7038003},
+    {'skill_name': 'Meat Hook'},
+    {'skill_name': {'$ne': 'Meat Hook'}},
+    {'skill_name': {'$exists': False}},
+    {'facet': 'Fresh Meat'},
+    {'facet': {'$nin': ['Fresh Meat']}},
+    {'$and': [{'type': 'heroes'}, {'patch_sort_key': {'$gte': 7038000}}]},
+    {'$or': [{'title': 'Axe'}, {'patch_number': '7.36'}]},
+    {'title': 'Pudge', 'patch_number': {'$in': ['7.36', '7.38']}},
+]
+
+
+@pytest.mark.parametrize('metadata_filter', FILTERS)
+def test_metadata_columns_follow_pinecone_filter_semantics(metadata_filter):
+    metadatas = make_metadatas(40)
+
+    mask = MetadataColumns(metadatas).mask(metadata_filter)
+
+    assert mask.tolist() == [
+        matches(metadata, metadata_filter or {}) for metadata in metadatas]
+
+
+def test_metadata_columns_follow_updates_and_removed_rows():
+    metadatas = make_metadatas(10)
+    columns = MetadataColumns(metadatas[:4])
+    columns.append(metadatas[4:])
+    metadatas[2] = {**metadatas[2], 'type': 'items', 'patch_sort_key': 1}
+    columns.set_row(2, metadatas[2])
+    keep = [0, 2, 3, 7, 9]
+    columns.keep(keep)
+
+    for metadata_filter in FILTERS:
+        assert columns.mask(metadata_filter).tolist() == [
+            matches(metadatas[row], metadata_filter or {}) for row in keep]
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(7)
+    return {f'note {row}': rng.normal(size=DIMENSIONS).tolist()
+            for row in range(60)}
+
+
+@pytest.fixture
+def vector_store(tmp_path, vectors):
+    vector_store = LocalVectorStore(QueryEmbeddings(vectors),
+                                    path=str(tmp_path / 'local_index'))
+    texts = list(vectors)
+    vector_store.add_texts(texts, make_metadatas(len(texts)),
+                           ids=[f'id-{row}' for row in range(len(texts))])
+    return vector_store
+
+
+def brute_force(vectors, query, k, metadata_filter=None):
+    # Document ids ranked by cosine similarity to the query vector.
+    metadatas = make_metadatas(len(vectors))
+    query = np.asarray(query) / np.linalg.norm(query)
+    scores = []
+    for row, vector in enumerate(vectors.values()):
+        if matches(metadatas[row], metadata_filter or {}):
+            vector = np.asarray(vector) / np.linalg.norm(vector)
+            scores.append((float(vector @ query), f'id-{row}'))
+    return sorted(scores, reverse=True)[:k]
+
+
+@pytest.mark.parametrize('metadata_filter', FILTERS)
+def test_top_k_matches_a_brute_force_cosine_ranking(vector_store, vectors,
+                                                    metadata_filter):
+    query = np.random.default_rng(11).normal(size=DIMENSIONS)
+
+    results = vector_store.similarity_search_with_score_by_vector(
+        query, k=7, filter=metadata_filter)
+
+    expected = brute_force(vectors, query, 7, metadata_filter)
+    assert [document.id for document, _ in results] == [
+        document_id for _, document_id in expected]
+    assert [score for _, score in results] == pytest.approx(
+        [score for score, _ in expected], abs=1e-5)
+
+
+def test_store_round_trips_through_flush_and_reopen(vector_store, vectors):
+    vector_store.add_texts(['note 3'], [{'type': 'generic', 'title': 'Map'}],
+                           ids=['id-3'])
+    vector_store.delete(['id-5', 'id-6'])
+    vector_store.flush()
+    assert not vector_store.dirty
+
+    reopened = LocalVectorStore(QueryEmbeddings(vectors),
+                                path=vector_store.path)
+
+    assert reopened.ids == vector_store.ids
+    assert reopened.texts == vector_store.texts
+    assert reopened.metadatas == vector_store.metadatas
+    assert np.allclose(reopened.matrix, vector_store.matrix)
+    assert reopened.get_by_ids(['id-3'])[0].metadata == {
+        'type': 'generic', 'title': 'Map'}
+    assert reopened.get_by_ids(['id-5', 'id-6']) == []
+    for metadata_filter in FILTERS:
+        assert [document.id for document in reopened.similarity_search(
+            'note 9', k=5, filter=metadata_filter)] == [
+            document.id for document in vector_store.similarity_search(
+                'note 9', k=5, filter=metadata_filter)]
+
+    reopened.add_texts(['note 5'], [{'type': 'heroes'}], ids=['id-5'])
+    reopened.flush()
+    assert LocalVectorStore(QueryEmbeddings(vectors), path=reopened.path) \
+        .similarity_search('note 5', k=1)[0].id == 'id-5'
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from dota2patch.fetcher.patch_fetcher import PatchFetcher
+from dota2patch.fetcher.response_cache import ResponseCache
+
+PATCH_NOTES = {'patch_number': '7.38', 'patch_timestamp': 1740000000,
+               'heroes': [], 'items': [], 'generic': []}
+ETAG = '"7.38-1"'
+
+
+class DatafeedHandler(BaseHTTPRequestHandler):
+    # Serves one patch with an ETag and answers If-None-Match with a 304.
+    def do_GET(self):
+        self.server.requests.append(
+            (self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            return
+
+        body = json.dumps(PATCH_NOTES).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def datafeed():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DatafeedHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(datafeed, cache_dir, offline=False):
+    return PatchFetcher(
+        datafeed_url=f'http://127.0.0.1:{datafeed.server_port}/datafeed',
+        response_cache=ResponseCache(cache_dir=str(cache_dir),
+                                     offline=offline))
+
+
+def test_patch_notes_are_revalidated_with_a_conditional_get(datafeed,
+                                                            tmp_path):
+    patch_fetcher = make_fetcher(datafeed, tmp_path)
+    url = patch_fetcher.patch_notes_url('7.38')
+
+    assert patch_fetcher.fetch_and_parse_json(url, ttl=0) == PATCH_NOTES
+    assert patch_fetcher.fetch_and_parse_json(url, ttl=0) == PATCH_NOTES
+
+    assert [etag for _, etag in datafeed.requests] == [None, ETAG]
+    entry = patch_fetcher.response_cache.get(url)
+    assert entry.meta['etag'] == ETAG
+
+
+def test_async_fetch_revalidates_and_serves_the_cached_body(datafeed,
+                                                            tmp_path):
+    patch_fetcher = make_fetcher(datafeed, tmp_path)
+
+    for _ in range(2):
+        *lookup_lists, patches = asyncio.run(
+            patch_fetcher.async_fetch_all(['7.38'], fetch_lookup_lists=False))
+        assert patches == {'7.38': PATCH_NOTES}
+
+    assert [etag for _, etag in datafeed.requests] == [None, ETAG]
+
+
+def test_response_cache_round_trips_compressed_bodies(datafeed, tmp_path):
+    patch_fetcher = make_fetcher(datafeed, tmp_path)
+    patch_fetcher.fetch_and_parse_json(patch_fetcher.patch_notes_url('7.38'))
+
+    cache_files = sorted(path.name for path in tmp_path.iterdir())
+    assert len(cache_files) == 2
+    assert cache_files[0].endswith('.json.zst')
+    assert cache_files[1].endswith('.meta.json')
+
+    offline_fetcher = make_fetcher(datafeed, tmp_path, offline=True)
+    url = offline_fetcher.patch_notes_url('7.38')
+    entry = offline_fetcher.response_cache.get(url)
+    assert json.loads(entry.body) == PATCH_NOTES
+    assert entry.meta['size'] == len(entry.body)
+    assert offline_fetcher.fetch_and_parse_json(url) == PATCH_NOTES
+    assert len(datafeed.requests) == 1
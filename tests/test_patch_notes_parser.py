@@ -0,0 +1,232 @@
+import copy
+
+import pytest
+
+from dota2patch.parser.lookup_tables import LookupTables
+from dota2patch.parser.patch_notes_parser import NameCache, PatchNotesParser
+
+ITEM_LIST = {'result': {'data': {'itemabilities': [
+    {'id': 116, 'name_loc': 'Black King Bar'},
+    {'id': 1602, 'name_loc': 'Dormant Curio'},
+]}}}
+HERO_LIST = {'result': {'data': {'heroes': [
+    {'id': 2, 'name_loc': 'Axe'},
+    {'id': 14, 'name_loc': 'Pudge'},
+]}}}
+ABILITY_LIST = {'result': {'data': {'itemabilities': [
+    {'id': 5003, 'name_loc': "Berserker's Call"},
+    {'id': 5075, 'name_loc': 'Meat Hook'},
+    {'id': 5076, 'name_loc': 'Rot'},
+]}}}
+
+PATCH_NOTES = {
+    'patch_number': '7.38', 'patch_name': '7.38',
+    'patch_timestamp': 1740000000,
+    'general_notes': [
+        {'title': 'Map', 'generic': [
+            {'note': 'Tormentors spawn at 15:00', 'info': 'from 20:00'},
+            {'note': 'Wisdom runes give more experience'}]},
+        {'generic': [{'note': 'Courier speed increased'}]},
+    ],
+    'items': [
+        {'ability_id': 116, 'ability_notes': [
+            {'note': 'Cost increased to 4150', 'info': 'was 4050'},
+            {'note': 'Duration reduced'}]},
+        {'ability_id': -1, 'ability_notes': [{'note': 'Skipped'}]},
+    ],
+    'neutral_items': [
+        {'ability_id': 1602, 'ability_notes': [{'note': 'New item'}]},
+    ],
+    'heroes': [
+        {'hero_id': 14,
+         'hero_notes': [{'note': 'Base armor increased by 1'}],
+         'talent_notes': [{'note': 'Level 10 talent changed', 'info': '+1'}],
+         'abilities': [
+             {'ability_id': 5075, 'ability_notes': [
+                 {'note': 'Cast point reduced to 0.25', 'info': 'was 0.3'},
+                 {'note': 'Damage increased'}]},
+             {'ability_id': 9999, 'ability_notes': [{'note': 'Renamed'}]},
+         ],
+         'subsections': [
+             {'facet': 1, 'title': 'Fresh Meat', 'general_notes': [
+                 {'note': 'Now also heals'}]},
+             {'facet': 2, 'title': 'Flayers Hook', 'abilities': [
+                 {'ability_id': 5076, 'ability_notes': [
+                     {'note': ' Damage increased', 'info': '+10'}]}]},
+             {'title': 'Not a facet', 'general_notes': [
+                 {'note': 'Ignored'}]},
+         ]},
+        {'hero_id': -1, 'abilities': []},
+    ],
+}
+
+# What the parsers before PatchNotesParser produced for PATCH_NOTES:
+# (type, subtype, title, skill_name, changes) per entry.
+EXPECTED_ENTRIES = [
+    ('generic', None, 'Map', None,
+     'Tormentors spawn at 15:00. Wisdom runes give more experience.'),
+    ('generic', None, 'Generic Changes', None, 'Courier speed increased.'),
+    ('items', 'hero_items', 'Black King Bar', None,
+     'Cost increased to 4150(was 4050). Duration reduced.'),
+    ('items', 'neutral_items', 'Dormant Curio', None, 'New item.'),
+    ('heroes', 'abilities', 'Pudge', 'Meat Hook',
+     'Cast point reduced to 0.25(was 0.3). Damage increased.'),
+    ('heroes', 'abilities', 'Pudge', '', 'Renamed.'),
+    ('heroes', 'facets', 'Pudge', 'Fresh Meat', 'Now also heals.'),
+    ('heroes', 'facets', 'Pudge', 'Flayers Hook',
+     'Rot: Damage increased(+10)'),
+]
+# (entity_type, entity_subtype, entity_id, entity_name, ability_id,
+#  ability_name, facet, position, note, info) per patch diff store row.
+EXPECTED_ROWS = [
+    ('generic', 'generic', None, 'Map', None, None, None,
+     0, 'Tormentors spawn at 15:00', 'from 20:00'),
+    ('generic', 'generic', None, 'Map', None, None, None,
+     1, 'Wisdom runes give more experience', None),
+    ('generic', 'generic', None, 'Generic Changes', None, None, None,
+     0, 'Courier speed increased', None),
+    ('items', 'hero_items', 116, 'Black King Bar', None, None, None,
+     0, 'Cost increased to 4150', 'was 4050'),
+    ('items', 'hero_items', 116, 'Black King Bar', None, None, None,
+     1, 'Duration reduced', None),
+    ('items', 'neutral_items', 1602, 'Dormant Curio', None, None, None,
+     0, 'New item', None),
+    ('heroes', 'hero_notes', 14, 'Pudge', None, None, None,
+     0, 'Base armor increased by 1', None),
+    ('heroes', 'talents', 14, 'Pudge', None, None, None,
+     0, 'Level 10 talent changed', '+1'),
+    ('heroes', 'abilities', 14, 'Pudge', 5075, 'Meat Hook', None,
+     0, 'Cast point reduced to 0.25', 'was 0.3'),
+    ('heroes', 'abilities', 14, 'Pudge', 5075, 'Meat Hook', None,
+     1, 'Damage increased', None),
+    ('heroes', 'abilities', 14, 'Pudge', 9999, '', None,
+     0, 'Renamed', None),
+    ('heroes', 'facets', 14, 'Pudge', None, None, 'Fresh Meat',
+     0, 'Now also heals', None),
+    ('heroes', 'facets', 14, 'Pudge', 5076, 'Rot', 'Flayers Hook',
+     0, ' Damage increased', '+10'),
+]
+ROW_FIELDS = ('entity_type', 'entity_subtype', 'entity_id', 'entity_name',
+              'ability_id', 'ability_name', 'facet', 'position', 'note',
+              'info')
+
+
+class CountingTable:
+    # Counts the lookups that reach the memory-mapped table.
+    def __init__(self, lookup_table):
+        self.lookup_table = lookup_table
+        self.lookups = []
+
+    def get(self, entity_id, default=None):
+        self.lookups.append(entity_id)
+        return self.lookup_table.get(entity_id, default)
+
+
+@pytest.fixture
+def lookup_tables(tmp_path):
+    return LookupTables.build(str(tmp_path / 'lookup_tables.bin'),
+                              ITEM_LIST, HERO_LIST, ABILITY_LIST)
+
+
+def parse(parser, patch_data):
+    rows = []
+    entries = [(entry.type, entry.subtype, entry.title, entry.skill_name,
+                entry.changes)
+               for entry in parser.parse(patch_data, rows)]
+    return entries, [tuple(row[field] for field in ROW_FIELDS)
+                     for row in rows]
+
+
+def test_parser_produces_the_baseline_entries_and_rows(lookup_tables):
+    parser = PatchNotesParser(lookup_tables)
+
+    entries, rows = parse(parser, PATCH_NOTES)
+
+    assert entries == EXPECTED_ENTRIES
+    assert rows == EXPECTED_ROWS
+    patch = next(iter(parser.parse(PATCH_NOTES))).patch
+    assert (patch.patch_number, patch.patch_name, patch.patch_timestamp) \
+        == ('7.38', '7.38', 1740000000)
+
+
+def test_parser_without_rows_yields_the_same_entries(lookup_tables):
+    entries = [(entry.type, entry.subtype, entry.title, entry.skill_name,
+                entry.changes)
+               for entry in PatchNotesParser(lookup_tables).parse(
+                   PATCH_NOTES)]
+
+    assert entries == EXPECTED_ENTRIES
+
+
+def test_unknown_ids_are_named_with_an_empty_string(lookup_tables):
+    patch_data = copy.deepcopy(PATCH_NOTES)
+    patch_data['items'][0]['ability_id'] = 404
+    patch_data['heroes'][0]['hero_id'] = 405
+
+    entries, rows = parse(PatchNotesParser(lookup_tables), patch_data)
+
+    assert entries[2][2] == ''
+    assert {entry[2] for entry in entries[4:]} == {''}
+    assert rows[3][2:4] == (404, '')
+    assert {row[2:4] for row in rows[6:]} == {(405, '')}
+
+
+def remove_patch_name(patch_data):
+    del patch_data['patch_name']
+
+
+def make_hero_id_a_string(patch_data):
+    patch_data['heroes'][0]['hero_id'] = '14'
+
+
+def remove_an_item_note(patch_data):
+    del patch_data['items'][0]['ability_notes'][1]['note']
+
+
+def add_a_bare_talent_note(patch_data):
+    patch_data['heroes'][0]['talent_notes'].append('Level 15 talent')
+
+
+def make_facet_notes_a_dict(patch_data):
+    patch_data['heroes'][0]['subsections'][1]['abilities'][0][
+        'ability_notes'] = {}
+
+
+def make_heroes_a_dict(patch_data):
+    patch_data['heroes'] = {}
+
+
+@pytest.mark.parametrize('mutate, message', [
+    (remove_patch_name, 'patch_name is missing'),
+    (make_hero_id_a_string, 'heroes[0].hero_id is a str, expected int'),
+    (remove_an_item_note, "items[0].ability_notes[1] has no 'note' text"),
+    (add_a_bare_talent_note, "heroes[0].talent_notes[1] has no 'note' text"),
+    (make_facet_notes_a_dict,
+     'heroes[0].subsections[1].abilities[0].ability_notes is a dict, '
+     'expected list'),
+    (make_heroes_a_dict, 'heroes is a dict, expected list'),
+])
+def test_schema_errors_name_the_patch_and_field(lookup_tables, mutate,
+                                                message):
+    patch_data = copy.deepcopy(PATCH_NOTES)
+    mutate(patch_data)
+
+    with pytest.raises(RuntimeError) as error:
+        list(PatchNotesParser(lookup_tables).parse(patch_data, []))
+
+    assert str(error.value) == (
+        f"Patch notes 7.38 do not match the datafeed schema: {message}.")
+
+
+def test_name_cache_looks_each_id_up_once(lookup_tables):
+    parser = PatchNotesParser(lookup_tables)
+    abilities = CountingTable(lookup_tables.abilities())
+    parser.abilities_mapping = NameCache(abilities)
+
+    for _ in range(3):
+        entries, _ = parse(parser, PATCH_NOTES)
+        assert entries == EXPECTED_ENTRIES
+
+    assert sorted(abilities.lookups) == [5075, 5076, 9999]
+    assert parser.abilities_mapping == {
+        5075: 'Meat Hook', 5076: 'Rot', 9999: ''}